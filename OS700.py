@@ -5,52 +5,64 @@ import logging
 from datetime import datetime
 import streamlit as st
 import pandas as pd
-import plotly.express as px
 from streamlit_option_menu import option_menu
-from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
 from zoneinfo import ZoneInfo
 
 # Importações dos módulos personalizados
 from database import (
-    create_tables,
-    initialize_ubs_setores,
-    check_or_create_admin_user,
+    engine,
+    sessao_da_pagina,
+    get_pool_stats,
     UBS,
     Setor,
 )
+from diagnostico import (
+    instalar_instrumentacao,
+    medir_pagina,
+    medir_etapa,
+    get_buffer_diagnostico,
+    DIAGNOSTICO_ATIVO,
+)
 from autenticacao import (
-    authenticate,
+    autenticar_usuario,
+    emitir_token_sessao,
+    validar_token_sessao,
+    revogar_token_sessao,
+    ServicoSenhasOcupado,
     add_user,
-    is_admin,
     list_users,
     change_password,
 )
 from chamados import (
     add_chamado,
-    list_chamados,
-    list_chamados_em_aberto,
+    dataframe_chamados_em_aberto,
+    COLUNAS_PAINEL_CHAMADOS,
     finalizar_chamado,
     get_chamado_by_protocolo,
-    show_average_time,
-    get_monthly_technical_data,
-    generate_monthly_report,
-    calcular_tempo_decorrido,
+    gerar_relatorio_mensal_em_cache,
+    preparar_datas_painel,
+    preparar_tempo_painel,
     formatar_tempo,
     buscar_no_inventario_por_patrimonio,
+    buscar_chamados_paginados,
+    contar_chamados_por,
+    tempo_medio_atendimento,
+    list_meses_chamados,
 )
 from inventario import (
-    get_machines_from_inventory,
     show_inventory_list,
+    show_inventory_import,
     add_machine_to_inventory,
     show_maintenance_history,
     add_maintenance_history,
     update_inventory_status,
     delete_inventory_item,
     edit_inventory_item,
-    create_inventory_report,
+    gerar_relatorio_inventario_em_cache,
 )
-from ubs import initialize_ubs, manage_ubs, get_ubs_list
-from setores import initialize_setores, manage_setores, get_setores_list
+from ubs import manage_ubs, get_ubs_list
+from setores import manage_setores, get_setores_list
+from migracoes import inicializar_banco
 
 # Definir o fuso horário local
 local_tz = ZoneInfo('America/Sao_Paulo')
@@ -63,6 +75,25 @@ if 'username' not in st.session_state:
 if 'is_admin' not in st.session_state:
     st.session_state['is_admin'] = False
 
+# Revalidar a sessão a cada rerun pelo token assinado (sem consultar o banco): login, papel e
+# validade vêm do token; token expirado ou revogado encerra a sessão
+def verificar_sessao():
+    if not st.session_state.get('logged_in'):
+        return
+    dados = validar_token_sessao(st.session_state.get('token_sessao'))
+    if dados is None:
+        st.session_state['logged_in'] = False
+        st.session_state['username'] = ''
+        st.session_state['is_admin'] = False
+        st.session_state.pop('token_sessao', None)
+        st.warning('Sua sessão expirou. Faça login novamente.')
+        logging.info("Sessão encerrada por token expirado ou revogado.")
+        return
+    st.session_state['username'] = dados['username']
+    st.session_state['is_admin'] = dados['role'] == 'admin'
+
+verificar_sessao()
+
 # Configuração da página
 st.set_page_config(
     page_title="Gestão de Parque de Informática - UBS",
@@ -80,18 +111,17 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
-# Inicializar o banco de dados e tabelas
+# Inicializar o banco de dados e tabelas: o Streamlit reexecuta o script a cada interação, mas
+# inicializar_banco só trabalha na primeira vez do processo (em caso de erro, tenta de novo)
 try:
-    create_tables()
-    initialize_ubs_setores()
-    initialize_ubs()
-    initialize_setores()
-    check_or_create_admin_user()
-    logging.info("Banco de dados inicializado com sucesso.")
+    inicializar_banco()
 except Exception as e:
     logging.error(f"Erro ao inicializar o banco de dados: {e}")
     st.error("Erro ao inicializar o banco de dados. Verifique os logs para mais detalhes.")
 
+# Medição das consultas SQL para o diagnóstico de desempenho (instalada uma vez por processo)
+instalar_instrumentacao(engine)
+
 # Carregar o logotipo
 def carregar_logotipo():
     logo_path = os.getenv('LOGO_PATH', 'infocustec.png')
@@ -124,11 +154,13 @@ def login_form():
             return
 
         try:
-            if authenticate(username, password):
+            usuario = autenticar_usuario(username, password)
+            if usuario:
                 st.success(f'Login bem-sucedido! Bem-vindo, {username}.')
+                st.session_state['token_sessao'] = emitir_token_sessao(usuario['username'], usuario['role'])
                 st.session_state['logged_in'] = True
-                st.session_state['username'] = username
-                st.session_state['is_admin'] = is_admin(username)
+                st.session_state['username'] = usuario['username']
+                st.session_state['is_admin'] = usuario['role'] == 'admin'
                 logging.info(f"Usuário '{username}' fez login.")
                 if st.session_state['is_admin']:
                     st.info('Você está logado como administrador.')
@@ -138,12 +170,17 @@ def login_form():
             else:
                 st.error('Nome de usuário ou senha incorretos.')
                 logging.warning(f"Falha no login para o usuário '{username}'.")
+        except ServicoSenhasOcupado:
+            st.warning('Muitos logins simultâneos no momento. Aguarde alguns segundos e tente novamente.')
+            logging.warning(f"Login do usuário '{username}' recusado: fila de verificação de senhas cheia.")
         except Exception as e:
             st.error('Ocorreu um erro durante a autenticação. Verifique os logs para mais detalhes.')
             logging.error(f"Erro durante a autenticação do usuário '{username}': {e}")
 
 # Função de logout
 def logout():
+    if st.session_state.get('token_sessao'):
+        revogar_token_sessao(st.session_state.pop('token_sessao'))
     st.session_state['logged_in'] = False
     st.session_state['username'] = ''
     st.session_state['is_admin'] = False
@@ -236,7 +273,7 @@ def administracao():
 
     admin_option = st.selectbox(
         'Selecione uma opção:',
-        ['Cadastro de Usuário', 'Cadastro de Máquina', 'Lista de Inventário', 'Lista de Usuários', 'Gerenciar UBSs', 'Gerenciar Setores']
+        ['Cadastro de Usuário', 'Cadastro de Máquina', 'Importar Inventário', 'Lista de Inventário', 'Lista de Usuários', 'Gerenciar UBSs', 'Gerenciar Setores']
     )
 
     if admin_option == 'Cadastro de Máquina':
@@ -293,6 +330,9 @@ def administracao():
                     st.error("Preencha todos os campos obrigatórios!")
                     logging.warning("Campos obrigatórios não preenchidos no cadastro de máquina.")
 
+    elif admin_option == 'Importar Inventário':
+        show_inventory_import()
+
     elif admin_option == 'Lista de Inventário':
         st.subheader('Lista de Inventário')
         try:
@@ -385,24 +425,18 @@ def painel_relatorios():
     st.subheader('Relatórios')
     report_option = st.selectbox(
         'Selecione um tipo de relatório:',
-        ['Chamados Técnicos', 'Inventário']
+        ['Chamados Técnicos', 'Inventário', 'Exportação de Dados']
     )
 
     if report_option == 'Chamados Técnicos':
         st.subheader('Relatório de Chamados Técnicos')
         try:
-            df, months_list = get_monthly_technical_data()
-
-            if not isinstance(df, pd.DataFrame):
-                st.error("Erro: O retorno de dados não é um DataFrame.")
-                logging.error("Esperava-se um DataFrame, mas o retorno foi de outro tipo.")
-                return
-
+            months_list = list_meses_chamados()
             selected_month = st.selectbox('Selecione o Mês', months_list)
 
             if st.button('Gerar Relatório'):
                 try:
-                    pdf_output = generate_monthly_report(df, selected_month, logo_path=os.getenv('LOGO_PATH', 'infocustec.png'))
+                    pdf_output = gerar_relatorio_mensal_em_cache(selected_month, logo_path=os.getenv('LOGO_PATH', 'infocustec.png'))
 
                     if pdf_output:
                         st.download_button(
@@ -427,9 +461,7 @@ def painel_relatorios():
     elif report_option == 'Inventário':
         st.subheader('Relatório de Inventário')
         try:
-            inventory_items = get_machines_from_inventory()
-
-            pdf_output = create_inventory_report(inventory_items, logo_path=os.getenv('LOGO_PATH', 'infocustec.png'))
+            pdf_output = gerar_relatorio_inventario_em_cache(logo_path=os.getenv('LOGO_PATH', 'infocustec.png'))
 
             if pdf_output:
                 st.download_button(
@@ -446,9 +478,51 @@ def painel_relatorios():
             st.error(f"Erro ao gerar relatório de inventário: {e}")
             logging.error(f"Erro ao gerar relatório de inventário: {e}")
 
+    elif report_option == 'Exportação de Dados':
+        from exportacao import (
+            TABELAS_EXPORTACAO, FORMATOS_EXPORTACAO, EXPORTACAO_LIMITE_DOWNLOAD, contar_linhas, exportar_para_bytes
+        )
+
+        st.subheader('Exportação de Dados')
+        tabela = st.selectbox('Tabela', list(TABELAS_EXPORTACAO))
+        formato = st.selectbox('Formato', list(FORMATOS_EXPORTACAO))
+        mime, extensao = FORMATOS_EXPORTACAO[formato]
+
+        # O download fica todo em memória no servidor; tabelas grandes são exportadas pelo manage.py
+        try:
+            total_linhas = contar_linhas(tabela)
+        except Exception as e:
+            st.error(f"Erro ao preparar exportação: {e}")
+            logging.error(f"Erro ao contar linhas de '{tabela}' para exportação: {e}")
+            return
+
+        if total_linhas > EXPORTACAO_LIMITE_DOWNLOAD:
+            st.info(
+                f"A tabela '{tabela}' tem {total_linhas} linhas, acima do limite de {EXPORTACAO_LIMITE_DOWNLOAD} "
+                f"para download pela interface. Exporte pelo servidor com: "
+                f"python manage.py exportar {tabela} --formato {formato}"
+            )
+            return
+
+        # A exportação só é gerada quando o botão de download é clicado, fora do contexto da
+        # sessão do Streamlit: o usuário é lido antes
+        usuario = st.session_state.get('username')
+
+        def gerar_exportacao():
+            logging.info(f"Exportação de '{tabela}' ({formato}) solicitada por {usuario}.")
+            return exportar_para_bytes(tabela, formato)
+
+        st.download_button(
+            label=f"Download {tabela}{extensao} ({total_linhas} linhas)",
+            data=gerar_exportacao,
+            file_name=f"{tabela}{extensao}",
+            mime=mime
+        )
+
 def painel_chamados_tecnicos():
+    # Bibliotecas de grade e gráficos carregadas só quando o painel é aberto
+    import plotly.express as px
     from st_aggrid import AgGrid, GridOptionsBuilder, GridUpdateMode
-    from zoneinfo import ZoneInfo
 
     # Verificação de autenticação e permissão
     if not st.session_state.get('logged_in') or not st.session_state.get('is_admin'):
@@ -458,78 +532,18 @@ def painel_chamados_tecnicos():
 
     st.subheader('Painel de Chamados Técnicos')
 
-    try:
-        chamados_abertos = list_chamados_em_aberto()
-        chamados = list_chamados()
-        logging.info("Lista de chamados em aberto recuperada.")
-        logging.info("Lista de todos os chamados recuperada.")
-    except Exception as e:
-        st.error(f"Erro ao carregar chamados: {e}")
-        logging.error(f"Erro ao carregar chamados: {e}")
-        return
+    # Chamados em aberto já como DataFrame tipado (só as colunas do painel, sem objetos do ORM)
+    df_abertos = dataframe_chamados_em_aberto()
 
-    def chamado_to_dict(chamado):
-        return {
-            'ID': chamado.id,
-            'Usuário': chamado.username,
-            'UBS': chamado.ubs,
-            'Setor': chamado.setor,
-            'Tipo de Defeito': chamado.tipo_defeito,
-            'Problema': chamado.problema,
-            'Hora Abertura': chamado.hora_abertura,
-            'Solução': chamado.solucao,
-            'Hora Fechamento': chamado.hora_fechamento,
-            'Protocolo': chamado.protocolo,
-            'Patrimônio': chamado.patrimonio,
-            'Machine': chamado.machine
-        }
-
-    def criar_dataframe_chamados(chamados_lista):
-        if chamados_lista:
-            try:
-                df = pd.DataFrame([chamado_to_dict(chamado) for chamado in chamados_lista])
-                return df
-            except Exception as e:
-                st.error(f"Erro ao criar DataFrame: {e}")
-                logging.error(f"Erro ao criar DataFrame: {e}")
-                return pd.DataFrame(columns=[
-                    'ID', 'Usuário', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema',
-                    'Hora Abertura', 'Solução', 'Hora Fechamento',
-                    'Protocolo', 'Patrimônio', 'Machine'
-                ])
-        else:
-            return pd.DataFrame(columns=[
-                'ID', 'Usuário', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema',
-                'Hora Abertura', 'Solução', 'Hora Fechamento',
-                'Protocolo', 'Patrimônio', 'Machine'
-            ])
-
-    df_chamados = criar_dataframe_chamados(chamados)
-    df_abertos = criar_dataframe_chamados(chamados_abertos)
-
-    # Converter colunas de datas para o tipo datetime com UTC e depois para fuso horário local
-    local_tz = ZoneInfo('America/Sao_Paulo')
-
-    for df in [df_chamados, df_abertos]:
-        df['Hora Abertura'] = pd.to_datetime(df['Hora Abertura'], errors='coerce', utc=True)
-        df['Hora Fechamento'] = pd.to_datetime(df['Hora Fechamento'], errors='coerce', utc=True)
-        df['Hora Abertura'] = df['Hora Abertura'].dt.tz_convert(local_tz)
-        df['Hora Fechamento'] = df['Hora Fechamento'].dt.tz_convert(local_tz)
-        df['Hora Abertura Formatada'] = df['Hora Abertura'].dt.strftime('%d/%m/%Y - %H:%M:%S')
-        df['Hora Fechamento Formatada'] = df['Hora Fechamento'].dt.strftime('%d/%m/%Y - %H:%M:%S')
-
-    # Calcular o tempo decorrido usando as colunas datetime originais
-    df_chamados['Tempo Decorrido Segundos'] = df_chamados.apply(
-        lambda row: calcular_tempo_decorrido(row['Hora Abertura'], row['Hora Fechamento']), axis=1
-    )
-    df_chamados['Tempo Decorrido'] = df_chamados['Tempo Decorrido Segundos'].apply(formatar_tempo)
+    # Converter colunas de datas de UTC para o fuso horário local
+    with medir_etapa('Preparação dos dados'):
+        preparar_datas_painel(df_abertos)
 
     # Definir colunas para exibição
     display_columns = ['ID', 'Usuário', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema',
                        'Hora Abertura Formatada', 'Solução', 'Hora Fechamento Formatada',
                        'Tempo Decorrido', 'Protocolo', 'Patrimônio', 'Machine']
 
-    df_chamados_exibir = df_chamados[display_columns]
     df_abertos_exibir = df_abertos[['ID', 'Usuário', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema',
                                     'Hora Abertura Formatada', 'Protocolo', 'Patrimônio', 'Machine']]
 
@@ -544,16 +558,17 @@ def painel_chamados_tecnicos():
             gb.configure_selection('single', use_checkbox=False)  # Seleção única sem checkbox
             gridOptions = gb.build()
 
-            grid_response = AgGrid(
-                df_abertos_exibir,
-                gridOptions=gridOptions,
-                update_mode=GridUpdateMode.SELECTION_CHANGED,
-                fit_columns_on_grid_load=True,
-                height=350,
-                reload_data=True,
-                key='aggrid_abertos',
-                return_mode='AS_DICT'  # Garante que selected_rows seja uma lista de dicts
-            )
+            with medir_etapa('AgGrid'):
+                grid_response = AgGrid(
+                    df_abertos_exibir,
+                    gridOptions=gridOptions,
+                    update_mode=GridUpdateMode.SELECTION_CHANGED,
+                    fit_columns_on_grid_load=True,
+                    height=350,
+                    reload_data=True,
+                    key='aggrid_abertos',
+                    return_mode='AS_DICT'  # Garante que selected_rows seja uma lista de dicts
+                )
 
             selected = grid_response.get('selected_rows', [])
 
@@ -606,35 +621,75 @@ def painel_chamados_tecnicos():
     with tab2:
         st.subheader('Painel de Chamados')
 
-        status_options = ['Todos', 'Em Aberto', 'Finalizado']
-        status = st.selectbox('Filtrar por Status', status_options)
-
-        ubs_list = ['Todas'] + df_chamados['UBS'].dropna().unique().tolist()
-        ubs_selecionada = st.selectbox('Filtrar por UBS', ubs_list)
-
-        df_filtrado = df_chamados.copy()
+        col_filtro1, col_filtro2, col_filtro3 = st.columns(3)
+        with col_filtro1:
+            status_options = ['Todos', 'Em Aberto', 'Finalizado']
+            status = st.selectbox('Filtrar por Status', status_options)
+            patrimonio_filtro = st.text_input('Filtrar por Patrimônio')
+        with col_filtro2:
+            ubs_list = ['Todas'] + get_ubs_list()
+            ubs_selecionada = st.selectbox('Filtrar por UBS', ubs_list)
+            data_inicio = st.date_input('Abertos a partir de', value=None, format='DD/MM/YYYY')
+        with col_filtro3:
+            setores_list = ['Todos'] + get_setores_list()
+            setor_selecionado = st.selectbox('Filtrar por Setor', setores_list)
+            data_fim = st.date_input('Abertos até', value=None, format='DD/MM/YYYY')
+        tamanho_pagina = st.selectbox('Chamados por página', [25, 50, 100], index=1)
+
+        filtros = {
+            'status': status if status != 'Todos' else None,
+            'ubs': ubs_selecionada if ubs_selecionada != 'Todas' else None,
+            'setor': setor_selecionado if setor_selecionado != 'Todos' else None,
+            'data_inicio': data_inicio,
+            'data_fim': data_fim,
+            'patrimonio': patrimonio_filtro.strip() or None,
+        }
 
-        if status != 'Todos':
-            if status == 'Em Aberto':
-                df_filtrado = df_filtrado[df_filtrado['Hora Fechamento'].isnull()]
-            else:
-                df_filtrado = df_filtrado[df_filtrado['Hora Fechamento'].notnull()]
+        # Pilha de cursores das páginas visitadas; reinicia sempre que os filtros mudam
+        chave_filtros = (tuple(filtros.items()), tamanho_pagina)
+        if st.session_state.get('painel_chave_filtros') != chave_filtros:
+            st.session_state['painel_chave_filtros'] = chave_filtros
+            st.session_state['painel_cursores'] = [None]
+        cursores = st.session_state['painel_cursores']
 
-        if ubs_selecionada != 'Todas':
-            df_filtrado = df_filtrado[df_filtrado['UBS'] == ubs_selecionada]
+        pagina = buscar_chamados_paginados(
+            cursor=cursores[-1], tamanho_pagina=tamanho_pagina, colunas=COLUNAS_PAINEL_CHAMADOS, **filtros
+        )
+        df_filtrado = pagina['chamados']
 
         if not df_filtrado.empty:
+            with medir_etapa('Preparação dos dados'):
+                preparar_datas_painel(df_filtrado)
+                preparar_tempo_painel(df_filtrado)
+
             gb = GridOptionsBuilder.from_dataframe(df_filtrado[display_columns])
-            gb.configure_pagination()
             gb.configure_default_column(groupable=True, value=True, enableRowGroup=True, aggFunc='sum', editable=False)
             gridOptions = gb.build()
 
-            AgGrid(
-                df_filtrado[display_columns],
-                gridOptions=gridOptions,
-                enable_enterprise_modules=False,
-                key='aggrid_painel_chamados',
-                return_mode='AS_DICT'  # Garante consistência na saída
+            with medir_etapa('AgGrid'):
+                AgGrid(
+                    df_filtrado[display_columns],
+                    gridOptions=gridOptions,
+                    enable_enterprise_modules=False,
+                    key='aggrid_painel_chamados',
+                    return_mode='AS_DICT'  # Garante consistência na saída
+                )
+
+            total_paginas = max(1, -(-pagina['total'] // tamanho_pagina))
+            col_anterior, col_info, col_proxima = st.columns([1, 2, 1])
+            col_anterior.button(
+                'Anterior',
+                disabled=len(cursores) == 1,
+                on_click=cursores.pop,
+                key='painel_pagina_anterior'
+            )
+            col_info.write(f"Página {len(cursores)} de {total_paginas} ({pagina['total']} chamados)")
+            col_proxima.button(
+                'Próxima',
+                disabled=pagina['proximo_cursor'] is None,
+                on_click=cursores.append,
+                args=(pagina['proximo_cursor'],),
+                key='painel_proxima_pagina'
             )
         else:
             st.info("Nenhum chamado corresponde aos filtros selecionados.")
@@ -642,43 +697,38 @@ def painel_chamados_tecnicos():
     with tab3:
         st.subheader('Análise de Chamados')
 
+        col_analise1, col_analise2 = st.columns(2)
+        analise_inicio = col_analise1.date_input('Período: de', value=None, format='DD/MM/YYYY', key='analise_inicio')
+        analise_fim = col_analise2.date_input('Período: até', value=None, format='DD/MM/YYYY', key='analise_fim')
+
         st.subheader('Tempo Médio de Atendimento')
-        chamados_finalizados = df_chamados[df_chamados['Hora Fechamento'].notnull()]
         try:
-            show_average_time(chamados_finalizados)
+            media_tempo_segundos = tempo_medio_atendimento(analise_inicio, analise_fim)
+            if media_tempo_segundos:
+                st.write(f'Tempo médio de atendimento: {formatar_tempo(media_tempo_segundos)}')
+            else:
+                st.write('Nenhum chamado finalizado para calcular o tempo médio.')
         except Exception as e:
             st.error(f"Erro ao exibir tempo médio de atendimento: {e}")
             logging.error(f"Erro ao exibir tempo médio de atendimento: {e}")
 
-        # Gráfico de Quantidade de Chamados por UBS
-        fig = px.bar(
-            df_chamados,
-            x='UBS',
-            title='Quantidade de Chamados por UBS',
-            labels={'UBS': 'UBS', 'count': 'Quantidade'},
-            color='UBS'
-        )
-        st.plotly_chart(fig)
-
-        # Gráfico de Quantidade de Chamados por Tipo de Defeito
-        fig_defeitos = px.bar(
-            df_chamados,
-            x='Tipo de Defeito',
-            title='Quantidade de Chamados por Tipo de Defeito',
-            labels={'Tipo de Defeito': 'Tipo de Defeito', 'count': 'Quantidade'},
-            color='Tipo de Defeito'
-        )
-        st.plotly_chart(fig_defeitos)
-
-        # Gráfico de Quantidade de Chamados por Setor
-        fig_setor = px.bar(
-            df_chamados,
-            x='Setor',
-            title='Quantidade de Chamados por Setor',
-            labels={'Setor': 'Setor', 'count': 'Quantidade'},
-            color='Setor'
-        )
-        st.plotly_chart(fig_setor)
+        # Gráficos montados a partir das contagens agregadas no banco (GROUP BY)
+        for coluna, titulo in [
+            ('UBS', 'Quantidade de Chamados por UBS'),
+            ('Tipo de Defeito', 'Quantidade de Chamados por Tipo de Defeito'),
+            ('Setor', 'Quantidade de Chamados por Setor'),
+        ]:
+            df_agregado = contar_chamados_por(coluna, analise_inicio, analise_fim)
+            with medir_etapa('Plotly'):
+                fig = px.bar(
+                    df_agregado,
+                    x=coluna,
+                    y='Quantidade',
+                    title=titulo,
+                    labels={coluna: coluna, 'Quantidade': 'Quantidade'},
+                    color=coluna
+                )
+                st.plotly_chart(fig)
 
     if st.button('Buscar'):
         if not protocolo:
@@ -710,6 +760,104 @@ def painel_chamados_tecnicos():
             st.error(f"Erro ao buscar chamado: {e}")
             logging.error(f"Erro ao buscar chamado pelo protocolo {protocolo}: {e}")
 
+# Função para buscar chamados pelo texto do problema ou da solução
+def busca_chamados():
+    if not st.session_state.get('logged_in') or not st.session_state.get('is_admin'):
+        st.warning('Você precisa estar logado como administrador para acessar esta área.')
+        logging.warning("Usuário sem privilégios tentou acessar a busca de chamados.")
+        return
+
+    from busca_chamados import buscar_chamados_texto
+
+    st.subheader('Buscar Chamados')
+    texto = st.text_input('Palavras do problema ou da solução')
+    col1, col2, col3 = st.columns([2, 2, 1])
+    ubs = col1.selectbox('UBS', ['Todas'] + get_ubs_list())
+    setor = col2.selectbox('Setor', ['Todos'] + get_setores_list())
+    pagina = col3.number_input('Página', min_value=1, value=1, step=1)
+
+    if not texto:
+        return
+
+    try:
+        resultado = buscar_chamados_texto(
+            texto,
+            ubs=None if ubs == 'Todas' else ubs,
+            setor=None if setor == 'Todos' else setor,
+            pagina=int(pagina),
+        )
+    except Exception as e:
+        st.error(f"Erro ao buscar chamados: {e}")
+        logging.error(f"Erro na busca textual de chamados ('{texto}'): {e}")
+        return
+
+    if not resultado['total']:
+        st.info('Nenhum chamado encontrado.')
+        return
+
+    st.write(f"{resultado['total']} chamados encontrados (página {resultado['pagina']} de {resultado['total_paginas']}).")
+    df = pd.DataFrame(resultado['resultados']).rename(columns={
+        'protocolo': 'Protocolo', 'ubs': 'UBS', 'setor': 'Setor', 'tipo_defeito': 'Tipo de Defeito',
+        'problema': 'Problema', 'solucao': 'Solução', 'hora_abertura': 'Hora Abertura', 'hora_fechamento': 'Hora Fechamento',
+    })
+    st.dataframe(df.drop(columns=['id', 'relevancia']), hide_index=True)
+
+# Página de diagnóstico: medições dos últimos reruns das páginas (tempo total, consultas SQL e etapas)
+def diagnostico_desempenho():
+    if not st.session_state.get('logged_in') or not st.session_state.get('is_admin'):
+        st.warning('Você precisa estar logado como administrador para acessar esta área.')
+        logging.warning("Usuário sem privilégios tentou acessar o diagnóstico de desempenho.")
+        return
+
+    st.subheader('Diagnóstico de Desempenho')
+    buffer = get_buffer_diagnostico()
+    if st.button('Limpar medições'):
+        buffer.limpar()
+        logging.info("Medições de diagnóstico limpas.")
+
+    registros = buffer.registros()
+    if not registros:
+        if DIAGNOSTICO_ATIVO:
+            st.info('Nenhuma medição registrada ainda. Navegue pelas páginas e volte aqui.')
+        else:
+            st.info('A instrumentação está desativada (DIAGNOSTICO_ATIVO).')
+    else:
+        df = pd.DataFrame([{
+            'Início': registro['inicio'],
+            'Página': registro['pagina'],
+            'Usuário': registro['usuario'],
+            'Tempo Total (ms)': registro['tempo_total_ms'],
+            'Consultas': registro['consultas'],
+            'Tempo SQL (ms)': registro['tempo_sql_ms'],
+            'Fora do SQL (ms)': registro['tempo_fora_sql_ms'],
+            'Etapas': ', '.join(f"{nome}: {ms:.0f} ms" for nome, ms in registro['etapas_ms'].items()),
+            'Interrompido': registro['interrompido'] or '',
+        } for registro in registros])
+
+        st.subheader('Resumo por Página')
+        resumo = df.groupby('Página').agg(
+            Reruns=('Tempo Total (ms)', 'size'),
+            Mediana_ms=('Tempo Total (ms)', 'median'),
+            P95_ms=('Tempo Total (ms)', lambda tempos: tempos.quantile(0.95)),
+            Consultas_media=('Consultas', 'mean'),
+            SQL_mediana_ms=('Tempo SQL (ms)', 'median'),
+        ).sort_values('P95_ms', ascending=False)
+        st.dataframe(resumo.round(1))
+
+        st.subheader(f'Últimos Reruns ({len(df)})')
+        st.dataframe(df)
+
+        st.subheader('Consultas Mais Lentas')
+        lentas = sorted(
+            ((consulta['ms'], registro['pagina'], registro['inicio'], consulta['sql'])
+             for registro in registros for consulta in registro['consultas_lentas']),
+            reverse=True
+        )[:20]
+        st.dataframe(pd.DataFrame(lentas, columns=['Tempo (ms)', 'Página', 'Início', 'SQL']))
+
+    st.subheader('Pool de Conexões')
+    st.json(get_pool_stats())
+
 # Função para configurações
 def configuracoes():
     if not st.session_state.get('logged_in') or not st.session_state.get('is_admin'):
@@ -756,8 +904,8 @@ def configuracoes():
 def criar_menu():
     if st.session_state.get('logged_in'):
         if st.session_state.get('is_admin'):
-            menu_options = ['Abrir Chamado', 'Administração', 'Relatórios', 'Chamados Técnicos', 'Buscar Protocolo', 'Configurações', 'Logout']
-            icons = ['plus-square', 'gear', 'bar-chart', 'tools', 'search', 'wrench', 'box-arrow-right']
+            menu_options = ['Abrir Chamado', 'Administração', 'Relatórios', 'Chamados Técnicos', 'Buscar Chamados', 'Buscar Protocolo', 'Diagnóstico', 'Configurações', 'Logout']
+            icons = ['plus-square', 'gear', 'bar-chart', 'tools', 'journal-text', 'search', 'speedometer2', 'wrench', 'box-arrow-right']
         else:
             menu_options = ['Abrir Chamado', 'Buscar Protocolo', 'Logout']
             icons = ['plus-square', 'search', 'box-arrow-right']
@@ -790,29 +938,36 @@ def criar_menu():
 # Criação do menu
 selected_option = criar_menu()
 
-# Renderização do conteúdo com base na opção selecionada
-if selected_option == 'Login':
-    if not st.session_state.get('logged_in'):
-        login_form()
+# Renderização do conteúdo com base na opção selecionada, com uma única sessão de banco
+# compartilhada por todos os helpers chamados durante este rerun. O rerun é medido (tempo total,
+# consultas SQL e etapas) para a página de diagnóstico
+with medir_pagina(selected_option, st.session_state.get('username')), sessao_da_pagina():
+    if selected_option == 'Login':
+        if not st.session_state.get('logged_in'):
+            login_form()
+        else:
+            st.info(f"Você já está logado como {st.session_state.get('username')}.")
+    elif selected_option == 'Logout':
+        logout()
+    elif selected_option == 'Abrir Chamado':
+        abrir_chamado()
+    elif selected_option == 'Buscar Protocolo':
+        buscar_protocolo()
+    elif selected_option == 'Administração':
+        administracao()
+    elif selected_option == 'Relatórios':
+        painel_relatorios()
+    elif selected_option == 'Chamados Técnicos':
+        painel_chamados_tecnicos()
+    elif selected_option == 'Buscar Chamados':
+        busca_chamados()
+    elif selected_option == 'Diagnóstico':
+        diagnostico_desempenho()
+    elif selected_option == 'Configurações':
+        configuracoes()
     else:
-        st.info(f"Você já está logado como {st.session_state.get('username')}.")
-elif selected_option == 'Logout':
-    logout()
-elif selected_option == 'Abrir Chamado':
-    abrir_chamado()
-elif selected_option == 'Buscar Protocolo':
-    buscar_protocolo()
-elif selected_option == 'Administração':
-    administracao()
-elif selected_option == 'Relatórios':
-    painel_relatorios()
-elif selected_option == 'Chamados Técnicos':
-    painel_chamados_tecnicos()
-elif selected_option == 'Configurações':
-    configuracoes()
-else:
-    st.error("Página selecionada não existe.")
-    logging.error(f"Página selecionada inválida: {selected_option}")
+        st.error("Página selecionada não existe.")
+        logging.error(f"Página selecionada inválida: {selected_option}")
 
 # Rodapé
 st.markdown("""
@@ -1,9 +1,17 @@
 # autenticacao.py
 
-import bcrypt
+import os
+import hmac
+import json
+import time
+import base64
+import hashlib
 import logging
+import secrets
+import threading
 from sqlalchemy.orm import Session
-from database import SessionLocal, Usuario
+from database import get_session, Usuario
+from senhas import gerar_hash_senha, verificar_senha, precisa_rehash, ServicoSenhasOcupado
 
 # Configuração do logging
 logging.basicConfig(
@@ -15,32 +23,126 @@ logging.basicConfig(
     ]
 )
 
-# Função para autenticar o usuário
-def authenticate(username: str, password: str) -> bool:
-    session: Session = SessionLocal()
+# Configurações do token de sessão usando variáveis de ambiente. Sem SESSAO_SEGREDO, o segredo é
+# gerado na partida do processo (as sessões abertas deixam de valer quando o processo reinicia).
+SESSAO_SEGREDO = os.getenv('SESSAO_SEGREDO', '').encode('utf-8') or secrets.token_bytes(32)
+SESSAO_DURACAO_MINUTOS = int(os.getenv('SESSAO_DURACAO_MINUTOS', '480'))
+if not os.getenv('SESSAO_SEGREDO'):
+    logging.warning("SESSAO_SEGREDO não definido. Usando segredo temporário gerado para este processo.")
+
+# Revogações, mantidas em memória: tokens individuais (logout) e todos os tokens de um usuário
+# emitidos antes de um instante (troca de senha, remoção do usuário)
+_tokens_revogados = {}
+_usuarios_revogados = {}
+_revogacao_lock = threading.Lock()
+
+def _b64(dados: bytes) -> str:
+    return base64.urlsafe_b64encode(dados).rstrip(b'=').decode('ascii')
+
+def _b64_decode(texto: str) -> bytes:
+    return base64.urlsafe_b64decode(texto + '=' * (-len(texto) % 4))
+
+def _assinar(conteudo: str) -> str:
+    return _b64(hmac.new(SESSAO_SEGREDO, conteudo.encode('ascii'), hashlib.sha256).digest())
+
+# Função para autenticar o usuário com uma única consulta; retorna {'username', 'role'} ou None.
+# Se o hash gravado usa um custo diferente do configurado, ele é refeito com a senha informada.
+# ServicoSenhasOcupado é propagada para que a tela peça uma nova tentativa.
+def autenticar_usuario(username: str, password: str):
+    session: Session = get_session()
     try:
-        user = session.query(Usuario).filter(Usuario.username == username).first()
-        if user and bcrypt.checkpw(password.encode('utf-8'), user.password.encode('utf-8')):
+        user = session.query(Usuario.password, Usuario.role).filter(Usuario.username == username).first()
+        if user and verificar_senha(password, user.password):
             logging.info(f"Autenticação bem-sucedida para usuário '{username}'.")
-            return True
+            if precisa_rehash(user.password):
+                session.query(Usuario).filter(Usuario.username == username).update(
+                    {'password': gerar_hash_senha(password)}, synchronize_session=False
+                )
+                session.commit()
+                logging.info(f"Hash da senha do usuário '{username}' atualizado para o custo configurado.")
+            return {'username': username, 'role': user.role}
         else:
             logging.warning(f"Falha na autenticação para usuário '{username}'.")
-            return False
+            return None
+    except ServicoSenhasOcupado:
+        raise
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro na autenticação: {e}")
-        return False
+        return None
     finally:
         session.close()
 
+# Função para autenticar o usuário
+def authenticate(username: str, password: str) -> bool:
+    return autenticar_usuario(username, password) is not None
+
+# Função para emitir um token de sessão assinado (HMAC-SHA256) com validade
+def emitir_token_sessao(username: str, role: str, duracao_minutos: int = None) -> str:
+    agora = time.time()
+    duracao = SESSAO_DURACAO_MINUTOS if duracao_minutos is None else duracao_minutos
+    dados = {
+        'u': username,
+        'r': role,
+        'iat': agora,
+        'exp': agora + duracao * 60,
+        'jti': secrets.token_urlsafe(12),
+    }
+    conteudo = _b64(json.dumps(dados, separators=(',', ':')).encode('utf-8'))
+    return f"{conteudo}.{_assinar(conteudo)}"
+
+# Função para validar um token de sessão sem acessar o banco; retorna os dados ou None se
+# o token for inválido, expirado ou revogado
+def validar_token_sessao(token: str):
+    if not token or token.count('.') != 1:
+        return None
+    conteudo, assinatura = token.split('.')
+    if not hmac.compare_digest(assinatura, _assinar(conteudo)):
+        logging.warning("Token de sessão com assinatura inválida.")
+        return None
+    try:
+        dados = json.loads(_b64_decode(conteudo))
+    except ValueError:
+        return None
+    if dados['exp'] <= time.time():
+        return None
+    with _revogacao_lock:
+        if dados['jti'] in _tokens_revogados:
+            return None
+        revogado_em = _usuarios_revogados.get(dados['u'])
+    if revogado_em is not None and dados['iat'] <= revogado_em:
+        return None
+    return {'username': dados['u'], 'role': dados['r'], 'expira_em': dados['exp']}
+
+# Função para revogar um token (logout)
+def revogar_token_sessao(token: str) -> None:
+    try:
+        dados = json.loads(_b64_decode(token.split('.')[0]))
+    except (ValueError, AttributeError):
+        return
+    agora = time.time()
+    with _revogacao_lock:
+        _tokens_revogados[dados['jti']] = dados['exp']
+        # Tokens já expirados não precisam mais constar da lista
+        for jti, expira_em in list(_tokens_revogados.items()):
+            if expira_em <= agora:
+                del _tokens_revogados[jti]
+
+# Função para revogar todas as sessões abertas de um usuário
+def revogar_sessoes_usuario(username: str) -> None:
+    with _revogacao_lock:
+        _usuarios_revogados[username] = time.time()
+    logging.info(f"Sessões do usuário '{username}' revogadas.")
+
 # Função para adicionar um novo usuário
 def add_user(username: str, password: str, is_admin: bool = False) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         existing_user = session.query(Usuario).filter(Usuario.username == username).first()
         if existing_user:
             logging.warning(f"Falha ao criar usuário '{username}': já existe.")
             return False
-        hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
+        hashed_password = gerar_hash_senha(password)
         role = 'admin' if is_admin else 'user'
         new_user = Usuario(username=username, password=hashed_password, role=role)
         session.add(new_user)
@@ -56,7 +158,7 @@ def add_user(username: str, password: str, is_admin: bool = False) -> bool:
 
 # Função para verificar se o usuário é administrador
 def is_admin(username: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         user = session.query(Usuario).filter(Usuario.username == username).first()
         if user and user.role == 'admin':
@@ -66,6 +168,7 @@ def is_admin(username: str) -> bool:
             logging.info(f"Usuário '{username}' não é um administrador.")
             return False
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao verificar função do usuário '{username}': {e}")
         return False
     finally:
@@ -73,30 +176,31 @@ def is_admin(username: str) -> bool:
 
 # Função para listar todos os usuários cadastrados
 def list_users():
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         users = session.query(Usuario.username, Usuario.role).all()
         logging.info("Lista de usuários obtida com sucesso.")
         return users
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao listar usuários: {e}")
         return []
     finally:
         session.close()
 
-# Função para alterar a senha de um usuário
+# Função para alterar a senha de um usuário (redefinição feita pelo administrador)
 def change_password(username: str, new_password: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         user = session.query(Usuario).filter(Usuario.username == username).first()
-        if user and bcrypt.checkpw(old_password.encode('utf-8'), user.password.encode('utf-8')):
-            hashed_new_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt()).decode('utf-8')
-            user.password = hashed_new_password
+        if user:
+            user.password = gerar_hash_senha(new_password)
             session.commit()
+            revogar_sessoes_usuario(username)
             logging.info(f"Senha do usuário '{username}' alterada com sucesso.")
             return True
         else:
-            logging.warning(f"Falha na alteração da senha para usuário '{username}': autenticação falhou.")
+            logging.warning(f"Falha na alteração da senha: usuário '{username}' não encontrado.")
             return False
     except Exception as e:
         session.rollback()
@@ -107,7 +211,7 @@ def change_password(username: str, new_password: str) -> bool:
 
 # Função para remover um usuário (apenas para administradores)
 def remove_user(admin_username: str, target_username: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         admin_user = session.query(Usuario).filter(Usuario.username == admin_username).first()
         if not admin_user or admin_user.role != 'admin':
@@ -121,6 +225,7 @@ def remove_user(admin_username: str, target_username: str) -> bool:
         
         session.delete(target_user)
         session.commit()
+        revogar_sessoes_usuario(target_username)
         logging.info(f"Usuário '{target_username}' removido com sucesso por '{admin_username}'.")
         return True
     except Exception as e:
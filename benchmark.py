@@ -0,0 +1,254 @@
+# benchmark.py
+# Medições de desempenho executadas pelo manage.py, sobre dados sintéticos (ver dados_sinteticos.py):
+# - benchmark_indices: consultas principais com e sem os índices, em um banco separado;
+# - benchmark_suite: caminhos críticos da aplicação (tempo decorrido, dados e relatório mensal,
+#   relatório do inventário, login e painel de chamados) no banco configurado em DATABASE_URL.
+import os
+import time
+import logging
+import platform
+import statistics
+from datetime import datetime
+from sqlalchemy import create_engine, select, func, text
+from database import (
+    Base, Chamado, Inventario, PecaUsada, HistoricoManutencao, UBS, Setor, Usuario, INDICES_CONSULTA, create_indexes
+)
+from dados_sinteticos import gerar_dados_sinteticos
+
+logger = logging.getLogger(__name__)
+
+# Banco sem os dados necessários para o benchmark
+class ErroBenchmark(Exception):
+    pass
+
+# Último mês completo dos chamados: (início, fim), com o fim exclusivo
+def _ultimo_mes_completo(conexao):
+    ultima_abertura = conexao.execute(select(func.max(Chamado.hora_abertura))).scalar()
+    fim_mes = ultima_abertura.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+    if fim_mes.month == 1:
+        inicio_mes = fim_mes.replace(year=fim_mes.year - 1, month=12)
+    else:
+        inicio_mes = fim_mes.replace(month=fim_mes.month - 1)
+    return inicio_mes, fim_mes
+
+# Consultas que reproduzem os acessos da aplicação aos chamados, peças e histórico
+def consultas_indices(conexao):
+    patrimonio = conexao.execute(
+        select(Chamado.patrimonio).group_by(Chamado.patrimonio).order_by(func.count().desc()).limit(1)
+    ).scalar()
+    ubs = conexao.execute(select(Chamado.ubs).limit(1)).scalar()
+    inicio_mes, fim_mes = _ultimo_mes_completo(conexao)
+    no_mes = [Chamado.hora_abertura >= inicio_mes, Chamado.hora_abertura < fim_mes]
+
+    return {
+        'Chamados em aberto (página)': (
+            select(Chamado.id, Chamado.protocolo, Chamado.ubs, Chamado.hora_abertura)
+            .where(Chamado.hora_fechamento.is_(None))
+            .order_by(Chamado.hora_abertura.desc(), Chamado.id.desc())
+            .limit(50)
+        ),
+        'Chamados por patrimônio': select(Chamado).where(Chamado.patrimonio == patrimonio),
+        'Chamados do mês por UBS': (
+            select(Chamado.ubs, func.count(Chamado.id)).where(*no_mes).group_by(Chamado.ubs)
+        ),
+        'Chamados de uma UBS no mês': (
+            select(Chamado.id, Chamado.protocolo, Chamado.hora_abertura)
+            .where(Chamado.ubs == ubs, *no_mes)
+            .order_by(Chamado.hora_abertura)
+        ),
+        'Peças usadas de uma máquina': (
+            select(PecaUsada.peca_nome, PecaUsada.data_uso)
+            .join(Chamado, PecaUsada.chamado_id == Chamado.id)
+            .where(Chamado.patrimonio == patrimonio)
+        ),
+        'Histórico de manutenção': (
+            select(HistoricoManutencao).where(HistoricoManutencao.numero_patrimonio == patrimonio)
+        ),
+    }
+
+# Plano de execução da consulta, no formato do banco em uso
+def plano_consulta(conexao, consulta):
+    sql = str(consulta.compile(dialect=conexao.dialect, compile_kwargs={'literal_binds': True}))
+    if conexao.dialect.name == 'sqlite':
+        return [linha[-1] for linha in conexao.execute(text(f"EXPLAIN QUERY PLAN {sql}"))]
+    return [linha[0] for linha in conexao.execute(text(f"EXPLAIN {sql}"))]
+
+# Mediana do tempo de execução (ms), lendo todas as linhas do resultado
+def tempo_consulta(conexao, consulta, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        conexao.execute(consulta).all()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return statistics.median(tempos)
+
+def _medir(bind, repeticoes):
+    with bind.connect() as conexao:
+        return {
+            nome: {'plano': plano_consulta(conexao, consulta), 'ms': tempo_consulta(conexao, consulta, repeticoes)}
+            for nome, consulta in consultas_indices(conexao).items()
+        }
+
+def _remover_indices(bind):
+    for indice in INDICES_CONSULTA:
+        indice.drop(bind=bind, checkfirst=True)
+    with bind.begin() as conexao:
+        conexao.execute(text("ANALYZE"))
+
+# Função para comparar as consultas com e sem os índices de consulta (INDICES_CONSULTA).
+# Usa o banco em 'url' (criado e preenchido com dados sintéticos se ainda não tiver chamados)
+# e devolve {consulta: {'sem_indices': {...}, 'com_indices': {...}}}.
+def benchmark_indices(url, chamados=200_000, repeticoes=5):
+    bind = create_engine(url)
+    try:
+        Base.metadata.create_all(bind=bind)
+        with bind.connect() as conexao:
+            existentes = conexao.execute(select(func.count(Chamado.id))).scalar()
+        if not existentes:
+            logger.info(f"Gerando {chamados} chamados sintéticos em {bind.url.render_as_string(hide_password=True)}...")
+            gerar_dados_sinteticos(bind, chamados=chamados)
+
+        _remover_indices(bind)
+        sem_indices = _medir(bind, repeticoes)
+        create_indexes(bind)
+        com_indices = _medir(bind, repeticoes)
+        return {nome: {'sem_indices': sem_indices[nome], 'com_indices': com_indices[nome]} for nome in com_indices}
+    finally:
+        bind.dispose()
+
+# Mediana, mínimo e máximo (ms) de 'repeticoes' execuções de 'funcao'
+def _cronometrar(funcao, repeticoes):
+    tempos = []
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        funcao()
+        tempos.append((time.perf_counter() - inicio) * 1000)
+    return {
+        'mediana_ms': statistics.median(tempos),
+        'min_ms': min(tempos),
+        'max_ms': max(tempos),
+        'repeticoes': repeticoes,
+    }
+
+# Quantidade de linhas das tabelas usadas no benchmark
+def _contagens(conexao):
+    modelos = {
+        'chamados': Chamado, 'inventario': Inventario, 'peca_usada': PecaUsada,
+        'historico_manutencao': HistoricoManutencao, 'ubs': UBS, 'setores': Setor, 'usuarios': Usuario,
+    }
+    return {
+        nome: conexao.execute(select(func.count()).select_from(modelo.__table__)).scalar()
+        for nome, modelo in modelos.items()
+    }
+
+# Função para medir os caminhos críticos da aplicação no banco configurado (DATABASE_URL), que deve
+# ter sido preenchido com dados sintéticos. 'mes' ('AAAA-MM') é o mês dos relatórios (padrão: o
+# último mês completo); o cálculo do tempo decorrido chamado a chamado usa uma amostra de
+# 'amostra_tempo' chamados. O login usa o usuário 'usuario', criado se não existir.
+# Retorna um dicionário serializável em JSON com o ambiente, as contagens e os resultados.
+def benchmark_suite(repeticoes=5, mes=None, amostra_tempo=1000, usuario='benchmark', senha='benchmark-senha'):
+    import pandas as pd
+    import sqlalchemy
+    from database import engine, get_session, create_user
+    from carregador_dataframe import carregar_dataframe
+    from expediente import calcular_tempo_decorrido_lote
+    from autenticacao import authenticate
+    from inventario import get_machines_from_inventory, create_inventory_report
+    from chamados import (
+        calcular_tempo_decorrido, get_monthly_technical_data, generate_monthly_report,
+        generate_monthly_report_streaming, dataframe_chamados_em_aberto, buscar_chamados_paginados,
+        preparar_datas_painel, preparar_tempo_painel, COLUNAS_PAINEL_CHAMADOS,
+    )
+
+    with get_session() as session:
+        if not session.query(Usuario.id).filter(Usuario.username == usuario).first():
+            create_user(usuario, senha)
+
+    with engine.connect() as conexao:
+        contagens = _contagens(conexao)
+        if not contagens['chamados']:
+            raise ErroBenchmark("O banco não tem chamados. Gere os dados com 'python manage.py gerar-dados'.")
+        if mes is None:
+            mes = _ultimo_mes_completo(conexao)[0].strftime('%Y-%m')
+        horarios = conexao.execute(select(Chamado.hora_abertura, Chamado.hora_fechamento)).all()
+    logo_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'infocustec.png')
+
+    # Entradas preparadas fora da medição
+    aberturas = [abertura for abertura, _ in horarios]
+    fechamentos = [fechamento for _, fechamento in horarios]
+    amostra = horarios[:amostra_tempo]
+    df_mes, _ = get_monthly_technical_data(mes)
+    with get_session() as session:
+        pecas_mes = carregar_dataframe(
+            session, {'chamado_id': PecaUsada.chamado_id, 'peca_nome': PecaUsada.peca_nome},
+            [PecaUsada.chamado_id == Chamado.id, Chamado.id.in_(df_mes['ID'].tolist())]
+        )
+
+    def painel_chamados():
+        preparar_datas_painel(dataframe_chamados_em_aberto())
+        pagina = buscar_chamados_paginados(tamanho_pagina=50, colunas=COLUNAS_PAINEL_CHAMADOS)
+        preparar_tempo_painel(preparar_datas_painel(pagina['chamados']))
+
+    alvos = {
+        'calcular_tempo_decorrido': (
+            lambda: [calcular_tempo_decorrido(abertura, fechamento) for abertura, fechamento in amostra],
+            {'chamados': len(amostra)},
+        ),
+        'calcular_tempo_decorrido_lote': (
+            lambda: calcular_tempo_decorrido_lote(aberturas, fechamentos),
+            {'chamados': len(horarios)},
+        ),
+        'get_monthly_technical_data': (lambda: get_monthly_technical_data(mes), {'mes': mes, 'chamados': len(df_mes)}),
+        'generate_monthly_report': (
+            lambda: generate_monthly_report(df_mes, mes, pecas_mes, logo_path=logo_path),
+            {'mes': mes, 'chamados': len(df_mes)},
+        ),
+        'generate_monthly_report_streaming': (
+            lambda: generate_monthly_report_streaming(mes, logo_path=logo_path),
+            {'mes': mes, 'chamados': len(df_mes)},
+        ),
+        'create_inventory_report': (
+            lambda: create_inventory_report(get_machines_from_inventory(), logo_path),
+            {'maquinas': contagens['inventario']},
+        ),
+        'login': (lambda: authenticate(usuario, senha), {}),
+        'painel_chamados': (painel_chamados, {}),
+    }
+
+    resultados = {}
+    for nome, (funcao, detalhes) in alvos.items():
+        logger.info(f"Benchmark: {nome}...")
+        resultados[nome] = {**_cronometrar(funcao, repeticoes), **detalhes}
+        logger.info(f"Benchmark: {nome}: mediana de {resultados[nome]['mediana_ms']:.1f} ms.")
+
+    return {
+        'executado_em': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {
+            'banco': engine.dialect.name,
+            'python': platform.python_version(),
+            'plataforma': platform.platform(),
+            'pandas': pd.__version__,
+            'sqlalchemy': sqlalchemy.__version__,
+        },
+        'parametros': {'repeticoes': repeticoes, 'mes': mes, 'amostra_tempo': amostra_tempo},
+        'contagens': contagens,
+        'resultados': resultados,
+    }
+
+# Função para comparar dois resultados do benchmark_suite; devolve, para cada medição presente nos
+# dois, {'anterior_ms', 'atual_ms', 'razao', 'regressao'}, com regressão quando o tempo cresceu mais
+# que 'tolerancia' (0.2 = 20%)
+def comparar_resultados(anterior, atual, tolerancia=0.2):
+    comparacao = {}
+    for nome, medicao in atual['resultados'].items():
+        if nome not in anterior.get('resultados', {}):
+            continue
+        anterior_ms = anterior['resultados'][nome]['mediana_ms']
+        razao = medicao['mediana_ms'] / max(anterior_ms, 1e-6)
+        comparacao[nome] = {
+            'anterior_ms': anterior_ms,
+            'atual_ms': medicao['mediana_ms'],
+            'razao': razao,
+            'regressao': razao > 1 + tolerancia,
+        }
+    return comparacao
@@ -0,0 +1,140 @@
+# busca_chamados.py
+# Busca textual nos campos 'problema' e 'solucao' dos chamados, com índice no banco:
+# - PostgreSQL: coluna tsvector gerada (dicionário 'portuguese', com radicalização) e índice GIN;
+# - SQLite: tabela virtual FTS5 sincronizada por triggers; o FTS5 não tem radicalização para o português,
+#   então os termos são buscados como prefixo depois de retirar as terminações de plural.
+# O índice é criado por uma migração (ver migracoes.py). Outros bancos usam LIKE, sem índice.
+import re
+import logging
+from sqlalchemy import func, literal_column, or_, text, table, column
+from database import engine, get_session, Chamado
+
+logger = logging.getLogger(__name__)
+
+# Texto que é indexado: o problema pesa mais que a solução no ranking
+_VETOR_BUSCA_PG = (
+    "setweight(to_tsvector('portuguese', coalesce(problema, '')), 'A') || "
+    "setweight(to_tsvector('portuguese', coalesce(solucao, '')), 'B')"
+)
+
+_COMANDOS_INDICE_SQLITE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS chamados_fts USING fts5("
+    "problema, solucao, content='chamados', content_rowid='id', tokenize='unicode61 remove_diacritics 2')",
+    "CREATE TRIGGER IF NOT EXISTS chamados_fts_ai AFTER INSERT ON chamados BEGIN "
+    "INSERT INTO chamados_fts(rowid, problema, solucao) VALUES (new.id, new.problema, new.solucao); END",
+    "CREATE TRIGGER IF NOT EXISTS chamados_fts_ad AFTER DELETE ON chamados BEGIN "
+    "INSERT INTO chamados_fts(chamados_fts, rowid, problema, solucao) VALUES ('delete', old.id, old.problema, old.solucao); END",
+    "CREATE TRIGGER IF NOT EXISTS chamados_fts_au AFTER UPDATE OF problema, solucao ON chamados BEGIN "
+    "INSERT INTO chamados_fts(chamados_fts, rowid, problema, solucao) VALUES ('delete', old.id, old.problema, old.solucao); "
+    "INSERT INTO chamados_fts(rowid, problema, solucao) VALUES (new.id, new.problema, new.solucao); END",
+    # Indexa os chamados já existentes
+    "INSERT INTO chamados_fts(chamados_fts) VALUES ('rebuild')",
+]
+
+_chamados_fts = table('chamados_fts', column('rowid'))
+
+# Função para criar o índice de busca textual no banco em uso (executada pela migração)
+def criar_indice_busca():
+    with engine.begin() as conexao:
+        if engine.dialect.name == 'postgresql':
+            conexao.execute(text(
+                f"ALTER TABLE chamados ADD COLUMN IF NOT EXISTS busca tsvector "
+                f"GENERATED ALWAYS AS ({_VETOR_BUSCA_PG}) STORED"
+            ))
+            conexao.execute(text("CREATE INDEX IF NOT EXISTS ix_chamados_busca ON chamados USING GIN (busca)"))
+        elif engine.dialect.name == 'sqlite':
+            for comando in _COMANDOS_INDICE_SQLITE:
+                conexao.execute(text(comando))
+        else:
+            logger.warning(f"Busca textual sem índice para o banco '{engine.dialect.name}'; será usada a busca por LIKE.")
+
+# Termos da busca (palavras com letras ou dígitos)
+def _termos(texto):
+    return re.findall(r'\w+', texto or '')
+
+# Radical aproximado de um termo: retira as terminações de plural mais comuns do português
+# (impressoras -> impressora, monitores -> monitor, lentidões -> lentid)
+def _radical_simples(termo):
+    termo = termo.lower()
+    if len(termo) <= 3:
+        return termo
+    if termo.endswith(('ões', 'ães', 'ãos')):
+        return termo[:-3]
+    if termo.endswith(('res', 'zes')):
+        return termo[:-2]
+    if termo.endswith('s'):
+        return termo[:-1]
+    return termo
+
+# Consulta FTS5: todos os termos, cada um como prefixo ("termo"*)
+def _consulta_fts5(termos):
+    return ' '.join(f'"{_radical_simples(termo)}"*' for termo in termos)
+
+# Colunas devolvidas para cada chamado encontrado
+_COLUNAS_RESULTADO = [
+    Chamado.id, Chamado.protocolo, Chamado.ubs, Chamado.setor, Chamado.tipo_defeito,
+    Chamado.problema, Chamado.solucao, Chamado.hora_abertura, Chamado.hora_fechamento,
+]
+
+# Monta, para o banco em uso, a consulta dos chamados encontrados: (id, relevância), onde maior
+# relevância = resultado melhor
+def _consulta_ranqueada(session, termos, texto):
+    dialeto = session.bind.dialect.name
+    if dialeto == 'postgresql':
+        consulta_ts = func.websearch_to_tsquery('portuguese', texto)
+        vetor = literal_column('chamados.busca')
+        relevancia = func.ts_rank_cd(vetor, consulta_ts)
+        return session.query(Chamado.id, relevancia.label('relevancia')).filter(vetor.op('@@')(consulta_ts))
+    if dialeto == 'sqlite':
+        # bm25 devolve valores menores para resultados mais relevantes; pesos: problema 2, solução 1
+        relevancia = -func.bm25(literal_column('chamados_fts'), 2.0, 1.0)
+        return (
+            session.query(Chamado.id, relevancia.label('relevancia'))
+            .join(_chamados_fts, _chamados_fts.c.rowid == Chamado.id)
+            .filter(literal_column('chamados_fts').op('MATCH')(_consulta_fts5(termos)))
+        )
+    filtros = [or_(Chamado.problema.ilike(f'%{termo}%'), Chamado.solucao.ilike(f'%{termo}%')) for termo in termos]
+    return session.query(Chamado.id, literal_column('0').label('relevancia')).filter(*filtros)
+
+# Função para buscar chamados pelo texto do problema e da solução, ordenados por relevância
+# (e pelos mais recentes em caso de empate), com filtros opcionais de UBS e setor.
+# 'pagina' começa em 1. Retorna {'resultados': [dicts], 'total', 'pagina', 'total_paginas'}.
+# Erros do banco (ex.: índice textual ausente) são registrados e repassados a quem chamou.
+def buscar_chamados_texto(texto, ubs=None, setor=None, pagina=1, tamanho_pagina=20, contar_total=True):
+    vazio = {'resultados': [], 'total': 0, 'pagina': pagina, 'total_paginas': 0}
+    termos = _termos(texto)
+    if not termos:
+        return vazio
+
+    with get_session() as session:
+        try:
+            query = _consulta_ranqueada(session, termos, texto)
+            if ubs:
+                query = query.filter(Chamado.ubs == ubs)
+            if setor:
+                query = query.filter(Chamado.setor == setor)
+            # Ordena só (id, relevância) e busca as demais colunas apenas para os chamados da página
+            pagina_ids = (
+                query.order_by(literal_column('relevancia').desc(), Chamado.hora_abertura.desc(), Chamado.id.desc())
+                .offset((pagina - 1) * tamanho_pagina)
+                .limit(tamanho_pagina)
+                .subquery()
+            )
+            linhas = (
+                session.query(*_COLUNAS_RESULTADO, pagina_ids.c.relevancia)
+                .join(pagina_ids, pagina_ids.c.id == Chamado.id)
+                .order_by(pagina_ids.c.relevancia.desc(), Chamado.hora_abertura.desc(), Chamado.id.desc())
+                .all()
+            )
+            total = query.count() if contar_total else None
+            logger.info(f"Busca textual de chamados: {len(linhas)} resultados na página {pagina}.")
+            return {
+                'resultados': [dict(linha._mapping) for linha in linhas],
+                'total': total,
+                'pagina': pagina,
+                'total_paginas': -(-total // tamanho_pagina) if total is not None else None,
+            }
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro na busca textual de chamados: {e}")
+            raise
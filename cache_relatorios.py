@@ -0,0 +1,124 @@
+# cache_relatorios.py
+# Cache em disco dos relatórios gerados (PDFs), endereçado pelo conteúdo: a chave combina o tipo
+# do relatório, os parâmetros e a "versão" dos dados de origem. Quando os dados mudam a chave muda,
+# então não há invalidação explícita; os arquivos antigos saem pela remoção LRU por tamanho.
+import os
+import json
+import hashlib
+import logging
+import tempfile
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+CACHE_RELATORIOS_DIR = os.getenv('CACHE_RELATORIOS_DIR', '.cache_relatorios')
+CACHE_RELATORIOS_MAX_MB = float(os.getenv('CACHE_RELATORIOS_MAX_MB', '200'))
+
+# Função para calcular a chave de um artefato (sha256 do tipo, parâmetros e versão dos dados)
+def chave_artefato(tipo, parametros, versao_dados):
+    conteudo = json.dumps(
+        {'tipo': tipo, 'parametros': parametros, 'versao': versao_dados},
+        sort_keys=True, default=str, ensure_ascii=False
+    )
+    return hashlib.sha256(conteudo.encode('utf-8')).hexdigest()
+
+class CacheArtefatos:
+    def __init__(self, diretorio=CACHE_RELATORIOS_DIR, tamanho_maximo=int(CACHE_RELATORIOS_MAX_MB * 1024 * 1024)):
+        self.diretorio = diretorio
+        self.tamanho_maximo = tamanho_maximo
+        self._lock = threading.Lock()
+        os.makedirs(self.diretorio, exist_ok=True)
+
+    def _caminho(self, chave):
+        return os.path.join(self.diretorio, f'{chave}.bin')
+
+    # Retorna o conteúdo do artefato ou None; um acerto atualiza o mtime, que marca o uso para a LRU
+    def obter(self, chave):
+        caminho = self._caminho(chave)
+        try:
+            with open(caminho, 'rb') as arquivo:
+                dados = arquivo.read()
+            os.utime(caminho)
+            return dados
+        except FileNotFoundError:
+            return None
+        except OSError as e:
+            logger.warning(f"Erro ao ler artefato {chave} do cache: {e}")
+            return None
+
+    # Grava o artefato de forma atômica (arquivo temporário + os.replace) e aplica a remoção LRU
+    def gravar(self, chave, dados):
+        if len(dados) > self.tamanho_maximo:
+            logger.info(f"Artefato {chave} maior que o limite do cache; não será armazenado.")
+            return
+        descritor, temporario = tempfile.mkstemp(dir=self.diretorio, suffix='.tmp')
+        try:
+            with os.fdopen(descritor, 'wb') as arquivo:
+                arquivo.write(dados)
+            os.replace(temporario, self._caminho(chave))
+        except OSError as e:
+            logger.warning(f"Erro ao gravar artefato {chave} no cache: {e}")
+            if os.path.exists(temporario):
+                os.remove(temporario)
+            return
+        self.remover_excedentes()
+
+    # Remove os artefatos usados há mais tempo até o total caber no limite configurado
+    def remover_excedentes(self):
+        with self._lock:
+            arquivos = []
+            for entrada in os.scandir(self.diretorio):
+                if entrada.is_file() and entrada.name.endswith('.bin'):
+                    try:
+                        info = entrada.stat()
+                    except FileNotFoundError:
+                        continue
+                    arquivos.append((info.st_mtime, info.st_size, entrada.path))
+            total = sum(tamanho for _, tamanho, _ in arquivos)
+            for _, tamanho, caminho in sorted(arquivos):
+                if total <= self.tamanho_maximo:
+                    break
+                try:
+                    os.remove(caminho)
+                    total -= tamanho
+                    logger.info(f"Artefato removido do cache de relatórios: {os.path.basename(caminho)}")
+                except FileNotFoundError:
+                    continue
+
+    def limpar(self):
+        with self._lock:
+            for entrada in os.scandir(self.diretorio):
+                if entrada.is_file() and entrada.name.endswith('.bin'):
+                    os.remove(entrada.path)
+
+    # Retorna o artefato do cache ou chama 'gerar' (que devolve bytes, arquivo aberto ou None) e armazena
+    def obter_ou_gerar(self, tipo, parametros, versao_dados, gerar):
+        chave = chave_artefato(tipo, parametros, versao_dados)
+        dados = self.obter(chave)
+        if dados is not None:
+            logger.info(f"Relatório '{tipo}' servido do cache ({chave[:12]}).")
+            return dados
+
+        resultado = gerar()
+        if resultado is None:
+            return None
+        if hasattr(resultado, 'read'):
+            with resultado:
+                dados = resultado.read()
+        else:
+            dados = bytes(resultado)
+        self.gravar(chave, dados)
+        logger.info(f"Relatório '{tipo}' gerado e armazenado no cache ({chave[:12]}).")
+        return dados
+
+# Cache compartilhado pelo processo
+_cache = None
+_cache_lock = threading.Lock()
+
+def get_cache_relatorios():
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = CacheArtefatos()
+        return _cache
@@ -0,0 +1,45 @@
+# carregador_dataframe.py
+# Carrega o resultado de uma consulta direto em um DataFrame tipado. Seleciona só as colunas
+# necessárias e lê as linhas como tuplas, em lotes, sem objetos do ORM nem listas de dicionários
+# intermediárias. Os tipos vêm das colunas do modelo: datas como datetime64, inteiros e números
+# como tipos numéricos e, quando pedido, textos repetitivos (UBS, setor...) como category.
+import pandas as pd
+from sqlalchemy import select, Integer, Float, DateTime
+
+# Converte uma coluna do DataFrame para o tipo correspondente à coluna do banco
+def _tipar_coluna(serie, tipo_sql, categorica=False):
+    if isinstance(tipo_sql, DateTime):
+        return pd.to_datetime(serie, errors='coerce')
+    if isinstance(tipo_sql, Integer):
+        return serie.astype('Int64') if serie.isna().any() else serie.astype('int64')
+    if isinstance(tipo_sql, Float):
+        return pd.to_numeric(serie, errors='coerce').astype('float64')
+    if categorica:
+        return serie.astype('category')
+    return serie
+
+# Função para carregar uma consulta em um DataFrame. 'colunas' é um dicionário ordenado
+# {rótulo no DataFrame: coluna do modelo}; 'categorias' lista os rótulos a tipar como category.
+def carregar_dataframe(session, colunas, filtros=(), ordem=(), limite=None, categorias=(), tamanho_lote=10000):
+    rotulos = list(colunas)
+    consulta = select(*colunas.values())
+    if filtros:
+        consulta = consulta.where(*filtros)
+    if ordem:
+        consulta = consulta.order_by(*ordem)
+    if limite is not None:
+        consulta = consulta.limit(limite)
+
+    # Executa pela conexão da sessão (Core): as linhas chegam como tuplas, sem a camada de carga do ORM
+    resultado = session.connection().execution_options(yield_per=tamanho_lote).execute(consulta)
+    blocos = [pd.DataFrame.from_records(lote, columns=rotulos) for lote in resultado.partitions()]
+    if not blocos:
+        df = pd.DataFrame(columns=rotulos)
+    elif len(blocos) == 1:
+        df = blocos[0]
+    else:
+        df = pd.concat(blocos, ignore_index=True)
+
+    for rotulo, coluna in colunas.items():
+        df[rotulo] = _tipar_coluna(df[rotulo], coluna.type, rotulo in categorias)
+    return df
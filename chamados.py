@@ -1,21 +1,24 @@
 # chamados.py
 import os
-from datetime import datetime, timedelta
-from twilio.rest import Client
+from datetime import datetime, time, timedelta
 import streamlit as st
 import pandas as pd
-from fpdf import FPDF
 from io import BytesIO
-import matplotlib.pyplot as plt
-import seaborn as sns
 import tempfile
 import logging
+from itertools import islice
 from logging.handlers import RotatingFileHandler
-from database import Chamado, SessionLocal, Inventario, PecaUsada, HistoricoManutencao
-from sqlalchemy import desc
-from workalendar.america import Brazil
+from database import (
+    Chamado, SessionLocal, get_session, Inventario, PecaUsada, HistoricoManutencao, ResumoMensalChamados,
+    reservar_protocolo, atualizar_resumo_mensal, expressao_mes,
+)
+from sqlalchemy import and_, or_, func
 from zoneinfo import ZoneInfo
-from dateutil import parser
+from expediente import calcular_tempo_decorrido_lote
+from graficos import renderizar_graficos, adicionar_png_ao_pdf, get_perfil_grafico
+from cache_relatorios import get_cache_relatorios
+from carregador_dataframe import carregar_dataframe
+from notificacoes import enfileirar_notificacoes, notificar_despachante
 
 # Configuração do logging
 logger = logging.getLogger(__name__)
@@ -31,39 +34,24 @@ logger.addHandler(handler_stream)
 # Definir o fuso horário local
 local_tz = ZoneInfo('America/Sao_Paulo')
 
-# Configurações de autenticação do Twilio usando variáveis de ambiente
-account_sid = os.getenv('TWILIO_ACCOUNT_SID')
-auth_token = os.getenv('TWILIO_AUTH_TOKEN')
-if account_sid and auth_token:
-    client = Client(account_sid, auth_token)
-    twilio_from = os.getenv('TWILIO_FROM')
-    twilio_to_numbers = os.getenv('TWILIO_TO_NUMBERS', '').split(',')
-else:
-    client = None
-    logger.warning("Credenciais do Twilio não configuradas. Mensagens não serão enviadas.")
-
-def gerar_protocolo_sequencial():
-    with SessionLocal() as session:
-        try:
-            max_protocolo = session.query(Chamado).order_by(desc(Chamado.protocolo)).first()
-            protocolo = max_protocolo.protocolo + 1 if max_protocolo else 1
-            return protocolo
-        except Exception as e:
-            logger.error(f"Erro ao gerar protocolo sequencial: {e}")
-            return None
+def gerar_protocolo_sequencial(session):
+    # No PostgreSQL o protocolo vem da sequence no próprio INSERT; no SQLite, do contador na mesma transação
+    protocolo = reservar_protocolo(session)
+    return {} if protocolo is None else {'protocolo': protocolo}
 
 def get_chamado_by_protocolo(protocolo):
-    with SessionLocal() as session:
+    with get_session() as session:
         try:
             chamado = session.query(Chamado).filter(Chamado.protocolo == protocolo).first()
             logger.info(f"Chamado buscado pelo protocolo {protocolo}: {'Encontrado' if chamado else 'Não encontrado'}")
             return chamado
         except Exception as e:
+            session.rollback()
             logger.error(f"Erro ao buscar chamado por protocolo {protocolo}: {e}")
             return None
 
 def buscar_no_inventario_por_patrimonio(patrimonio):
-    with SessionLocal() as session:
+    with get_session() as session:
         try:
             inventario = session.query(Inventario).filter(Inventario.numero_patrimonio == patrimonio).first()
             if inventario:
@@ -79,18 +67,14 @@ def buscar_no_inventario_por_patrimonio(patrimonio):
             logger.info(f"Número de patrimônio {patrimonio} não encontrado no inventário.")
             return None
         except Exception as e:
+            session.rollback()
             logger.error(f"Erro ao buscar patrimônio {patrimonio} no inventário: {e}")
             return None
 
 def add_chamado(username, ubs, setor, tipo_defeito, problema, machine=None, patrimonio=None):
-    protocolo = gerar_protocolo_sequencial()
-    if protocolo is None:
-        st.error("Não foi possível gerar um protocolo para o chamado. Tente novamente mais tarde.")
-        return
-
     hora_abertura = datetime.now(tz=local_tz)
 
-    with SessionLocal() as session:
+    with get_session() as session:
         try:
             novo_chamado = Chamado(
                 username=username,
@@ -99,29 +83,23 @@ def add_chamado(username, ubs, setor, tipo_defeito, problema, machine=None, patr
                 tipo_defeito=tipo_defeito,
                 problema=problema,
                 hora_abertura=hora_abertura,
-                protocolo=protocolo,
                 machine=machine,
-                patrimonio=patrimonio
+                patrimonio=patrimonio,
+                **gerar_protocolo_sequencial(session)
             )
             session.add(novo_chamado)
+            session.flush()
+            protocolo = novo_chamado.protocolo
+            atualizar_resumo_mensal(session, hora_abertura.strftime('%Y-%m'), ubs, setor, tipo_defeito, total=1)
+            # As notificações entram na outbox na mesma transação e são enviadas em segundo plano
+            enfileirar_notificacoes(
+                session,
+                novo_chamado.id,
+                f"Novo chamado técnico na UBS '{ubs}' no setor '{setor}': {problema}"
+            )
             session.commit()
             logger.info(f"Chamado aberto: Protocolo {protocolo} por usuário {username}")
-
-            if client and twilio_from and twilio_to_numbers:
-                for numero in twilio_to_numbers:
-                    numero = numero.strip()
-                    if numero:
-                        try:
-                            message = client.messages.create(
-                                from_=twilio_from,
-                                body=f"Novo chamado técnico na UBS '{ubs}' no setor '{setor}': {problema}",
-                                to=numero
-                            )
-                            logger.info(f"Mensagem enviada para {numero} via WhatsApp. SID: {message.sid}")
-                        except Exception as e:
-                            logger.error(f"Erro ao enviar mensagem para {numero} via WhatsApp: {e}")
-            else:
-                logger.warning("Cliente Twilio não configurado ou números de destino não fornecidos.")
+            notificar_despachante()
 
             st.success(f"Chamado aberto com sucesso! Protocolo: {protocolo}")
         except Exception as e:
@@ -131,57 +109,10 @@ def add_chamado(username, ubs, setor, tipo_defeito, problema, machine=None, patr
 
 def calcular_tempo_decorrido(hora_abertura, hora_fechamento):
     try:
-        cal = Brazil()
-        total_seconds = 0
-
-        if hora_fechamento is None or pd.isnull(hora_fechamento):
-            hora_fechamento = datetime.now(tz=local_tz)
-
-        if isinstance(hora_abertura, str):
-            hora_abertura = parser.parse(hora_abertura)
-        if isinstance(hora_fechamento, str):
-            hora_fechamento = parser.parse(hora_fechamento)
-
-        if hora_abertura.tzinfo is None:
-            hora_abertura = hora_abertura.replace(tzinfo=local_tz)
-        if hora_fechamento.tzinfo is None:
-            hora_fechamento = hora_fechamento.replace(tzinfo=local_tz)
-
-        current = hora_abertura
-
-        while current < hora_fechamento:
-            if cal.is_working_day(current.date()):
-                start_of_day = current.replace(hour=8, minute=0, second=0, microsecond=0)
-                end_of_day = current.replace(hour=17, minute=0, second=0, microsecond=0)
-                lunch_start_time = current.replace(hour=12, minute=0, second=0, microsecond=0)
-                lunch_end_time = current.replace(hour=13, minute=0, second=0, microsecond=0)
-
-                if current < start_of_day:
-                    current = start_of_day
-
-                if current >= end_of_day:
-                    current += timedelta(days=1)
-                    continue
-
-                interval_start = current
-                interval_end = min(hora_fechamento, end_of_day)
-
-                if interval_start < lunch_start_time < interval_end:
-                    total_seconds += (lunch_start_time - interval_start).total_seconds()
-                    interval_start = lunch_end_time
-
-                if interval_start < lunch_end_time < interval_end:
-                    interval_start = lunch_end_time
-
-                if interval_start >= interval_end:
-                    current += timedelta(days=1)
-                    continue
-
-                total_seconds += (interval_end - interval_start).total_seconds()
-
-            current = current.replace(hour=0, minute=0, second=0, microsecond=0) + timedelta(days=1)
-
-        return total_seconds
+        total_seconds = calcular_tempo_decorrido_lote([hora_abertura], [hora_fechamento])[0]
+        if pd.isnull(total_seconds):
+            raise ValueError(f"Hora de abertura inválida: {hora_abertura}")
+        return float(total_seconds)
     except Exception as e:
         logger.error(f"Erro ao calcular tempo decorrido: {e}")
         return None
@@ -207,39 +138,26 @@ def formatar_tempo(total_seconds):
         logger.error(f"Erro ao formatar tempo: {e}")
         return "Erro no formato"
 
-def calculate_average_time(chamados):
-    total_tempo = 0
-    total_chamados_finalizados = 0
-    for chamado in chamados:
-        if chamado.hora_abertura and chamado.hora_fechamento:
-            tempo_segundos = calcular_tempo_decorrido(chamado.hora_abertura, chamado.hora_fechamento)
-            if tempo_segundos is not None:
-                total_tempo += tempo_segundos
-                total_chamados_finalizados += 1
-    if total_chamados_finalizados > 0:
-        media_tempo = total_tempo / total_chamados_finalizados
-        logger.info(f"Tempo médio de atendimento calculado: {media_tempo} segundos")
-    else:
-        media_tempo = 0
-        logger.info("Nenhum chamado finalizado para calcular tempo médio de atendimento.")
-    return media_tempo
-
-def show_average_time(chamados):
-    if chamados:
-        media_tempo_segundos = calculate_average_time(chamados)
-        tempo_formatado = formatar_tempo(media_tempo_segundos)
-        st.write(f'Tempo médio de atendimento: {tempo_formatado}')
-    else:
-        st.write('Nenhum chamado finalizado para calcular o tempo médio.')
-
 def finalizar_chamado(id_chamado, solucao, pecas_usadas=None):
     hora_fechamento = datetime.now(tz=local_tz)
-    with SessionLocal() as session:
+    with get_session() as session:
         try:
             chamado = session.query(Chamado).filter(Chamado.id == id_chamado).first()
             if chamado:
+                ja_finalizado = chamado.hora_fechamento is not None
+                tempo_anterior = chamado.tempo_decorrido_segundos or 0.0
                 chamado.solucao = solucao
                 chamado.hora_fechamento = hora_fechamento
+                chamado.tempo_decorrido_segundos = calcular_tempo_decorrido(chamado.hora_abertura, hora_fechamento)
+                atualizar_resumo_mensal(
+                    session,
+                    chamado.hora_abertura.strftime('%Y-%m'),
+                    chamado.ubs,
+                    chamado.setor,
+                    chamado.tipo_defeito,
+                    resolvidos=0 if ja_finalizado else 1,
+                    tempo_resolucao=(chamado.tempo_decorrido_segundos or 0.0) - (tempo_anterior if ja_finalizado else 0.0)
+                )
 
                 if pecas_usadas:
                     for peca in pecas_usadas:
@@ -278,75 +196,491 @@ def finalizar_chamado(id_chamado, solucao, pecas_usadas=None):
             logger.error(f"Erro ao finalizar chamado ID {id_chamado}: {e}")
             st.error("Erro interno ao finalizar chamado. Tente novamente mais tarde.")
 
-def list_chamados():
-    with SessionLocal() as session:
+# Completa a coluna de tempo decorrido calculando apenas as linhas sem valor armazenado
+# (chamados em aberto ou ainda não processados pelo backfill)
+def preencher_tempo_decorrido(df, coluna_tempo, coluna_abertura='Hora Abertura', coluna_fechamento='Hora Fechamento'):
+    if coluna_tempo not in df.columns:
+        df[coluna_tempo] = float('nan')
+    df[coluna_tempo] = pd.to_numeric(df[coluna_tempo], errors='coerce')
+    pendentes = df[coluna_tempo].isnull()
+    if pendentes.any():
+        df.loc[pendentes, coluna_tempo] = calcular_tempo_decorrido_lote(
+            df.loc[pendentes, coluna_abertura], df.loc[pendentes, coluna_fechamento]
+        )
+    return df
+
+# Prepara as datas de um DataFrame do painel de chamados: converte de UTC para o fuso horário
+# local e cria as colunas formatadas para exibição
+def preparar_datas_painel(df):
+    df['Hora Abertura'] = pd.to_datetime(df['Hora Abertura'], errors='coerce', utc=True)
+    df['Hora Fechamento'] = pd.to_datetime(df['Hora Fechamento'], errors='coerce', utc=True)
+    df['Hora Abertura'] = df['Hora Abertura'].dt.tz_convert(local_tz)
+    df['Hora Fechamento'] = df['Hora Fechamento'].dt.tz_convert(local_tz)
+    df['Hora Abertura Formatada'] = df['Hora Abertura'].dt.strftime('%d/%m/%Y - %H:%M:%S')
+    df['Hora Fechamento Formatada'] = df['Hora Fechamento'].dt.strftime('%d/%m/%Y - %H:%M:%S')
+    return df
+
+# Usa o tempo decorrido armazenado, calcula apenas o dos chamados ainda em aberto e formata para exibição
+def preparar_tempo_painel(df):
+    preencher_tempo_decorrido(df, 'Tempo Decorrido Segundos')
+    df['Tempo Decorrido'] = df['Tempo Decorrido Segundos'].apply(formatar_tempo)
+    return df
+
+# Calcula e grava o tempo decorrido dos chamados finalizados que ainda não o possuem, em lotes
+def backfill_tempo_decorrido(tamanho_lote=1000):
+    total_atualizado = 0
+    ultimo_id = 0
+    while True:
+        with SessionLocal() as session:
+            try:
+                lote = (
+                    session.query(Chamado.id, Chamado.hora_abertura, Chamado.hora_fechamento)
+                    .filter(
+                        Chamado.id > ultimo_id,
+                        Chamado.hora_fechamento.isnot(None),
+                        Chamado.tempo_decorrido_segundos.is_(None),
+                    )
+                    .order_by(Chamado.id)
+                    .limit(tamanho_lote)
+                    .all()
+                )
+                if not lote:
+                    break
+                ids, aberturas, fechamentos = zip(*lote)
+                tempos = calcular_tempo_decorrido_lote(list(aberturas), list(fechamentos))
+                atualizacoes = [
+                    {'id': id_chamado, 'tempo_decorrido_segundos': float(tempo)}
+                    for id_chamado, tempo in zip(ids, tempos)
+                    if pd.notnull(tempo)
+                ]
+                session.bulk_update_mappings(Chamado, atualizacoes)
+                session.commit()
+                total_atualizado += len(atualizacoes)
+                ultimo_id = ids[-1]
+                logger.info(f"Backfill de tempo decorrido: {total_atualizado} chamados atualizados (até ID {ultimo_id}).")
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Erro no backfill de tempo decorrido após o ID {ultimo_id}: {e}")
+                raise
+    return total_atualizado
+
+# Colunas dos chamados exibidas no painel de chamados técnicos ({rótulo: coluna})
+COLUNAS_PAINEL_CHAMADOS = {
+    'ID': Chamado.id,
+    'Usuário': Chamado.username,
+    'UBS': Chamado.ubs,
+    'Setor': Chamado.setor,
+    'Tipo de Defeito': Chamado.tipo_defeito,
+    'Problema': Chamado.problema,
+    'Hora Abertura': Chamado.hora_abertura,
+    'Solução': Chamado.solucao,
+    'Hora Fechamento': Chamado.hora_fechamento,
+    'Protocolo': Chamado.protocolo,
+    'Patrimônio': Chamado.patrimonio,
+    'Machine': Chamado.machine,
+    'Tempo Decorrido Segundos': Chamado.tempo_decorrido_segundos,
+}
+
+# Colunas dos chamados usadas nos dados mensais e no relatório mensal
+COLUNAS_DADOS_MENSAIS = {
+    'ID': Chamado.id,
+    'Usuário': Chamado.username,
+    'UBS': Chamado.ubs,
+    'Setor': Chamado.setor,
+    'Tipo de Defeito': Chamado.tipo_defeito,
+    'Problema': Chamado.problema,
+    'Hora Abertura': Chamado.hora_abertura,
+    'Solução': Chamado.solucao,
+    'Hora Fechamento': Chamado.hora_fechamento,
+    'Protocolo': Chamado.protocolo,
+    'Machine': Chamado.machine,
+    'Patrimonio': Chamado.patrimonio,
+    'Tempo Decorrido (s)': Chamado.tempo_decorrido_segundos,
+}
+
+# Monta os filtros SQL dos chamados a partir dos filtros da tela
+def _filtros_chamados(status=None, ubs=None, setor=None, data_inicio=None, data_fim=None, patrimonio=None):
+    filtros = []
+    if status == 'Em Aberto':
+        filtros.append(Chamado.hora_fechamento.is_(None))
+    elif status == 'Finalizado':
+        filtros.append(Chamado.hora_fechamento.isnot(None))
+    if ubs:
+        filtros.append(Chamado.ubs == ubs)
+    if setor:
+        filtros.append(Chamado.setor == setor)
+    if data_inicio:
+        filtros.append(Chamado.hora_abertura >= datetime.combine(data_inicio, time.min))
+    if data_fim:
+        filtros.append(Chamado.hora_abertura < datetime.combine(data_fim + timedelta(days=1), time.min))
+    if patrimonio:
+        filtros.append(Chamado.patrimonio == patrimonio)
+    return filtros
+
+# Função para buscar uma página de chamados com os filtros aplicados no banco.
+# A paginação é por keyset em (hora_abertura, id), do mais recente para o mais antigo:
+# 'cursor' é o 'proximo_cursor' devolvido pela página anterior (None para a primeira página).
+# Com 'colunas' ({rótulo: coluna}), a página vem como DataFrame tipado em vez de objetos do ORM.
+def buscar_chamados_paginados(status=None, ubs=None, setor=None, data_inicio=None, data_fim=None,
+                              patrimonio=None, cursor=None, tamanho_pagina=50, contar_total=True, colunas=None):
+    with get_session() as session:
         try:
-            chamados = session.query(Chamado).all()
-            logger.info("Lista de todos os chamados recuperada.")
-            return chamados
+            filtros = _filtros_chamados(status, ubs, setor, data_inicio, data_fim, patrimonio)
+            filtros_pagina = list(filtros)
+            if cursor is not None:
+                hora_cursor, id_cursor = cursor
+                filtros_pagina.append(or_(
+                    Chamado.hora_abertura < hora_cursor,
+                    and_(Chamado.hora_abertura == hora_cursor, Chamado.id < id_cursor)
+                ))
+            ordem = (Chamado.hora_abertura.desc(), Chamado.id.desc())
+            if colunas is None:
+                chamados = session.query(Chamado).filter(*filtros_pagina).order_by(*ordem).limit(tamanho_pagina + 1).all()
+                tem_mais = len(chamados) > tamanho_pagina
+                chamados = chamados[:tamanho_pagina]
+                proximo_cursor = (chamados[-1].hora_abertura, chamados[-1].id) if tem_mais else None
+            else:
+                # Colunas internas do cursor, retiradas do DataFrame devolvido
+                colunas_consulta = {**colunas, '_cursor_hora': Chamado.hora_abertura, '_cursor_id': Chamado.id}
+                df = carregar_dataframe(session, colunas_consulta, filtros_pagina, ordem, limite=tamanho_pagina + 1)
+                tem_mais = len(df) > tamanho_pagina
+                df = df.iloc[:tamanho_pagina]
+                ultima = df.iloc[-1] if tem_mais else None
+                proximo_cursor = (ultima['_cursor_hora'].to_pydatetime(), int(ultima['_cursor_id'])) if tem_mais else None
+                chamados = df.drop(columns=['_cursor_hora', '_cursor_id']).reset_index(drop=True)
+            total = session.query(func.count(Chamado.id)).filter(*filtros).scalar() if contar_total else None
+            logger.info(f"Página de chamados recuperada: {len(chamados)} registros.")
+            return {'chamados': chamados, 'proximo_cursor': proximo_cursor, 'total': total}
         except Exception as e:
-            logger.error(f"Erro ao listar chamados: {e}")
-            return []
+            session.rollback()
+            logger.error(f"Erro ao buscar página de chamados: {e}")
+            vazio = [] if colunas is None else pd.DataFrame(columns=list(colunas))
+            return {'chamados': vazio, 'proximo_cursor': None, 'total': 0}
+
+# Colunas disponíveis para as agregações dos gráficos
+COLUNAS_AGREGACAO = {
+    'UBS': Chamado.ubs,
+    'Tipo de Defeito': Chamado.tipo_defeito,
+    'Setor': Chamado.setor,
+}
+
+# Função para contar chamados agrupados por UBS, tipo de defeito ou setor (GROUP BY no banco)
+def contar_chamados_por(coluna, data_inicio=None, data_fim=None):
+    campo = COLUNAS_AGREGACAO[coluna]
+    quantidade = func.count(Chamado.id)
+    with get_session() as session:
+        try:
+            filtros = _filtros_chamados(data_inicio=data_inicio, data_fim=data_fim)
+            linhas = (
+                session.query(campo, quantidade)
+                .filter(*filtros)
+                .group_by(campo)
+                .order_by(quantidade.desc())
+                .all()
+            )
+            logger.info(f"Contagem de chamados por {coluna} recuperada.")
+            return pd.DataFrame(linhas, columns=[coluna, 'Quantidade'])
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao contar chamados por {coluna}: {e}")
+            return pd.DataFrame(columns=[coluna, 'Quantidade'])
 
-def list_chamados_em_aberto():
-    with SessionLocal() as session:
+# Função para calcular o tempo médio de atendimento dos chamados finalizados no banco.
+# Chamados finalizados antes do backfill (sem tempo gravado) são calculados na hora.
+def tempo_medio_atendimento(data_inicio=None, data_fim=None):
+    with get_session() as session:
+        try:
+            filtros = _filtros_chamados(status='Finalizado', data_inicio=data_inicio, data_fim=data_fim)
+            soma, quantidade = (
+                session.query(func.sum(Chamado.tempo_decorrido_segundos), func.count(Chamado.tempo_decorrido_segundos))
+                .filter(*filtros)
+                .one()
+            )
+            soma = soma or 0.0
+            quantidade = quantidade or 0
+            pendentes = (
+                session.query(Chamado.hora_abertura, Chamado.hora_fechamento)
+                .filter(*filtros, Chamado.tempo_decorrido_segundos.is_(None))
+                .all()
+            )
+            if pendentes:
+                tempos = pd.Series(calcular_tempo_decorrido_lote(
+                    [p.hora_abertura for p in pendentes], [p.hora_fechamento for p in pendentes]
+                )).dropna()
+                soma += tempos.sum()
+                quantidade += len(tempos)
+            media_tempo = soma / quantidade if quantidade else 0
+            logger.info(f"Tempo médio de atendimento calculado: {media_tempo} segundos")
+            return media_tempo
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao calcular tempo médio de atendimento: {e}")
+            return 0
+
+# Função para obter os chamados em aberto como DataFrame tipado (do mais recente para o mais antigo)
+def dataframe_chamados_em_aberto(colunas=COLUNAS_PAINEL_CHAMADOS):
+    with get_session() as session:
         try:
-            chamados = session.query(Chamado).filter(Chamado.hora_fechamento == None).all()
+            df = carregar_dataframe(
+                session, colunas, _filtros_chamados(status='Em Aberto'),
+                (Chamado.hora_abertura.desc(), Chamado.id.desc())
+            )
             logger.info("Lista de chamados em aberto recuperada.")
-            return chamados
+            return df
         except Exception as e:
+            session.rollback()
             logger.error(f"Erro ao listar chamados em aberto: {e}")
+            return pd.DataFrame(columns=list(colunas))
+
+# Função para recalcular todo o resumo mensal a partir da tabela de chamados
+def reconstruir_resumo_mensal():
+    backfill_tempo_decorrido()
+    mes = expressao_mes(Chamado.hora_abertura)
+    with SessionLocal() as session:
+        try:
+            linhas = (
+                session.query(
+                    mes,
+                    Chamado.ubs,
+                    Chamado.setor,
+                    Chamado.tipo_defeito,
+                    func.count(Chamado.id),
+                    func.count(Chamado.hora_fechamento),
+                    func.coalesce(func.sum(Chamado.tempo_decorrido_segundos), 0.0),
+                )
+                .group_by(mes, Chamado.ubs, Chamado.setor, Chamado.tipo_defeito)
+                .all()
+            )
+            session.query(ResumoMensalChamados).delete(synchronize_session=False)
+            session.bulk_insert_mappings(ResumoMensalChamados, [
+                {
+                    'mes': linha[0],
+                    'ubs': linha[1],
+                    'setor': linha[2],
+                    'tipo_defeito': linha[3],
+                    'total': linha[4],
+                    'resolvidos': linha[5],
+                    'soma_tempo_resolucao': float(linha[6]),
+                }
+                for linha in linhas
+            ])
+            session.commit()
+            logger.info(f"Resumo mensal reconstruído: {len(linhas)} grupos.")
+            return len(linhas)
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao reconstruir resumo mensal: {e}")
+            raise
+
+# Função para montar o resumo mensal caso ainda não exista (ex.: primeira execução após a atualização)
+def garantir_resumo_mensal():
+    with SessionLocal() as session:
+        resumo_vazio = session.query(ResumoMensalChamados.mes).first() is None
+        possui_chamados = session.query(Chamado.id).first() is not None
+    if resumo_vazio and possui_chamados:
+        reconstruir_resumo_mensal()
+
+# Função para listar os meses com chamados (mais recente primeiro), a partir do resumo mensal
+def list_meses_chamados():
+    with get_session() as session:
+        try:
+            meses = (
+                session.query(ResumoMensalChamados.mes)
+                .distinct()
+                .order_by(ResumoMensalChamados.mes.desc())
+                .all()
+            )
+            return [mes[0] for mes in meses]
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao listar meses dos chamados: {e}")
             return []
 
-def get_monthly_technical_data():
-    chamados = list_chamados()
-    data = []
-    for chamado in chamados:
-        data.append({
-            'ID': chamado.id,
-            'Usuário': chamado.username,
-            'UBS': chamado.ubs,
-            'Setor': chamado.setor,
-            'Tipo de Defeito': chamado.tipo_defeito,
-            'Problema': chamado.problema,
-            'Hora Abertura': chamado.hora_abertura,
-            'Solução': chamado.solucao,
-            'Hora Fechamento': chamado.hora_fechamento,
-            'Protocolo': chamado.protocolo,
-            'Machine': chamado.machine,
-            'Patrimonio': chamado.patrimonio
-        })
-    df = pd.DataFrame(data)
-    df['Hora Abertura'] = pd.to_datetime(df['Hora Abertura'], errors='coerce')
-    df['Hora Fechamento'] = pd.to_datetime(df['Hora Fechamento'], errors='coerce')
+# Função para obter os indicadores do mês a partir do resumo mensal
+def resumo_mensal(mes):
+    with get_session() as session:
+        try:
+            total, resolvidos, soma_tempo = (
+                session.query(
+                    func.sum(ResumoMensalChamados.total),
+                    func.sum(ResumoMensalChamados.resolvidos),
+                    func.sum(ResumoMensalChamados.soma_tempo_resolucao),
+                )
+                .filter(ResumoMensalChamados.mes == mes)
+                .one()
+            )
+            if not total:
+                return None
+
+            def mais_frequente(coluna):
+                quantidade = func.sum(ResumoMensalChamados.total)
+                linha = (
+                    session.query(coluna, quantidade)
+                    .filter(ResumoMensalChamados.mes == mes)
+                    .group_by(coluna)
+                    .order_by(quantidade.desc(), coluna)
+                    .first()
+                )
+                return linha[0] if linha else 'N/A'
+
+            return {
+                'total': int(total),
+                'resolvidos': int(resolvidos or 0),
+                'nao_resolvidos': int(total) - int(resolvidos or 0),
+                'tempo_medio_resolucao': (soma_tempo / resolvidos) if resolvidos else None,
+                'tipo_defeito_mais_comum': mais_frequente(ResumoMensalChamados.tipo_defeito),
+                'setor_mais_ativo': mais_frequente(ResumoMensalChamados.setor),
+                'ubs_mais_ativa': mais_frequente(ResumoMensalChamados.ubs),
+            }
+        except Exception as e:
+            session.rollback()
+            logger.error(f"Erro ao obter resumo do mês {mes}: {e}")
+            return None
+
+# Função para obter os chamados de um mês ('AAAA-MM'), ou de todos os meses se 'mes' for None,
+# junto com a lista de meses disponíveis no resumo mensal
+def get_monthly_technical_data(mes=None):
+    filtros = []
+    if mes:
+        inicio, fim = _intervalo_mes(mes)
+        filtros = _filtros_chamados(data_inicio=inicio, data_fim=fim)
+    with get_session() as session:
+        df = carregar_dataframe(
+            session, COLUNAS_DADOS_MENSAIS, filtros,
+            categorias=('UBS', 'Setor', 'Tipo de Defeito', 'Machine')
+        )
     df['Mês'] = df['Hora Abertura'].dt.to_period('M')
-    months_list = df['Mês'].astype(str).unique().tolist()
+    months_list = list_meses_chamados()
     logger.info("Dados mensais dos chamados técnicos preparados.")
     return df, months_list
 
-def save_plot_to_temp_file():
-    try:
-        with tempfile.NamedTemporaryFile(suffix='.png', delete=False) as tmpfile:
-            plt.savefig(tmpfile.name, format='png')
-            plt.close()
-            logger.info(f"Gráfico salvo temporariamente em {tmpfile.name}")
-            return tmpfile.name
-    except Exception as e:
-        logger.error(f"Erro ao salvar gráfico temporariamente: {e}")
-        return None
-
-def add_image_to_pdf(pdf, image_path, title):
+def add_image_to_pdf(pdf, imagem_png, title):
     try:
         pdf.set_font('Arial', 'B', 12)
         pdf.ln(10)
         pdf.cell(0, 10, title, ln=True, align='C')
-        pdf.image(image_path, x=10, y=pdf.get_y() + 10, w=270)
-        os.remove(image_path)
-        logger.info(f"Imagem {title} adicionada ao PDF e arquivo temporário removido.")
+        adicionar_png_ao_pdf(pdf, imagem_png, f'grafico:{title}', x=10, y=pdf.get_y() + 10, w=270)
+        logger.info(f"Imagem {title} adicionada ao PDF.")
     except Exception as e:
         logger.error(f"Erro ao adicionar imagem {title} ao PDF: {e}")
 
-def generate_monthly_report(df, selected_month, pecas_usadas_df=None, logo_path=None):
+# Colunas e larguras da tabela de detalhamento do relatório mensal
+COLUNAS_DETALHAMENTO = ['Protocolo', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema', 'Hora Abertura', 'Hora Fechamento', 'Tempo Decorrido', 'Peças Usadas']
+LARGURAS_DETALHAMENTO = [20, 40, 40, 35, 50, 30, 30, 30, 40]
+ALINHAMENTOS_DETALHAMENTO = ['C', 'C', 'C', 'C', 'L', 'C', 'C', 'C', 'L']
+
+# Função para gerar os gráficos do relatório a partir de séries já agregadas (índice = categoria).
+# Retorna uma lista de (PNG em bytes, título no PDF); 'perfil' escolhe o tamanho/dpi (ver graficos.py).
+def gerar_graficos_relatorio(chamados_por_ubs, chamados_por_defeito, tempo_medio_por_ubs, pecas_mais_usadas, perfil=None):
+    def grafico_barras(serie, titulo, xlabel, ylabel, rotacionar=True):
+        return {
+            'categorias': serie.index.astype(str).tolist(),
+            'valores': [float(valor) for valor in serie.values],
+            'titulo': titulo,
+            'xlabel': xlabel,
+            'ylabel': ylabel,
+            'rotacionar': rotacionar,
+        }
+
+    especificacoes = [
+        (grafico_barras(chamados_por_ubs, 'Número de Chamados por UBS', 'UBS', 'count'), 'Chamados por UBS'),
+        (grafico_barras(chamados_por_defeito, 'Número de Chamados por Tipo de Defeito', 'Tipo de Defeito', 'count'), 'Chamados por Tipo de Defeito'),
+        (grafico_barras(tempo_medio_por_ubs, 'Tempo Médio de Resolução por UBS', 'UBS', 'Tempo (segundos)'), 'Tempo Médio de Resolução por UBS'),
+    ]
+    if not pecas_mais_usadas.empty:
+        especificacoes.append((grafico_barras(pecas_mais_usadas, 'Peças Mais Usadas', 'Peça', 'Quantidade', rotacionar=False), 'Peças Mais Usadas'))
+
+    imagens = renderizar_graficos([especificacao for especificacao, _ in especificacoes], perfil)
+    return [(imagem, titulo_pdf) for imagem, (_, titulo_pdf) in zip(imagens, especificacoes)]
+
+# Desenha a página de resumo e as páginas de gráficos do relatório mensal
+def _desenhar_resumo_e_graficos(pdf, selected_month, indicadores, graficos, logo_path):
+    pdf.add_page()
+
+    if logo_path and os.path.exists(logo_path):
+        pdf.image(logo_path, x=10, y=8, w=30)
+    elif logo_path:
+        logger.warning("Logotipo não encontrado para inserção no relatório.")
+
+    pdf.set_font('Arial', 'B', 16)
+    pdf.cell(0, 10, f'Relatório Mensal de Chamados Técnicos - {selected_month}', ln=True, align='C')
+
+    pdf.set_font('Arial', '', 12)
+    pdf.ln(10)
+    pdf.cell(0, 10, f"Total de Chamados: {indicadores['total']}", ln=True)
+    pdf.cell(0, 10, f"Chamados Resolvidos: {indicadores['resolvidos']}", ln=True)
+    pdf.cell(0, 10, f"Chamados Não Resolvidos: {indicadores['nao_resolvidos']}", ln=True)
+    pdf.cell(0, 10, f"Tempo Médio de Resolução: {indicadores['tempo_medio_resolucao']}", ln=True)
+    pdf.cell(0, 10, f"Tipo de Defeito Mais Comum: {indicadores['tipo_defeito_mais_comum']}", ln=True)
+    pdf.cell(0, 10, f"Setor Mais Ativo: {indicadores['setor_mais_ativo']}", ln=True)
+    pdf.cell(0, 10, f"UBS Mais Ativa: {indicadores['ubs_mais_ativa']}", ln=True)
+    pdf.cell(0, 10, f"Total de Peças Usadas: {indicadores['total_pecas_usadas']}", ln=True)
+
+    pdf.ln(10)
+    pdf.set_font('Arial', 'B', 12)
+    pdf.cell(0, 10, 'Dashboard', ln=True, align='C')
+
+    for imagem_png, title in graficos:
+        pdf.add_page()
+        add_image_to_pdf(pdf, imagem_png, title)
+
+    pdf.add_page()
+
+    if logo_path and os.path.exists(logo_path):
+        pdf.image(logo_path, x=10, y=8, w=30)
+
+    pdf.set_font('Arial', 'B', 10)
+    pdf.cell(0, 10, 'Detalhamento dos Chamados', ln=True, align='C')
+
+    pdf.set_font('Arial', 'B', 10)
+    for largura, coluna in zip(LARGURAS_DETALHAMENTO, COLUNAS_DETALHAMENTO):
+        pdf.cell(largura, 8, coluna, border=1, align='C')
+    pdf.ln()
+    pdf.set_font('Arial', '', 8)
+
+# Formata um bloco de chamados (DataFrame) em linhas de texto da tabela de detalhamento, de forma vetorizada
+def _formatar_linhas_detalhamento(df):
+    def hora(coluna):
+        serie = pd.to_datetime(df[coluna], errors='coerce')
+        if serie.dt.tz is not None:
+            serie = serie.dt.tz_convert(local_tz)
+        return serie.dt.strftime('%d/%m/%Y %H:%M:%S').fillna('-')
+
+    def truncar(coluna, limite):
+        texto = df[coluna].astype(str)
+        return texto.where(texto.str.len() <= limite, texto.str[:limite - 3] + '...')
+
+    return zip(
+        df['Protocolo'].astype(str),
+        df['UBS'].astype(str),
+        df['Setor'].astype(str),
+        df['Tipo de Defeito'].astype(str),
+        truncar('Problema', 50),
+        hora('Hora Abertura'),
+        hora('Hora Fechamento'),
+        df['Tempo Decorrido (s)'].map(formatar_tempo),
+        truncar('peca_nome', 40),
+    )
+
+# Desenha as linhas de um bloco de chamados na tabela de detalhamento
+def _desenhar_linhas_detalhamento(pdf, df):
+    for linha in _formatar_linhas_detalhamento(df):
+        for largura, alinhamento, valor in zip(LARGURAS_DETALHAMENTO, ALINHAMENTOS_DETALHAMENTO, linha):
+            pdf.cell(largura, 8, valor, border=1, align=alinhamento)
+        pdf.ln()
+
+# Grava o PDF em um arquivo temporário "spooled" (em memória até o limite, depois em disco)
+def _pdf_para_arquivo(pdf, limite_memoria=5 * 1024 * 1024, tamanho_bloco=1024 * 1024):
+    arquivo = tempfile.SpooledTemporaryFile(max_size=limite_memoria)
+    conteudo = pdf.output(dest='S')
+    for inicio in range(0, len(conteudo), tamanho_bloco):
+        arquivo.write(conteudo[inicio:inicio + tamanho_bloco].encode('latin1'))
+    arquivo.seek(0)
+    return arquivo
+
+def generate_monthly_report(df, selected_month, pecas_usadas_df=None, logo_path=None, perfil_grafico=None):
+    from fpdf import FPDF
+
     try:
         if not isinstance(df, pd.DataFrame):
             raise ValueError("O argumento 'df' não é um DataFrame")
@@ -370,9 +704,7 @@ def generate_monthly_report(df, selected_month, pecas_usadas_df=None, logo_path=
             logger.info(f"Relatório mensal: nenhum dado para {selected_month}.")
             return None
 
-        df_filtered['Tempo Decorrido (s)'] = df_filtered.apply(
-            lambda row: calcular_tempo_decorrido(row['Hora Abertura'], row['Hora Fechamento']), axis=1
-        )
+        df_filtered = preencher_tempo_decorrido(df_filtered.copy(), 'Tempo Decorrido (s)')
 
         df_filtered = df_filtered.dropna(subset=['Tempo Decorrido (s)'])
 
@@ -388,132 +720,215 @@ def generate_monthly_report(df, selected_month, pecas_usadas_df=None, logo_path=
         else:
             df_filtered['peca_nome'] = 'Nenhuma'
 
-        total_chamados = len(df_filtered)
-        chamados_resolvidos = df_filtered['Hora Fechamento'].notnull().sum()
-        chamados_nao_resolvidos = total_chamados - chamados_resolvidos
-        tempo_medio_resolucao_seg = df_filtered['Tempo Decorrido (s)'].mean()
+        resumo = resumo_mensal(selected_month)
+        if resumo:
+            total_chamados = resumo['total']
+            chamados_resolvidos = resumo['resolvidos']
+            chamados_nao_resolvidos = resumo['nao_resolvidos']
+            tempo_medio_resolucao_seg = resumo['tempo_medio_resolucao']
+            tipo_defeito_mais_comum = resumo['tipo_defeito_mais_comum']
+            setor_mais_ativo = resumo['setor_mais_ativo']
+            ubs_mais_ativa = resumo['ubs_mais_ativa']
+        else:
+            total_chamados = len(df_filtered)
+            chamados_resolvidos = df_filtered['Hora Fechamento'].notnull().sum()
+            chamados_nao_resolvidos = total_chamados - chamados_resolvidos
+            tempo_medio_resolucao_seg = df_filtered['Tempo Decorrido (s)'].mean()
+            tipo_defeito_mais_comum = df_filtered['Tipo de Defeito'].mode()[0] if not df_filtered['Tipo de Defeito'].mode().empty else 'N/A'
+            setor_mais_ativo = df_filtered['Setor'].mode()[0] if not df_filtered['Setor'].mode().empty else 'N/A'
+            ubs_mais_ativa = df_filtered['UBS'].mode()[0] if not df_filtered['UBS'].mode().empty else 'N/A'
         tempo_medio_resolucao = formatar_tempo(tempo_medio_resolucao_seg) if pd.notnull(tempo_medio_resolucao_seg) else 'N/A'
-        tipo_defeito_mais_comum = df_filtered['Tipo de Defeito'].mode()[0] if not df_filtered['Tipo de Defeito'].mode().empty else 'N/A'
-        setor_mais_ativo = df_filtered['Setor'].mode()[0] if not df_filtered['Setor'].mode().empty else 'N/A'
-        ubs_mais_ativa = df_filtered['UBS'].mode()[0] if not df_filtered['UBS'].mode().empty else 'N/A'
 
         total_pecas_usadas = pecas_usadas_df['peca_nome'].count() if not pecas_usadas_df.empty else 0
         pecas_mais_usadas = pecas_usadas_df['peca_nome'].value_counts().head(5) if not pecas_usadas_df.empty else pd.Series([], dtype="int64")
 
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.countplot(data=df_filtered, x='UBS', order=df_filtered['UBS'].value_counts().index, ax=ax)
-        ax.set_title('Número de Chamados por UBS')
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
-        plt.tight_layout(pad=2.0)
-        chamados_por_ubs_chart = save_plot_to_temp_file()
-        plt.close(fig)
-
-        fig, ax = plt.subplots(figsize=(10, 6))
-        sns.countplot(data=df_filtered, x='Tipo de Defeito', order=df_filtered['Tipo de Defeito'].value_counts().index, ax=ax)
-        ax.set_title('Número de Chamados por Tipo de Defeito')
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
-        plt.tight_layout(pad=2.0)
-        chamados_por_defeito_chart = save_plot_to_temp_file()
-        plt.close(fig)
-
-        fig, ax = plt.subplots(figsize=(10, 6))
-        tempo_medio_por_ubs = df_filtered.groupby('UBS')['Tempo Decorrido (s)'].mean().reset_index()
-        sns.barplot(data=tempo_medio_por_ubs, x='UBS', y='Tempo Decorrido (s)', ax=ax)
-        ax.set_title('Tempo Médio de Resolução por UBS')
-        ax.set_ylabel('Tempo (segundos)')
-        ax.set_xticklabels(ax.get_xticklabels(), rotation=45)
-        plt.tight_layout(pad=2.0)
-        tempo_medio_por_ubs_chart = save_plot_to_temp_file()
-        plt.close(fig)
-
-        if not pecas_mais_usadas.empty:
-            fig, ax = plt.subplots(figsize=(10, 6))
-            sns.barplot(x=pecas_mais_usadas.index, y=pecas_mais_usadas.values, ax=ax)
-            ax.set_title('Peças Mais Usadas')
-            ax.set_xlabel('Peça')
-            ax.set_ylabel('Quantidade')
-            pecas_mais_usadas_chart = save_plot_to_temp_file()
-            plt.close(fig)
+        # Colunas categóricas contam também as categorias sem chamados no mês; só as presentes entram
+        graficos = gerar_graficos_relatorio(
+            df_filtered['UBS'].value_counts().loc[lambda contagem: contagem > 0],
+            df_filtered['Tipo de Defeito'].value_counts().loc[lambda contagem: contagem > 0],
+            df_filtered.groupby('UBS', observed=True)['Tempo Decorrido (s)'].mean(),
+            pecas_mais_usadas,
+            perfil=perfil_grafico
+        )
 
         pdf = FPDF(orientation='L')
-        pdf.add_page()
-
-        if logo_path and os.path.exists(logo_path):
-            pdf.image(logo_path, x=10, y=8, w=30)
-        elif logo_path:
-            logger.warning("Logotipo não encontrado para inserção no relatório.")
-
-        pdf.set_font('Arial', 'B', 16)
-        pdf.cell(0, 10, f'Relatório Mensal de Chamados Técnicos - {selected_month}', ln=True, align='C')
-
-        pdf.set_font('Arial', '', 12)
-        pdf.ln(10)
-        pdf.cell(0, 10, f'Total de Chamados: {total_chamados}', ln=True)
-        pdf.cell(0, 10, f'Chamados Resolvidos: {chamados_resolvidos}', ln=True)
-        pdf.cell(0, 10, f'Chamados Não Resolvidos: {chamados_nao_resolvidos}', ln=True)
-        pdf.cell(0, 10, f'Tempo Médio de Resolução: {tempo_medio_resolucao}', ln=True)
-        pdf.cell(0, 10, f'Tipo de Defeito Mais Comum: {tipo_defeito_mais_comum}', ln=True)
-        pdf.cell(0, 10, f'Setor Mais Ativo: {setor_mais_ativo}', ln=True)
-        pdf.cell(0, 10, f'UBS Mais Ativa: {ubs_mais_ativa}', ln=True)
-        pdf.cell(0, 10, f'Total de Peças Usadas: {total_pecas_usadas}', ln=True)
-
-        pdf.ln(10)
-        pdf.set_font('Arial', 'B', 12)
-        pdf.cell(0, 10, 'Dashboard', ln=True, align='C')
+        _desenhar_resumo_e_graficos(pdf, selected_month, {
+            'total': total_chamados,
+            'resolvidos': chamados_resolvidos,
+            'nao_resolvidos': chamados_nao_resolvidos,
+            'tempo_medio_resolucao': tempo_medio_resolucao,
+            'tipo_defeito_mais_comum': tipo_defeito_mais_comum,
+            'setor_mais_ativo': setor_mais_ativo,
+            'ubs_mais_ativa': ubs_mais_ativa,
+            'total_pecas_usadas': total_pecas_usadas,
+        }, graficos, logo_path)
+        _desenhar_linhas_detalhamento(pdf, df_filtered)
 
-        pdf.add_page()
-        add_image_to_pdf(pdf, chamados_por_ubs_chart, 'Chamados por UBS')
-
-        pdf.add_page()
-        add_image_to_pdf(pdf, chamados_por_defeito_chart, 'Chamados por Tipo de Defeito')
-
-        pdf.add_page()
-        add_image_to_pdf(pdf, tempo_medio_por_ubs_chart, 'Tempo Médio de Resolução por UBS')
-
-        if not pecas_mais_usadas.empty:
-            pdf.add_page()
-            add_image_to_pdf(pdf, pecas_mais_usadas_chart, 'Peças Mais Usadas')
+        pdf_content = pdf.output(dest='S').encode('latin1')
+        pdf_output = BytesIO(pdf_content)
 
-        pdf.add_page()
+        logger.info(f"Relatório mensal de chamados técnicos gerado para {selected_month}")
+        return pdf_output
+    except Exception as e:
+        logger.error(f"Erro ao gerar relatório mensal: {e}")
+        st.error("Erro ao gerar relatório. Tente novamente mais tarde.")
+        return None
 
-        if logo_path and os.path.exists(logo_path):
-            pdf.image(logo_path, x=10, y=8, w=30)
+# Primeiro e último dia de um mês no formato 'YYYY-MM'
+def _intervalo_mes(mes):
+    inicio = datetime.strptime(mes, '%Y-%m').date()
+    fim = (inicio + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+    return inicio, fim
 
-        pdf.set_font('Arial', 'B', 10)
-        pdf.cell(0, 10, 'Detalhamento dos Chamados', ln=True, align='C')
+# Gera o relatório mensal lendo os chamados do mês em blocos por um cursor no servidor, sem montar
+# um DataFrame do mês inteiro. Indicadores e gráficos vêm de agregações no banco. Retorna um
+# arquivo temporário "spooled" posicionado no início, ou None se não houver chamados no mês.
+def generate_monthly_report_streaming(selected_month, logo_path=None, tamanho_lote=500, perfil_grafico=None):
+    from fpdf import FPDF
 
-        columns = ['Protocolo', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema', 'Hora Abertura', 'Hora Fechamento', 'Tempo Decorrido', 'Peças Usadas']
-        col_widths = [20, 40, 40, 35, 50, 30, 30, 30, 40]
+    try:
+        resumo = resumo_mensal(selected_month)
+        if not resumo:
+            st.warning(f"Não há dados para o mês selecionado: {selected_month}.")
+            logger.info(f"Relatório mensal: nenhum dado para {selected_month}.")
+            return None
 
-        pdf.set_font('Arial', 'B', 10)
-        for i, col in enumerate(columns):
-            pdf.cell(col_widths[i], 8, col, border=1, align='C')
-        pdf.ln()
+        inicio, fim = _intervalo_mes(selected_month)
+        filtros_mes = _filtros_chamados(data_inicio=inicio, data_fim=fim)
+
+        with SessionLocal() as session:
+            quantidade_pecas = func.count(PecaUsada.id)
+            pecas = (
+                session.query(PecaUsada.peca_nome, quantidade_pecas)
+                .join(Chamado, PecaUsada.chamado_id == Chamado.id)
+                .filter(*filtros_mes)
+                .group_by(PecaUsada.peca_nome)
+                .order_by(quantidade_pecas.desc(), PecaUsada.peca_nome)
+                .all()
+            )
+            tempo_por_ubs = (
+                session.query(
+                    ResumoMensalChamados.ubs,
+                    func.sum(ResumoMensalChamados.soma_tempo_resolucao),
+                    func.sum(ResumoMensalChamados.resolvidos),
+                )
+                .filter(ResumoMensalChamados.mes == selected_month)
+                .group_by(ResumoMensalChamados.ubs)
+                .all()
+            )
+        pecas_mais_usadas = pd.Series({nome: quantidade for nome, quantidade in pecas[:5]}, dtype='int64')
+        tempo_medio_por_ubs = pd.Series(
+            {ubs: soma / resolvidos for ubs, soma, resolvidos in tempo_por_ubs if resolvidos},
+            dtype='float64'
+        )
 
-        pdf.set_font('Arial', '', 8)
-        for _, row in df_filtered.iterrows():
-            pdf.cell(col_widths[0], 8, str(row['Protocolo']), border=1, align='C')
-            pdf.cell(col_widths[1], 8, str(row['UBS']), border=1, align='C')
-            pdf.cell(col_widths[2], 8, str(row['Setor']), border=1, align='C')
-            pdf.cell(col_widths[3], 8, str(row['Tipo de Defeito']), border=1, align='C')
-            problema = str(row['Problema'])[:47] + '...' if len(str(row['Problema'])) > 50 else str(row['Problema'])
-            pdf.cell(col_widths[4], 8, problema, border=1, align='L')
-            hora_abertura_formatada = row['Hora Abertura'].astimezone(local_tz).strftime('%d/%m/%Y %H:%M:%S') if pd.notnull(row['Hora Abertura']) else '-'
-            hora_fechamento_formatada = row['Hora Fechamento'].astimezone(local_tz).strftime('%d/%m/%Y %H:%M:%S') if pd.notnull(row['Hora Fechamento']) else '-'
-            pdf.cell(col_widths[5], 8, hora_abertura_formatada, border=1, align='C')
-            pdf.cell(col_widths[6], 8, hora_fechamento_formatada, border=1, align='C')
-            tempo_formatado = formatar_tempo(row['Tempo Decorrido (s)'])
-            pdf.cell(col_widths[7], 8, tempo_formatado, border=1, align='C')
-            peca_nome = str(row['peca_nome'])[:37] + '...' if len(str(row['peca_nome'])) > 40 else str(row['peca_nome'])
-            pdf.cell(col_widths[8], 8, peca_nome, border=1, align='L')
-            pdf.ln()
+        graficos = gerar_graficos_relatorio(
+            contar_chamados_por('UBS', inicio, fim).set_index('UBS')['Quantidade'],
+            contar_chamados_por('Tipo de Defeito', inicio, fim).set_index('Tipo de Defeito')['Quantidade'],
+            tempo_medio_por_ubs,
+            pecas_mais_usadas,
+            perfil=perfil_grafico
+        )
 
-        pdf_content = pdf.output(dest='S').encode('latin1')
-        pdf_output = BytesIO(pdf_content)
+        pdf = FPDF(orientation='L')
+        tempo_medio = resumo['tempo_medio_resolucao']
+        _desenhar_resumo_e_graficos(pdf, selected_month, {
+            **resumo,
+            'tempo_medio_resolucao': formatar_tempo(tempo_medio) if tempo_medio is not None else 'N/A',
+            'total_pecas_usadas': sum(quantidade for _, quantidade in pecas),
+        }, graficos, logo_path)
+
+        colunas = ['ID', 'Protocolo', 'UBS', 'Setor', 'Tipo de Defeito', 'Problema',
+                   'Hora Abertura', 'Hora Fechamento', 'Tempo Decorrido (s)']
+        with SessionLocal() as session:
+            consulta = (
+                session.query(
+                    Chamado.id, Chamado.protocolo, Chamado.ubs, Chamado.setor, Chamado.tipo_defeito,
+                    Chamado.problema, Chamado.hora_abertura, Chamado.hora_fechamento,
+                    Chamado.tempo_decorrido_segundos,
+                )
+                .filter(*filtros_mes)
+                .order_by(Chamado.hora_abertura, Chamado.id)
+                .yield_per(tamanho_lote)
+            )
+            linhas = iter(consulta)
+            while True:
+                lote = list(islice(linhas, tamanho_lote))
+                if not lote:
+                    break
+                df_lote = pd.DataFrame.from_records(lote, columns=colunas)
+                df_lote = preencher_tempo_decorrido(df_lote, 'Tempo Decorrido (s)')
+                pecas_lote = (
+                    session.query(PecaUsada.chamado_id, PecaUsada.peca_nome)
+                    .filter(PecaUsada.chamado_id.in_(df_lote['ID'].tolist()))
+                    .all()
+                )
+                if pecas_lote:
+                    pecas_por_chamado = (
+                        pd.DataFrame.from_records(pecas_lote, columns=['chamado_id', 'peca_nome'])
+                        .groupby('chamado_id')['peca_nome'].agg(', '.join)
+                    )
+                    df_lote['peca_nome'] = df_lote['ID'].map(pecas_por_chamado).fillna('Nenhuma')
+                else:
+                    df_lote['peca_nome'] = 'Nenhuma'
+                _desenhar_linhas_detalhamento(pdf, df_lote)
 
-        logger.info(f"Relatório mensal de chamados técnicos gerado para {selected_month}")
+        pdf_output = _pdf_para_arquivo(pdf)
+        logger.info(f"Relatório mensal de chamados técnicos gerado para {selected_month} (modo streaming)")
         return pdf_output
     except Exception as e:
         logger.error(f"Erro ao gerar relatório mensal: {e}")
         st.error("Erro ao gerar relatório. Tente novamente mais tarde.")
         return None
+
+# Função para obter a "versão" dos dados de um mês: muda sempre que um chamado do mês é aberto,
+# finalizado ou recebe peças. Com chamados em aberto o tempo decorrido acompanha o relógio,
+# então a versão inclui também o minuto atual.
+def versao_dados_mes(mes):
+    inicio, fim = _intervalo_mes(mes)
+    filtros_mes = _filtros_chamados(data_inicio=inicio, data_fim=fim)
+    with get_session() as session:
+        total, ultimo_id, fechados, ultimo_fechamento = (
+            session.query(
+                func.count(Chamado.id),
+                func.max(Chamado.id),
+                func.count(Chamado.hora_fechamento),
+                func.max(Chamado.hora_fechamento),
+            )
+            .filter(*filtros_mes)
+            .one()
+        )
+        pecas, ultima_peca = (
+            session.query(func.count(PecaUsada.id), func.max(PecaUsada.id))
+            .join(Chamado, PecaUsada.chamado_id == Chamado.id)
+            .filter(*filtros_mes)
+            .one()
+        )
+    versao = [total, ultimo_id, fechados, str(ultimo_fechamento), pecas, ultima_peca]
+    if total != fechados:
+        versao.append(datetime.now(tz=local_tz).strftime('%Y-%m-%d %H:%M'))
+    return versao
+
+# Função para obter o PDF do relatório mensal (bytes) do cache de relatórios, gerando-o só quando
+# os dados do mês, o logotipo ou o perfil dos gráficos mudaram
+def gerar_relatorio_mensal_em_cache(selected_month, logo_path=None, perfil_grafico=None):
+    try:
+        versao = versao_dados_mes(selected_month)
+    except Exception as e:
+        logger.error(f"Erro ao obter versão dos dados do mês {selected_month}: {e}")
+        st.error("Erro ao gerar relatório. Tente novamente mais tarde.")
+        return None
+    if not versao[0]:
+        st.warning(f"Não há dados para o mês selecionado: {selected_month}.")
+        return None
+
+    parametros = {
+        'mes': selected_month,
+        'logo': logo_path,
+        'logo_mtime': os.path.getmtime(logo_path) if logo_path and os.path.exists(logo_path) else None,
+        'perfil_grafico': get_perfil_grafico(perfil_grafico),
+    }
+    return get_cache_relatorios().obter_ou_gerar(
+        'relatorio_mensal_chamados', parametros, versao,
+        lambda: generate_monthly_report_streaming(selected_month, logo_path=logo_path, perfil_grafico=perfil_grafico)
+    )
@@ -0,0 +1,211 @@
+# dados_sinteticos.py
+# Geração de dados sintéticos (UBSs, setores, inventário, chamados, peças usadas e histórico de
+# manutenção) para testes de desempenho. As linhas são inseridas em lotes com executemany, direto
+# nas tabelas. Nunca usar em um banco de produção.
+#
+# Distribuição dos chamados no tempo, para se parecer com o uso real:
+# - volume crescente ao longo do período (o último mês tem cerca de 50% mais chamados que o primeiro);
+# - poucos chamados nos fins de semana e concentração no horário de expediente (picos de manhã e à tarde);
+# - tempo até o fechamento com distribuição log-normal (mediana de algumas horas, cauda de dias);
+# - chamados cujo fechamento ainda não chegou continuam em aberto, além de um pequeno acúmulo antigo.
+import math
+import random
+import logging
+from datetime import datetime, timedelta
+from itertools import accumulate
+from zoneinfo import ZoneInfo
+from sqlalchemy import insert, func, select, text
+from database import Inventario, Chamado, PecaUsada, HistoricoManutencao, UBS, Setor
+
+logger = logging.getLogger(__name__)
+
+# Definir o fuso horário local (o mesmo usado pela aplicação ao abrir chamados)
+local_tz = ZoneInfo('America/Sao_Paulo')
+
+_SETORES_BASE = ['Recepção', 'TI', 'Farmácia', 'Enfermagem', 'Odontologia', 'Vacinação', 'Administração',
+                 'Consultório 1', 'Consultório 2', 'Triagem', 'Laboratório', 'Almoxarifado']
+
+DEFEITOS_POR_TIPO = {
+    'Computador': ['Computador não liga', 'Computador lento', 'Tela azul', 'Sistema travando', 'Erro de disco',
+                   'Problema com atualização', 'Problemas de internet', 'Sem conexão de rede', 'Mouse não funciona'],
+    'Impressora': ['Impressora não imprime', 'Impressão borrada', 'Toner vazio', 'Troca de toner', 'Papel enroscado'],
+    'Monitor': ['Solicitação de suporte geral', 'Outros tipos de defeito'],
+}
+PECAS = ['Placa Mãe', 'Fonte', 'Memória RAM', 'HD', 'SSD', 'Teclado', 'Mouse', 'Monitor', 'Cabo de Rede',
+         'Placa de Rede', 'Processador', 'Cooler', 'Fonte da Impressora', 'Cartucho', 'Toner']
+
+# Peso de cada hora do dia na abertura de chamados (0h a 23h)
+_PESOS_HORAS = [0, 0, 0, 0, 0, 0, 1, 4, 10, 12, 11, 8, 4, 7, 10, 9, 7, 4, 2, 1, 1, 0, 0, 0]
+# Peso de cada dia da semana (segunda a domingo)
+_PESOS_DIAS_SEMANA = [1.0, 1.0, 1.0, 1.0, 0.9, 0.08, 0.03]
+# Tempo até o fechamento (minutos): log-normal com mediana de 4 horas, entre 5 minutos e 30 dias
+_FECHAMENTO_MEDIANA_MINUTOS = 240
+_FECHAMENTO_SIGMA = 1.3
+_FECHAMENTO_MAXIMO_MINUTOS = 30 * 24 * 60
+
+# Palavras usadas nos textos de problema e solução; a frequência decai com a posição (como em texto real)
+_PALAVRAS = (
+    "computador impressora monitor não liga lento travando sistema esus senha expirada rede internet wifi cabo "
+    "toner papel enroscado tela azul fonte queimada teclado mouse atualização windows reiniciado trocado "
+    "configurado limpeza memória disco cheio backup usuário bloqueado certificado digital prontuário receita "
+    "agendamento leitor biométrico scanner etiqueta driver reinstalado conector oxidado estabilizador nobreak"
+).split()
+_PESOS_PALAVRAS = [1 / (posicao + 1) for posicao in range(len(_PALAVRAS))]
+
+# Nomes das UBSs sintéticas
+def nomes_ubs(quantidade):
+    return [f"UBS Sintética {numero:02d}" for numero in range(1, quantidade + 1)]
+
+# Nomes dos setores sintéticos: os setores comuns das UBSs e, se precisar de mais, setores numerados
+def nomes_setores(quantidade):
+    extras = [f"Setor {numero:02d}" for numero in range(1, max(quantidade - len(_SETORES_BASE), 0) + 1)]
+    return (_SETORES_BASE + extras)[:quantidade]
+
+def _texto(gerador, palavras):
+    return ' '.join(gerador.choices(_PALAVRAS, _PESOS_PALAVRAS, k=palavras))
+
+def _inserir_em_lotes(conexao, tabela, linhas, tamanho_lote):
+    lote = []
+    total = 0
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho_lote:
+            conexao.execute(insert(tabela), lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        conexao.execute(insert(tabela), lote)
+        total += len(lote)
+    return total
+
+# Quantidade sorteada com média 'taxa' (parte inteira garantida e a fração como probabilidade)
+def _quantidade(gerador, taxa):
+    inteira = int(taxa)
+    return inteira + (gerador.random() < taxa - inteira)
+
+# Sorteador de horários de abertura no período: dias com peso pelo dia da semana e pelo crescimento
+# do volume, horas com peso pelo expediente. Nenhuma abertura passa de 'agora'.
+def _sorteador_aberturas(gerador, inicio, agora):
+    dias = (agora - inicio).days + 1
+    datas = [inicio.date() + timedelta(days=numero) for numero in range(dias)]
+    pesos_dias = [_PESOS_DIAS_SEMANA[data.weekday()] * (1 + 0.5 * numero / dias) for numero, data in enumerate(datas)]
+    acumulado_dias = list(accumulate(pesos_dias))
+    acumulado_horas = list(accumulate(_PESOS_HORAS))
+
+    def sortear():
+        data = gerador.choices(datas, cum_weights=acumulado_dias)[0]
+        hora = gerador.choices(range(24), cum_weights=acumulado_horas)[0]
+        abertura = datetime(data.year, data.month, data.day, hora, gerador.randrange(60), gerador.randrange(60))
+        return min(abertura, agora)
+    return sortear
+
+# Função para gerar os dados sintéticos no banco 'bind' (engine). Os chamados são distribuídos ao
+# longo de 'meses' meses até hoje (ver a distribuição no início do arquivo), com 'percentual_abertos'
+# de chamados antigos ainda em aberto. 'inventario', 'pecas' e 'historico' são calculados a partir
+# da quantidade de chamados quando não informados; peças e histórico são aproximados (sorteados por
+# chamado finalizado). O tempo decorrido fica vazio: é calculado pelo backfill, em horário de expediente.
+# Retorna as quantidades inseridas por tabela.
+def gerar_dados_sinteticos(bind, chamados=100_000, inventario=None, ubs=30, setores=12, pecas=None,
+                           historico=None, meses=24, percentual_abertos=0.02, semente=700, tamanho_lote=5000):
+    gerador = random.Random(semente)
+    inventario = inventario or max(chamados // 20, 10)
+    pecas = chamados // 2 if pecas is None else pecas
+    historico = chamados // 3 if historico is None else historico
+    lista_ubs = nomes_ubs(ubs)
+    lista_setores = nomes_setores(setores)
+    agora = datetime.now(tz=local_tz).replace(tzinfo=None, microsecond=0)
+    inicio = (agora - timedelta(days=30 * meses)).replace(hour=0, minute=0, second=0)
+    sortear_abertura = _sorteador_aberturas(gerador, inicio, agora)
+    # Médias por chamado finalizado
+    finalizados_estimados = max(chamados * (1 - percentual_abertos), 1)
+    taxa_pecas = pecas / finalizados_estimados
+    taxa_historico = historico / finalizados_estimados
+    quantidades = {}
+
+    with bind.begin() as conexao:
+        # UBSs e setores que ainda não existem
+        ubs_existentes = set(conexao.execute(select(UBS.nome_ubs)).scalars())
+        setores_existentes = set(conexao.execute(select(Setor.nome_setor)).scalars())
+        novas_ubs = [{'nome_ubs': nome} for nome in lista_ubs if nome not in ubs_existentes]
+        novos_setores = [{'nome_setor': nome} for nome in lista_setores if nome not in setores_existentes]
+        if novas_ubs:
+            conexao.execute(insert(UBS), novas_ubs)
+        if novos_setores:
+            conexao.execute(insert(Setor), novos_setores)
+        quantidades['ubs'] = len(novas_ubs)
+        quantidades['setores'] = len(novos_setores)
+
+        # Patrimônios sintéticos começam depois do maior id do inventário, para não colidir com os reais
+        base_patrimonio = 9_000_000 + (conexao.execute(select(func.max(Inventario.id))).scalar() or 0)
+        maquinas = []
+        for numero in range(inventario):
+            tipo = gerador.choice(list(DEFEITOS_POR_TIPO))
+            maquinas.append({
+                'numero_patrimonio': str(base_patrimonio + numero),
+                'tipo': tipo,
+                'marca': gerador.choice(['Dell', 'HP', 'Lenovo', 'Positivo', 'Epson', 'Brother', 'LG']),
+                'modelo': f"Modelo {gerador.randint(100, 999)}",
+                'numero_serie': f"SN{gerador.randint(10**7, 10**8 - 1)}",
+                'status': gerador.choices(['Ativo', 'Em Manutenção', 'Inativo'], [90, 7, 3])[0],
+                'localizacao': gerador.choice(lista_ubs),
+                'propria_locada': gerador.choice(['Própria', 'Locada']),
+                'setor': gerador.choice(lista_setores),
+            })
+        quantidades['inventario'] = _inserir_em_lotes(conexao, Inventario.__table__, iter(maquinas), tamanho_lote)
+        # Algumas máquinas dão muito mais chamados que outras
+        acumulado_maquinas = list(accumulate(gerador.lognormvariate(0, 0.8) for _ in maquinas))
+
+        primeiro_id = (conexao.execute(select(func.max(Chamado.id))).scalar() or 0) + 1
+        primeiro_protocolo = (conexao.execute(select(func.max(Chamado.protocolo))).scalar() or 0) + 1
+        # (id, patrimônio, fechamento, peças, registros de histórico) dos finalizados sorteados
+        manutencoes = []
+
+        def linhas_chamados():
+            for numero in range(chamados):
+                maquina = gerador.choices(maquinas, cum_weights=acumulado_maquinas)[0]
+                abertura = sortear_abertura()
+                minutos = gerador.lognormvariate(math.log(_FECHAMENTO_MEDIANA_MINUTOS), _FECHAMENTO_SIGMA)
+                fechamento = abertura + timedelta(minutes=min(max(minutos, 5), _FECHAMENTO_MAXIMO_MINUTOS))
+                if fechamento > agora or gerador.random() < percentual_abertos:
+                    fechamento = None
+                chamado_id = primeiro_id + numero
+                if fechamento:
+                    quantidade_pecas = _quantidade(gerador, taxa_pecas)
+                    quantidade_historico = _quantidade(gerador, taxa_historico)
+                    if quantidade_pecas or quantidade_historico:
+                        manutencoes.append((chamado_id, maquina['numero_patrimonio'], fechamento,
+                                            quantidade_pecas, quantidade_historico))
+                yield {
+                    'id': chamado_id,
+                    'username': f"usuario{gerador.randint(1, 200)}",
+                    'ubs': maquina['localizacao'],
+                    'setor': maquina['setor'],
+                    'tipo_defeito': gerador.choice(DEFEITOS_POR_TIPO[maquina['tipo']]),
+                    'problema': _texto(gerador, gerador.randint(6, 20)),
+                    'hora_abertura': abertura,
+                    'solucao': _texto(gerador, gerador.randint(4, 12)) if fechamento else None,
+                    'hora_fechamento': fechamento,
+                    'protocolo': primeiro_protocolo + numero,
+                    'machine': maquina['tipo'],
+                    'patrimonio': maquina['numero_patrimonio'],
+                    'tempo_decorrido_segundos': None,
+                }
+
+        quantidades['chamados'] = _inserir_em_lotes(conexao, Chamado.__table__, linhas_chamados(), tamanho_lote)
+        if bind.dialect.name == 'postgresql':
+            # Os ids foram informados explicitamente; a sequence do id precisa continuar depois deles
+            conexao.execute(text("SELECT setval(pg_get_serial_sequence('chamados', 'id'), (SELECT MAX(id) FROM chamados))"))
+
+        quantidades['peca_usada'] = _inserir_em_lotes(conexao, PecaUsada.__table__, (
+            {'chamado_id': chamado_id, 'peca_nome': gerador.choice(PECAS), 'data_uso': fechamento}
+            for chamado_id, _, fechamento, quantidade_pecas, _ in manutencoes
+            for _ in range(quantidade_pecas)
+        ), tamanho_lote)
+        quantidades['historico_manutencao'] = _inserir_em_lotes(conexao, HistoricoManutencao.__table__, (
+            {'numero_patrimonio': patrimonio, 'descricao': f"Chamado finalizado: {_texto(gerador, 5)}", 'data_manutencao': fechamento}
+            for _, patrimonio, fechamento, _, quantidade_historico in manutencoes
+            for _ in range(quantidade_historico)
+        ), tamanho_lote)
+
+    logger.info(f"Dados sintéticos gerados: {quantidades}")
+    return quantidades
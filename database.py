@@ -1,10 +1,17 @@
 # database.py
 import os
 import sys
+import time
 import logging
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, DateTime
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from sqlalchemy import create_engine, event, Column, Index, Integer, String, ForeignKey, DateTime, Float, Sequence, func, inspect, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.exc import TimeoutError as PoolTimeoutError
 from sqlalchemy.orm import declarative_base, sessionmaker, relationship
-import bcrypt
+from sqlalchemy.pool import QueuePool
+from senhas import gerar_hash_senha, verificar_senha, precisa_rehash
 
 # Configuração do logging
 logging.basicConfig(
@@ -21,10 +28,162 @@ if not DATABASE_URL:
     logging.error("DATABASE_URL não está definido nas variáveis de ambiente.")
     raise ValueError("DATABASE_URL não está definido nas variáveis de ambiente.")
 
-engine = create_engine(DATABASE_URL)
+# Configurações do pool de conexões usando variáveis de ambiente
+DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', '5'))
+DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', '10'))
+DB_POOL_TIMEOUT = float(os.getenv('DB_POOL_TIMEOUT', '30'))
+DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', '1800'))
+DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').strip().lower() in ('1', 'true', 'sim', 'yes')
+
+# Acrescenta ao pool do dialeto a medição do tempo de espera no checkout e contadores de uso
+class MetricasPoolMixin:
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._metricas_lock = threading.Lock()
+        self._metricas = {
+            'checkouts': 0,
+            'em_uso': 0,
+            'pico_em_uso': 0,
+            'timeouts': 0,
+            'espera_total': 0.0,
+            'espera_maxima': 0.0,
+            'espera_ultima': 0.0,
+        }
+        event.listen(self, 'checkin', self._registrar_checkin)
+
+    def connect(self):
+        inicio = time.perf_counter()
+        try:
+            conexao = super().connect()
+        except PoolTimeoutError:
+            with self._metricas_lock:
+                self._metricas['timeouts'] += 1
+            raise
+        espera = time.perf_counter() - inicio
+        with self._metricas_lock:
+            metricas = self._metricas
+            metricas['checkouts'] += 1
+            metricas['em_uso'] += 1
+            metricas['pico_em_uso'] = max(metricas['pico_em_uso'], metricas['em_uso'])
+            metricas['espera_total'] += espera
+            metricas['espera_maxima'] = max(metricas['espera_maxima'], espera)
+            metricas['espera_ultima'] = espera
+        return conexao
+
+    def _registrar_checkin(self, dbapi_connection, connection_record):
+        with self._metricas_lock:
+            self._metricas['em_uso'] = max(self._metricas['em_uso'] - 1, 0)
+
+    # recreate() é usado pelo SQLAlchemy para trocar o pool; a cópia precisa manter a classe com métricas
+    def recreate(self):
+        novo = super().recreate()
+        with self._metricas_lock:
+            novo._metricas.update(self._metricas, em_uso=0)
+        return novo
+
+    def metricas(self):
+        with self._metricas_lock:
+            metricas = dict(self._metricas)
+        metricas['espera_media'] = metricas['espera_total'] / metricas['checkouts'] if metricas['checkouts'] else 0.0
+        return metricas
+
+# Função para montar os argumentos do engine a partir das configurações do pool
+def _configuracao_engine(url):
+    url = make_url(url)
+    classe_pool = url.get_dialect().get_pool_class(url)
+    kwargs = {
+        'poolclass': type(f'{classe_pool.__name__}ComMetricas', (MetricasPoolMixin, classe_pool), {}),
+        'pool_pre_ping': DB_POOL_PRE_PING,
+        'pool_recycle': DB_POOL_RECYCLE,
+    }
+    if issubclass(classe_pool, QueuePool):
+        kwargs.update(
+            pool_size=DB_POOL_SIZE,
+            max_overflow=DB_MAX_OVERFLOW,
+            pool_timeout=DB_POOL_TIMEOUT,
+        )
+    return kwargs
+
+engine = create_engine(DATABASE_URL, **_configuracao_engine(DATABASE_URL))
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Sessão da página (unit of work): aberta uma vez por rerun pelo roteador de páginas do OS700
+# e compartilhada por todos os helpers chamados durante a renderização
+_sessao_pagina = ContextVar('sessao_pagina', default=None)
+
+# Sessão compartilhada entregue aos helpers: close() e o fim do bloco "with" não fecham a sessão,
+# que pertence à página; um erro dentro do bloco desfaz a transação para não contaminar os próximos helpers
+class SessaoCompartilhada:
+    def __init__(self, session):
+        self._session = session
+
+    def __getattr__(self, nome):
+        return getattr(self._session, nome)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, tipo_erro, erro, traceback):
+        if tipo_erro is not None:
+            self._session.rollback()
+        return False
+
+    def close(self):
+        pass
+
+# Função para os helpers obterem uma sessão: a da página, se houver uma aberta, ou uma sessão
+# nova (execução avulsa, ex.: manage.py). Use como "session = get_session()" ou "with get_session() as session"
+def get_session():
+    atual = _sessao_pagina.get()
+    if atual is not None:
+        return SessaoCompartilhada(atual)
+    return SessionLocal()
+
+# Abre a sessão da página para o bloco; ao final a sessão é fechada (o que não foi confirmado
+# com commit pelos helpers é descartado)
+@contextmanager
+def sessao_da_pagina():
+    # Sem expirar no commit: objetos lidos por um helper continuam utilizáveis depois que outro helper confirma
+    session = SessionLocal(expire_on_commit=False)
+    token = _sessao_pagina.set(session)
+    try:
+        yield session
+    except BaseException:
+        session.rollback()
+        raise
+    finally:
+        _sessao_pagina.reset(token)
+        session.close()
+
+# Função para obter as estatísticas atuais do pool de conexões (para log e exibição)
+def get_pool_stats():
+    pool = engine.pool
+    estatisticas = {
+        'pool': type(pool).__name__,
+        'tamanho': pool.size() if hasattr(pool, 'size') else None,
+        'em_uso': pool.checkedout() if hasattr(pool, 'checkedout') else None,
+        'ociosas': pool.checkedin() if hasattr(pool, 'checkedin') else None,
+        'overflow': pool.overflow() if hasattr(pool, 'overflow') else None,
+        'max_overflow': DB_MAX_OVERFLOW if isinstance(pool, QueuePool) else None,
+        'timeout': DB_POOL_TIMEOUT if isinstance(pool, QueuePool) else None,
+    }
+    if isinstance(pool, MetricasPoolMixin):
+        estatisticas.update(pool.metricas())
+    return estatisticas
+
+# Função para registrar as estatísticas do pool no log
+def log_pool_stats():
+    estatisticas = get_pool_stats()
+    logging.info(
+        "Pool de conexões: %(em_uso)s em uso, %(ociosas)s ociosas, overflow %(overflow)s, "
+        "%(checkouts)s checkouts, espera média %(espera_media).4fs, máxima %(espera_maxima).4fs, "
+        "%(timeouts)s timeouts." % {
+            'checkouts': 0, 'espera_media': 0.0, 'espera_maxima': 0.0, 'timeouts': 0, **estatisticas
+        }
+    )
+    return estatisticas
+
 # Definição dos modelos ORM
 
 class Inventario(Base):
@@ -39,11 +198,19 @@ class Inventario(Base):
     localizacao = Column(String(100), nullable=False)
     propria_locada = Column(String(20), nullable=False)
     setor = Column(String(50), nullable=False)
+    atualizado_em = Column(DateTime, default=func.now(), onupdate=func.now())
     historico = relationship(
         "HistoricoManutencao",
         back_populates="inventario",
         cascade="all, delete-orphan"
     )
+    # Chamados da máquina (chamados.patrimonio não é chave estrangeira; relação só para leitura)
+    chamados = relationship(
+        "Chamado",
+        primaryjoin="Inventario.numero_patrimonio == foreign(Chamado.patrimonio)",
+        viewonly=True,
+        order_by="Chamado.hora_abertura.desc()"
+    )
 
     def __repr__(self):
         return f"<Inventario(numero_patrimonio='{self.numero_patrimonio}', tipo='{self.tipo}')>"
@@ -75,8 +242,12 @@ class HistoricoManutencao(Base):
     def __repr__(self):
         return f"<HistoricoManutencao(numero_patrimonio='{self.numero_patrimonio}', data_manutencao='{self.data_manutencao}')>"
 
+# Sequence usada para numerar os protocolos no PostgreSQL (o número volta no próprio INSERT)
+protocolo_seq = Sequence('chamados_protocolo_seq')
+
 class Chamado(Base):
     __tablename__ = 'chamados'
+    __mapper_args__ = {'eager_defaults': True}
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String(50), nullable=False)
     ubs = Column(String(100), nullable=False)
@@ -86,9 +257,10 @@ class Chamado(Base):
     hora_abertura = Column(DateTime, nullable=False)
     solucao = Column(String(500))
     hora_fechamento = Column(DateTime)
-    protocolo = Column(Integer, unique=True, nullable=False, index=True)
+    protocolo = Column(Integer, protocolo_seq, unique=True, nullable=False, index=True)
     machine = Column(String(100))
     patrimonio = Column(String(50))
+    tempo_decorrido_segundos = Column(Float)
     pecas_usadas = relationship(
         "PecaUsada",
         back_populates="chamado",
@@ -109,6 +281,76 @@ class PecaUsada(Base):
     def __repr__(self):
         return f"<PecaUsada(peca_nome='{self.peca_nome}', chamado_id='{self.chamado_id}')>"
 
+# Índices para as consultas mais frequentes. Bancos novos recebem os índices no create_all;
+# bancos existentes, pela migração 5 (create_indexes).
+INDICES_CONSULTA = [
+    # Chamados em aberto, do mais recente para o mais antigo (índice parcial no PostgreSQL e no SQLite)
+    Index(
+        'ix_chamados_em_aberto', Chamado.hora_abertura, Chamado.id,
+        postgresql_where=Chamado.hora_fechamento.is_(None),
+        sqlite_where=Chamado.hora_fechamento.is_(None),
+    ),
+    # Intervalos de datas (mês dos relatórios) e paginação por (hora_abertura, id)
+    Index('ix_chamados_hora_abertura', Chamado.hora_abertura, Chamado.id),
+    # Relatórios e filtros por UBS dentro de um período
+    Index('ix_chamados_ubs_hora_abertura', Chamado.ubs, Chamado.hora_abertura),
+    # Chamados e peças de uma máquina (lista do inventário e histórico de manutenção)
+    Index('ix_chamados_patrimonio', Chamado.patrimonio),
+    Index('ix_peca_usada_chamado_id', PecaUsada.chamado_id),
+    Index('ix_historico_manutencao_numero_patrimonio', HistoricoManutencao.numero_patrimonio),
+]
+
+# Resumo mensal dos chamados (mês de abertura), mantido incrementalmente na abertura e no fechamento
+class ResumoMensalChamados(Base):
+    __tablename__ = 'resumo_mensal_chamados'
+    mes = Column(String(7), primary_key=True)
+    ubs = Column(String(100), primary_key=True)
+    setor = Column(String(100), primary_key=True)
+    tipo_defeito = Column(String(100), primary_key=True)
+    total = Column(Integer, default=0, nullable=False)
+    resolvidos = Column(Integer, default=0, nullable=False)
+    soma_tempo_resolucao = Column(Float, default=0.0, nullable=False)
+
+    def __repr__(self):
+        return f"<ResumoMensalChamados(mes='{self.mes}', ubs='{self.ubs}', total='{self.total}')>"
+
+# Contador de protocolos para bancos sem suporte a sequences (SQLite)
+class ContadorProtocolo(Base):
+    __tablename__ = 'contador_protocolo'
+    id = Column(Integer, primary_key=True)
+    valor = Column(Integer, nullable=False, default=0)
+
+    def __repr__(self):
+        return f"<ContadorProtocolo(valor='{self.valor}')>"
+
+# Fila de saída (outbox) das notificações de novos chamados, uma linha por destinatário
+class NotificacaoOutbox(Base):
+    __tablename__ = 'notificacoes_outbox'
+    id = Column(Integer, primary_key=True, index=True)
+    chamado_id = Column(Integer, ForeignKey('chamados.id'), nullable=False, index=True)
+    destinatario = Column(String(50), nullable=False)
+    mensagem = Column(String(1000), nullable=False)
+    status = Column(String(20), default='pendente', nullable=False, index=True)
+    tentativas = Column(Integer, default=0, nullable=False)
+    proxima_tentativa = Column(DateTime, nullable=False)
+    ultimo_erro = Column(String(500))
+    sid = Column(String(64))
+    criado_em = Column(DateTime, nullable=False)
+    enviado_em = Column(DateTime)
+
+    def __repr__(self):
+        return f"<NotificacaoOutbox(chamado_id='{self.chamado_id}', destinatario='{self.destinatario}', status='{self.status}')>"
+
+# Migrações de esquema já aplicadas (ver migracoes.py)
+class VersaoEsquema(Base):
+    __tablename__ = 'versao_esquema'
+    versao = Column(Integer, primary_key=True)
+    descricao = Column(String(200), nullable=False)
+    aplicada_em = Column(DateTime, nullable=False)
+
+    def __repr__(self):
+        return f"<VersaoEsquema(versao='{self.versao}', descricao='{self.descricao}')>"
+
 class Usuario(Base):
     __tablename__ = 'usuarios'
     id = Column(Integer, primary_key=True, index=True)
@@ -123,11 +365,110 @@ class Usuario(Base):
 def create_tables():
     try:
         Base.metadata.create_all(bind=engine, checkfirst=True)
+        add_missing_columns()
+        sync_protocolo_counter()
         logging.info("Tabelas criadas ou já existentes verificadas com sucesso.")
     except Exception as e:
         logging.error(f"Erro ao criar as tabelas: {e}")
         raise
 
+# Função para criar os índices de consulta que ainda não existem (create_all não altera tabelas já criadas)
+def create_indexes(bind=None):
+    bind = bind or engine
+    for indice in INDICES_CONSULTA:
+        indice.create(bind=bind, checkfirst=True)
+    # Atualiza as estatísticas usadas pelo planejador de consultas
+    with bind.begin() as conn:
+        conn.execute(text("ANALYZE"))
+    logging.info("Índices de consulta verificados com sucesso.")
+
+# Função para adicionar colunas novas em tabelas já existentes (create_all não altera tabelas)
+def add_missing_columns():
+    colunas_novas = {
+        'chamados': [
+            ('tempo_decorrido_segundos', 'FLOAT'),
+        ],
+        'inventario': [
+            ('atualizado_em', 'TIMESTAMP'),
+        ],
+    }
+    inspector = inspect(engine)
+    with engine.begin() as conn:
+        for tabela, colunas in colunas_novas.items():
+            existentes = {coluna['name'] for coluna in inspector.get_columns(tabela)}
+            for nome, tipo in colunas:
+                if nome not in existentes:
+                    conn.execute(text(f"ALTER TABLE {tabela} ADD COLUMN {nome} {tipo}"))
+                    logging.info(f"Coluna '{nome}' adicionada à tabela '{tabela}'.")
+
+# Função para alinhar a sequence/contador de protocolos com o maior protocolo já gravado
+def sync_protocolo_counter():
+    with engine.begin() as conn:
+        if engine.dialect.supports_sequences:
+            conn.execute(text("CREATE SEQUENCE IF NOT EXISTS chamados_protocolo_seq"))
+            conn.execute(text(
+                "SELECT setval('chamados_protocolo_seq', GREATEST("
+                "(SELECT COALESCE(MAX(protocolo), 0) FROM chamados), "
+                "(SELECT CASE WHEN is_called THEN last_value ELSE last_value - 1 END FROM chamados_protocolo_seq)"
+                ") + 1, false)"
+            ))
+        else:
+            maior_protocolo = conn.execute(text("SELECT COALESCE(MAX(protocolo), 0) FROM chamados")).scalar()
+            atualizado = conn.execute(
+                text("UPDATE contador_protocolo SET valor = MAX(valor, :maior) WHERE id = 1"),
+                {'maior': maior_protocolo}
+            ).rowcount
+            if not atualizado:
+                conn.execute(
+                    text("INSERT INTO contador_protocolo (id, valor) VALUES (1, :maior)"),
+                    {'maior': maior_protocolo}
+                )
+    logging.info("Contador de protocolos sincronizado.")
+
+# Função para reservar o próximo protocolo dentro da transação do chamado.
+# Retorna None quando o banco atribui o número pela sequence no próprio INSERT.
+def reservar_protocolo(session):
+    if engine.dialect.supports_sequences:
+        return None
+    return session.execute(
+        text("UPDATE contador_protocolo SET valor = valor + 1 WHERE id = 1 RETURNING valor")
+    ).scalar_one()
+
+# Expressão SQL que extrai o mês ('AAAA-MM') de uma coluna de data
+def expressao_mes(coluna):
+    if engine.dialect.name == 'sqlite':
+        return func.strftime('%Y-%m', coluna)
+    return func.to_char(coluna, 'YYYY-MM')
+
+# Função para somar contadores no resumo mensal (upsert), dentro da transação de quem chama
+def atualizar_resumo_mensal(session, mes, ubs, setor, tipo_defeito, total=0, resolvidos=0, tempo_resolucao=0.0):
+    chave = {'mes': mes, 'ubs': ubs, 'setor': setor, 'tipo_defeito': tipo_defeito}
+    incrementos = {'total': total, 'resolvidos': resolvidos, 'soma_tempo_resolucao': tempo_resolucao}
+    if engine.dialect.name in ('postgresql', 'sqlite'):
+        if engine.dialect.name == 'postgresql':
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+        stmt = insert(ResumoMensalChamados).values(**chave, **incrementos)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=list(chave),
+            set_={
+                coluna: getattr(ResumoMensalChamados, coluna) + getattr(stmt.excluded, coluna)
+                for coluna in incrementos
+            }
+        )
+        session.execute(stmt)
+        return
+    atualizados = session.query(ResumoMensalChamados).filter_by(**chave).update(
+        {
+            getattr(ResumoMensalChamados, coluna): getattr(ResumoMensalChamados, coluna) + valor
+            for coluna, valor in incrementos.items()
+        },
+        synchronize_session=False
+    )
+    if not atualizados:
+        session.add(ResumoMensalChamados(**chave, **incrementos))
+
 # Função para adicionar uma UBS ao banco de dados
 def add_ubs(nome_ubs):
     if not nome_ubs.strip():
@@ -198,8 +539,7 @@ def create_user(username, password, role='user'):
         return
     with SessionLocal() as session:
         try:
-            hashed_password = bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
-            novo_usuario = Usuario(username=username, password=hashed_password.decode('utf-8'), role=role)
+            novo_usuario = Usuario(username=username, password=gerar_hash_senha(password), role=role)
             session.add(novo_usuario)
             session.commit()
             logging.info(f"Usuário '{username}' criado com sucesso com o papel '{role}'.")
@@ -221,12 +561,11 @@ def check_or_create_admin_user():
             if not usuario:
                 create_user(admin_username, admin_password, 'admin')
             else:
-                if not bcrypt.checkpw(admin_password.encode('utf-8'), usuario.password.encode('utf-8')):
-                    hashed_password = bcrypt.hashpw(admin_password.encode('utf-8'), bcrypt.gensalt())
-                    usuario.password = hashed_password.decode('utf-8')
+                if not verificar_senha(admin_password, usuario.password) or precisa_rehash(usuario.password):
+                    usuario.password = gerar_hash_senha(admin_password)
                     usuario.role = 'admin'
                     session.commit()
-                    logging.info(f"Senha do usuário admin '{admin_username}' atualizada com hash bcrypt.")
+                    logging.info(f"Senha do usuário admin '{admin_username}' atualizada.")
                 else:
                     logging.info(f"Usuário admin '{admin_username}' já existe com senha hashada.")
         except Exception as e:
@@ -0,0 +1,167 @@
+# diagnostico.py
+# Instrumentação das páginas do OS700. Para cada rerun do Streamlit registra o tempo total da
+# página, a quantidade de consultas SQL, o tempo gasto nelas, as consultas mais lentas e o tempo
+# de etapas nomeadas (ex.: AgGrid, Plotly). As consultas são medidas pelos eventos
+# before/after_cursor_execute do engine e atribuídas à medição do rerun em andamento, guardada em
+# um ContextVar (como a sessão da página em database.py). Cada medição vai para um buffer circular
+# em memória, exibido na página de diagnóstico, e para o log como uma linha JSON.
+# O tempo de SQL é o da execução no cursor; a leitura das linhas em lotes (yield_per) fica de fora.
+import os
+import json
+import time
+import heapq
+import logging
+import threading
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+DIAGNOSTICO_ATIVO = os.getenv('DIAGNOSTICO_ATIVO', 'true').strip().lower() in ('1', 'true', 'sim', 'yes')
+DIAGNOSTICO_TAMANHO_BUFFER = int(os.getenv('DIAGNOSTICO_TAMANHO_BUFFER', '200'))
+DIAGNOSTICO_CONSULTAS_LENTAS = int(os.getenv('DIAGNOSTICO_CONSULTAS_LENTAS', '5'))
+DIAGNOSTICO_TAMANHO_SQL = int(os.getenv('DIAGNOSTICO_TAMANHO_SQL', '500'))
+
+# Medição do rerun em andamento na thread da sessão do Streamlit (None fora de uma página)
+_medicao_atual = ContextVar('medicao_diagnostico', default=None)
+
+# Medição de um rerun de página
+class MedicaoPagina:
+    def __init__(self, pagina, usuario=None):
+        self.pagina = pagina
+        self.usuario = usuario
+        self.inicio_em = datetime.now()
+        self.inicio = time.perf_counter()
+        self.consultas = 0
+        self.tempo_sql = 0.0
+        self.etapas = {}
+        # Heap (duração, ordem, sql) com as consultas mais lentas
+        self._lentas = []
+
+    def registrar_consulta(self, sql, duracao):
+        self.consultas += 1
+        self.tempo_sql += duracao
+        item = (duracao, self.consultas, sql)
+        if len(self._lentas) < DIAGNOSTICO_CONSULTAS_LENTAS:
+            heapq.heappush(self._lentas, item)
+        elif self._lentas and duracao > self._lentas[0][0]:
+            heapq.heapreplace(self._lentas, item)
+
+    def registrar_etapa(self, nome, duracao):
+        self.etapas[nome] = self.etapas.get(nome, 0.0) + duracao
+
+    # Registro serializável da medição (tempos em ms); o texto das consultas é encurtado e vai
+    # sem os parâmetros, que podem conter dados pessoais
+    def finalizar(self, interrompido=None):
+        tempo_total = time.perf_counter() - self.inicio
+        return {
+            'inicio': self.inicio_em.isoformat(timespec='seconds'),
+            'pagina': self.pagina,
+            'usuario': self.usuario,
+            'tempo_total_ms': round(tempo_total * 1000, 2),
+            'consultas': self.consultas,
+            'tempo_sql_ms': round(self.tempo_sql * 1000, 2),
+            'tempo_fora_sql_ms': round((tempo_total - self.tempo_sql) * 1000, 2),
+            'etapas_ms': {nome: round(duracao * 1000, 2) for nome, duracao in self.etapas.items()},
+            'consultas_lentas': [
+                {'ms': round(duracao * 1000, 2), 'sql': sql}
+                for duracao, _, sql in sorted(self._lentas, reverse=True)
+            ],
+            'interrompido': interrompido,
+        }
+
+# Buffer circular com as últimas medições, compartilhado por todas as sessões do processo
+class BufferDiagnostico:
+    def __init__(self, tamanho=DIAGNOSTICO_TAMANHO_BUFFER):
+        self._lock = threading.Lock()
+        self._registros = deque(maxlen=tamanho)
+
+    def adicionar(self, registro):
+        with self._lock:
+            self._registros.append(registro)
+
+    # Registros do mais recente para o mais antigo
+    def registros(self):
+        with self._lock:
+            return list(reversed(self._registros))
+
+    def limpar(self):
+        with self._lock:
+            self._registros.clear()
+
+_buffer = None
+_buffer_lock = threading.Lock()
+
+# Função para obter o buffer de diagnóstico (singleton do processo)
+def get_buffer_diagnostico():
+    global _buffer
+    if _buffer is None:
+        with _buffer_lock:
+            if _buffer is None:
+                _buffer = BufferDiagnostico()
+    return _buffer
+
+def _texto_sql(statement):
+    texto = ' '.join(statement.split())
+    if len(texto) > DIAGNOSTICO_TAMANHO_SQL:
+        texto = texto[:DIAGNOSTICO_TAMANHO_SQL] + '...'
+    return texto
+
+# O início fica no contexto da execução, e não na conexão: se a consulta falhar o
+# after_cursor_execute não é chamado e nada sobra na conexão devolvida ao pool
+def _antes_de_executar(conn, cursor, statement, parameters, context, executemany):
+    if context is not None and _medicao_atual.get() is not None:
+        context._diagnostico_inicio = time.perf_counter()
+
+def _depois_de_executar(conn, cursor, statement, parameters, context, executemany):
+    medicao = _medicao_atual.get()
+    inicio = getattr(context, '_diagnostico_inicio', None)
+    if medicao is None or inicio is None:
+        return
+    medicao.registrar_consulta(_texto_sql(statement), time.perf_counter() - inicio)
+
+# Função para instalar os eventos de medição das consultas no engine (pode ser chamada a cada rerun)
+def instalar_instrumentacao(engine):
+    if not DIAGNOSTICO_ATIVO or event.contains(engine, 'before_cursor_execute', _antes_de_executar):
+        return
+    event.listen(engine, 'before_cursor_execute', _antes_de_executar)
+    event.listen(engine, 'after_cursor_execute', _depois_de_executar)
+    logger.info("Instrumentação das consultas SQL instalada.")
+
+# Mede o rerun da página no bloco: ao final a medição vai para o buffer e para o log (uma linha JSON).
+# As exceções de controle do Streamlit (st.stop, st.rerun) ficam registradas em 'interrompido'.
+@contextmanager
+def medir_pagina(pagina, usuario=None):
+    if not DIAGNOSTICO_ATIVO:
+        yield None
+        return
+    medicao = MedicaoPagina(pagina, usuario)
+    token = _medicao_atual.set(medicao)
+    interrompido = None
+    try:
+        yield medicao
+    except BaseException as e:
+        interrompido = type(e).__name__
+        raise
+    finally:
+        _medicao_atual.reset(token)
+        registro = medicao.finalizar(interrompido)
+        get_buffer_diagnostico().adicionar(registro)
+        logger.info(json.dumps(registro, ensure_ascii=False))
+
+# Mede uma etapa nomeada da página em andamento (o tempo das etapas com o mesmo nome é somado)
+@contextmanager
+def medir_etapa(nome):
+    medicao = _medicao_atual.get()
+    if medicao is None:
+        yield
+        return
+    inicio = time.perf_counter()
+    try:
+        yield
+    finally:
+        medicao.registrar_etapa(nome, time.perf_counter() - inicio)
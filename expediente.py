@@ -0,0 +1,140 @@
+# expediente.py
+from functools import lru_cache
+from zoneinfo import ZoneInfo
+
+import numpy as np
+import pandas as pd
+from workalendar.america import Brazil
+
+# Definir o fuso horário local
+local_tz = ZoneInfo('America/Sao_Paulo')
+
+# Horário de expediente (em segundos desde a meia-noite)
+INICIO_EXPEDIENTE = 8 * 3600
+INICIO_ALMOCO = 12 * 3600
+FIM_ALMOCO = 13 * 3600
+FIM_EXPEDIENTE = 17 * 3600
+SEGUNDOS_POR_DIA_UTIL = (INICIO_ALMOCO - INICIO_EXPEDIENTE) + (FIM_EXPEDIENTE - FIM_ALMOCO)
+
+_NS_POR_SEGUNDO = 10 ** 9
+
+# Feriados nacionais de um ano, calculados uma única vez por processo
+@lru_cache(maxsize=None)
+def _feriados_do_ano(ano: int) -> tuple:
+    return tuple(dia for dia, _ in Brazil().holidays(ano))
+
+# Vetor de feriados (datetime64[D]) cobrindo o intervalo de anos informado
+def feriados_entre(ano_inicio: int, ano_fim: int) -> np.ndarray:
+    dias = [dia for ano in range(ano_inicio, ano_fim + 1) for dia in _feriados_do_ano(ano)]
+    return np.array(sorted(set(dias)), dtype='datetime64[D]')
+
+# Converte uma sequência de datas/horas para horário local "de parede" (sem fuso) em datetime64[ns]
+def _para_horario_local(valores) -> np.ndarray:
+    serie = pd.Series(valores, copy=False).reset_index(drop=True)
+    if isinstance(serie.dtype, pd.DatetimeTZDtype):
+        serie = serie.dt.tz_convert(local_tz).dt.tz_localize(None)
+    elif not pd.api.types.is_datetime64_dtype(serie.dtype):
+        serie = serie.map(_valor_para_horario_local)
+        serie = pd.to_datetime(serie, errors='coerce')
+    return serie.to_numpy(dtype='datetime64[ns]')
+
+def _valor_para_horario_local(valor):
+    if valor is None or (not isinstance(valor, str) and pd.isnull(valor)):
+        return pd.NaT
+    try:
+        ts = pd.Timestamp(valor)
+    except (ValueError, TypeError):
+        return pd.NaT
+    if ts.tzinfo is not None:
+        ts = ts.tz_convert(local_tz).tz_localize(None)
+    return ts
+
+# Segundos de expediente dentro de um mesmo dia, entre 'inicio' e 'fim' (segundos desde a meia-noite).
+# Reproduz exatamente as regras de calcular_tempo_decorrido, inclusive a contagem de intervalos
+# que começam dentro do horário de almoço e terminam até as 13h.
+def _segundos_no_dia(inicio: np.ndarray, fim: np.ndarray) -> np.ndarray:
+    s = np.maximum(inicio, INICIO_EXPEDIENTE)
+    e = np.minimum(fim, FIM_EXPEDIENTE)
+    atravessa_meio_dia = (s < INICIO_ALMOCO) & (INICIO_ALMOCO < e)
+    comeca_no_almoco = ~atravessa_meio_dia & (s < FIM_ALMOCO) & (FIM_ALMOCO < e)
+    resultado = np.where(
+        atravessa_meio_dia,
+        (INICIO_ALMOCO - s) + np.maximum(e - FIM_ALMOCO, 0),
+        np.where(comeca_no_almoco, e - FIM_ALMOCO, e - s),
+    )
+    return np.where(s >= e, 0.0, resultado)
+
+# Calcula, de forma vetorizada, os segundos de expediente (08h-17h, sem almoço, sem feriados)
+# entre cada par abertura/fechamento. Fechamentos nulos usam o horário atual; aberturas
+# inválidas resultam em NaN.
+def calcular_tempo_decorrido_lote(horas_abertura, horas_fechamento, agora=None) -> np.ndarray:
+    abertura = _para_horario_local(horas_abertura)
+    fechamento = _para_horario_local(horas_fechamento)
+    if len(abertura) != len(fechamento):
+        raise ValueError("Os vetores de abertura e fechamento devem ter o mesmo tamanho.")
+
+    resultado = np.full(len(abertura), np.nan)
+    validos = ~np.isnat(abertura)
+    if not validos.any():
+        return resultado
+
+    if agora is None:
+        agora = pd.Timestamp.now(tz=local_tz)
+    agora = np.datetime64(_valor_para_horario_local(agora).to_datetime64(), 'ns')
+    fechamento = np.where(np.isnat(fechamento), agora, fechamento)
+
+    abertura = abertura[validos]
+    fechamento = fechamento[validos]
+
+    dia_abertura = abertura.astype('datetime64[D]')
+    dia_fechamento = fechamento.astype('datetime64[D]')
+
+    # Calendário de dias úteis pré-calculado para todo o intervalo (com folga para achar o próximo fim de semana)
+    primeiro_dia = dia_abertura.min()
+    ultimo_dia = max(dia_abertura.max(), dia_fechamento.max()) + np.timedelta64(10, 'D')
+    feriados = feriados_entre(primeiro_dia.astype(object).year, ultimo_dia.astype(object).year)
+    dias = np.arange(primeiro_dia, ultimo_dia + np.timedelta64(1, 'D'))
+    dias_uteis = np.is_busday(dias, holidays=feriados)
+    uteis_acumulados = np.concatenate(([0], np.cumsum(dias_uteis)))
+    # Índice do próximo dia não útil a partir de cada dia do calendário
+    indices = np.arange(len(dias))
+    proximo_nao_util = np.minimum.accumulate(
+        np.where(dias_uteis, len(dias), indices)[::-1]
+    )[::-1]
+
+    def indice(dia):
+        return (dia - primeiro_dia).astype(np.int64)
+
+    segundos_abertura = (abertura - dia_abertura).astype(np.int64) / _NS_POR_SEGUNDO
+
+    # Comportamento legado: aberturas em dia útil após o fim do expediente só voltam a contar
+    # a partir da meia-noite seguinte ao próximo dia não útil.
+    idx_abertura = indice(dia_abertura)
+    apos_expediente = dias_uteis[idx_abertura] & (segundos_abertura >= FIM_EXPEDIENTE)
+    if apos_expediente.any():
+        idx_retomada = proximo_nao_util[np.minimum(idx_abertura + 1, len(dias) - 1)] + 1
+        retomada = primeiro_dia + idx_retomada.astype('timedelta64[D]')
+        abertura = np.where(apos_expediente, retomada.astype('datetime64[ns]'), abertura)
+        dia_abertura = abertura.astype('datetime64[D]')
+        idx_abertura = indice(dia_abertura)
+        segundos_abertura = (abertura - dia_abertura).astype(np.int64) / _NS_POR_SEGUNDO
+
+    idx_fechamento = indice(dia_fechamento)
+    segundos_fechamento = (fechamento - dia_fechamento).astype(np.int64) / _NS_POR_SEGUNDO
+    util_abertura = dias_uteis[np.minimum(idx_abertura, len(dias) - 1)]
+    util_fechamento = dias_uteis[idx_fechamento]
+
+    mesmo_dia = idx_abertura == idx_fechamento
+    total_mesmo_dia = np.where(
+        util_abertura, _segundos_no_dia(segundos_abertura, segundos_fechamento), 0.0
+    )
+    primeiro = np.where(util_abertura, _segundos_no_dia(segundos_abertura, FIM_EXPEDIENTE), 0.0)
+    ultimo = np.where(util_fechamento, _segundos_no_dia(0, segundos_fechamento), 0.0)
+    idx_meio_inicio = np.minimum(idx_abertura + 1, len(dias))
+    idx_meio_fim = np.maximum(idx_fechamento, idx_meio_inicio)
+    meio = (uteis_acumulados[idx_meio_fim] - uteis_acumulados[idx_meio_inicio]) * SEGUNDOS_POR_DIA_UTIL
+    total_varios_dias = primeiro + meio + ultimo
+
+    total = np.where(mesmo_dia, total_mesmo_dia, total_varios_dias)
+    resultado[validos] = np.where(abertura < fechamento, total, 0.0)
+    return resultado
@@ -0,0 +1,124 @@
+# exportacao.py
+# Exportação completa dos chamados e do inventário para CSV ou Parquet. As linhas vêm do banco em
+# lotes por um cursor do lado do servidor (stream_results/yield_per), sem criar objetos do ORM, e
+# cada lote é gravado antes de buscar o próximo: exportando para arquivo (manage.py exportar) a
+# memória usada não depende do tamanho da tabela. O download pela interface monta o arquivo inteiro
+# em memória (o Streamlit guarda os bytes na sessão), por isso fica limitado a tabelas pequenas.
+import os
+import io
+import csv
+import logging
+from sqlalchemy import select, func, Integer, Float, DateTime, Boolean
+from database import engine, Chamado, Inventario, PecaUsada, HistoricoManutencao
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+EXPORTACAO_TAMANHO_LOTE = int(os.getenv('EXPORTACAO_TAMANHO_LOTE', '5000'))
+EXPORTACAO_LIMITE_DOWNLOAD = int(os.getenv('EXPORTACAO_LIMITE_DOWNLOAD', '50000'))
+
+# Tabelas disponíveis para exportação
+TABELAS_EXPORTACAO = {
+    'chamados': Chamado.__table__,
+    'inventario': Inventario.__table__,
+    'pecas_usadas': PecaUsada.__table__,
+    'historico_manutencao': HistoricoManutencao.__table__,
+}
+
+FORMATOS_EXPORTACAO = {
+    'csv': ('text/csv', '.csv'),
+    'parquet': ('application/vnd.apache.parquet', '.parquet'),
+}
+
+# Tabela ou formato de exportação inválido
+class ErroExportacao(Exception):
+    pass
+
+def _tabela(nome):
+    if nome not in TABELAS_EXPORTACAO:
+        raise ErroExportacao(f"Tabela desconhecida para exportação: '{nome}'.")
+    return TABELAS_EXPORTACAO[nome]
+
+# Função para contar as linhas de uma tabela de exportação
+def contar_linhas(nome_tabela):
+    tabela = _tabela(nome_tabela)
+    with engine.connect() as conexao:
+        return conexao.execute(select(func.count()).select_from(tabela)).scalar_one()
+
+# Lê a tabela em lotes de linhas (tuplas), ordenada pela chave primária, com cursor do lado do servidor
+def iterar_lotes(nome_tabela, tamanho_lote=EXPORTACAO_TAMANHO_LOTE):
+    tabela = _tabela(nome_tabela)
+    consulta = select(*tabela.columns).order_by(*tabela.primary_key.columns)
+    with engine.connect() as conexao:
+        resultado = conexao.execution_options(stream_results=True, yield_per=tamanho_lote).execute(consulta)
+        for lote in resultado.partitions():
+            yield lote
+
+# Esquema Parquet a partir dos tipos das colunas (texto para os demais tipos)
+def _esquema_parquet(tabela):
+    import pyarrow as pa
+
+    campos = []
+    for coluna in tabela.columns:
+        if isinstance(coluna.type, Integer):
+            tipo = pa.int64()
+        elif isinstance(coluna.type, Float):
+            tipo = pa.float64()
+        elif isinstance(coluna.type, Boolean):
+            tipo = pa.bool_()
+        elif isinstance(coluna.type, DateTime):
+            tipo = pa.timestamp('us')
+        else:
+            tipo = pa.string()
+        campos.append(pa.field(coluna.name, tipo, nullable=coluna.nullable))
+    return pa.schema(campos)
+
+def _exportar_csv(nome_tabela, arquivo, tamanho_lote):
+    tabela = _tabela(nome_tabela)
+    total = 0
+    texto = io.TextIOWrapper(arquivo, encoding='utf-8', newline='')
+    escritor = csv.writer(texto)
+    escritor.writerow([coluna.name for coluna in tabela.columns])
+    for lote in iterar_lotes(nome_tabela, tamanho_lote):
+        escritor.writerows(lote)
+        total += len(lote)
+    texto.flush()
+    # O arquivo pertence a quem chamou; não fechar junto com o wrapper
+    texto.detach()
+    return total
+
+def _exportar_parquet(nome_tabela, arquivo, tamanho_lote):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    esquema = _esquema_parquet(_tabela(nome_tabela))
+    total = 0
+    # Cada lote vira um row group; o arquivo é escrito de forma incremental
+    with pq.ParquetWriter(arquivo, esquema, compression='zstd') as escritor:
+        for lote in iterar_lotes(nome_tabela, tamanho_lote):
+            colunas = list(zip(*lote))
+            escritor.write_table(pa.Table.from_arrays(
+                [pa.array(valores, type=campo.type) for valores, campo in zip(colunas, esquema)],
+                schema=esquema
+            ))
+            total += len(lote)
+    return total
+
+# Função para exportar uma tabela para um arquivo binário aberto para escrita; retorna a
+# quantidade de linhas exportadas
+def exportar_tabela(nome_tabela, formato, arquivo, tamanho_lote=EXPORTACAO_TAMANHO_LOTE):
+    if formato == 'csv':
+        total = _exportar_csv(nome_tabela, arquivo, tamanho_lote)
+    elif formato == 'parquet':
+        total = _exportar_parquet(nome_tabela, arquivo, tamanho_lote)
+    else:
+        raise ErroExportacao(f"Formato de exportação desconhecido: '{formato}'. Use csv ou parquet.")
+    logger.info(f"Exportação de '{nome_tabela}' ({formato}) concluída: {total} linhas.")
+    return total
+
+# Função para exportar em memória e devolver os bytes do arquivo; usada pelo botão de download,
+# só para tabelas com até EXPORTACAO_LIMITE_DOWNLOAD linhas
+def exportar_para_bytes(nome_tabela, formato, tamanho_lote=EXPORTACAO_TAMANHO_LOTE):
+    with io.BytesIO() as arquivo:
+        exportar_tabela(nome_tabela, formato, arquivo, tamanho_lote)
+        return arquivo.getvalue()
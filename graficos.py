@@ -0,0 +1,140 @@
+# graficos.py
+# Renderização dos gráficos dos relatórios em PNG na memória, em paralelo num pool de processos.
+import os
+import struct
+import logging
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+logger = logging.getLogger(__name__)
+
+# Perfis de tamanho (polegadas) e resolução dos gráficos; 'padrao' reproduz o tamanho original
+PERFIS_GRAFICO = {
+    'rapido': {'largura': 8, 'altura': 4.8, 'dpi': 72},
+    'padrao': {'largura': 10, 'altura': 6, 'dpi': 100},
+    'alta': {'largura': 10, 'altura': 6, 'dpi': 200},
+}
+
+# Configurações usando variáveis de ambiente
+GRAFICO_PERFIL = os.getenv('GRAFICO_PERFIL', 'padrao')
+GRAFICO_DPI = os.getenv('GRAFICO_DPI')
+GRAFICO_WORKERS = int(os.getenv('GRAFICO_WORKERS', '4'))
+
+_ASSINATURA_PNG = b'\x89PNG\r\n\x1a\n'
+
+# Função para obter o perfil de renderização (GRAFICO_DPI, se definido, sobrescreve o dpi do perfil)
+def get_perfil_grafico(nome=None):
+    nome = nome or GRAFICO_PERFIL
+    if nome not in PERFIS_GRAFICO:
+        logger.warning(f"Perfil de gráfico desconhecido '{nome}'. Usando o perfil 'padrao'.")
+        nome = 'padrao'
+    perfil = dict(PERFIS_GRAFICO[nome])
+    if GRAFICO_DPI:
+        perfil['dpi'] = int(GRAFICO_DPI)
+    return perfil
+
+# Desenha um gráfico de barras e devolve o PNG (RGB, 8 bits) em bytes.
+# Executada nos processos do pool, por isso recebe e devolve apenas tipos simples.
+# matplotlib/seaborn só são importados aqui, na primeira renderização.
+def renderizar_grafico_barras(especificacao, perfil):
+    import matplotlib
+    matplotlib.use('Agg')
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    from PIL import Image
+
+    fig, ax = plt.subplots(figsize=(perfil['largura'], perfil['altura']), dpi=perfil['dpi'])
+    try:
+        sns.barplot(x=especificacao['categorias'], y=especificacao['valores'], ax=ax)
+        ax.set_title(especificacao['titulo'])
+        if especificacao.get('xlabel'):
+            ax.set_xlabel(especificacao['xlabel'])
+        if especificacao.get('ylabel'):
+            ax.set_ylabel(especificacao['ylabel'])
+        if especificacao.get('rotacionar', True):
+            ax.tick_params(axis='x', labelrotation=45)
+            fig.tight_layout(pad=2.0)
+        fig.canvas.draw()
+        # Sem canal alfa o PNG pode ir direto para o PDF, sem decodificar os pixels
+        imagem = Image.frombuffer('RGBA', fig.canvas.get_width_height(), fig.canvas.buffer_rgba(), 'raw', 'RGBA', 0, 1)
+        buffer = BytesIO()
+        imagem.convert('RGB').save(buffer, format='PNG')
+        return buffer.getvalue()
+    finally:
+        plt.close(fig)
+
+# Pool de processos compartilhado pelo processo (criado na primeira renderização)
+_pool = None
+_pool_lock = threading.Lock()
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=GRAFICO_WORKERS,
+                mp_context=multiprocessing.get_context('spawn')
+            )
+        return _pool
+
+def _descartar_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+# Função para renderizar vários gráficos; usa o pool quando há mais de um gráfico e mais de um
+# worker configurado, e volta para a renderização sequencial se o pool falhar
+def renderizar_graficos(especificacoes, perfil=None):
+    perfil = get_perfil_grafico(perfil) if perfil is None or isinstance(perfil, str) else perfil
+    if GRAFICO_WORKERS > 1 and len(especificacoes) > 1:
+        try:
+            return list(_get_pool().map(renderizar_grafico_barras, especificacoes, [perfil] * len(especificacoes)))
+        except Exception as e:
+            logger.warning(f"Falha no pool de renderização de gráficos, renderizando sequencialmente: {e}")
+            _descartar_pool()
+    return [renderizar_grafico_barras(especificacao, perfil) for especificacao in especificacoes]
+
+# Extrai de um PNG RGB de 8 bits as informações de imagem no formato usado pelo FPDF.
+# Os blocos IDAT já estão no formato FlateDecode com preditor PNG, então não há recompressão.
+def _info_png(dados):
+    if dados[:8] != _ASSINATURA_PNG:
+        raise ValueError("Os dados não são um PNG válido.")
+    posicao = 8
+    cabecalho = None
+    blocos = []
+    while posicao < len(dados):
+        tamanho, tipo = struct.unpack('>I4s', dados[posicao:posicao + 8])
+        corpo = dados[posicao + 8:posicao + 8 + tamanho]
+        if tipo == b'IHDR':
+            cabecalho = struct.unpack('>IIBBBBB', corpo)
+        elif tipo == b'IDAT':
+            blocos.append(corpo)
+        elif tipo == b'IEND':
+            break
+        posicao += tamanho + 12
+    if cabecalho is None:
+        raise ValueError("PNG sem cabeçalho IHDR.")
+    largura, altura, bits, tipo_cor, _, _, entrelacado = cabecalho
+    if bits != 8 or tipo_cor != 2 or entrelacado:
+        raise ValueError("Apenas PNG RGB de 8 bits sem entrelaçamento é suportado.")
+    return {
+        'w': largura,
+        'h': altura,
+        'cs': 'DeviceRGB',
+        'bpc': 8,
+        'f': 'FlateDecode',
+        'dp': f'/Predictor 15 /Colors 3 /BitsPerComponent 8 /Columns {largura}',
+        'data': b''.join(blocos),
+    }
+
+# Função para inserir no PDF um PNG que está na memória, sem passar por arquivo em disco
+def adicionar_png_ao_pdf(pdf, dados_png, nome, x=None, y=None, w=0, h=0):
+    if nome not in pdf.images:
+        info = _info_png(dados_png)
+        info['i'] = len(pdf.images) + 1
+        pdf.images[nome] = info
+    pdf.image(nome, x=x, y=y, w=w, h=h)
@@ -0,0 +1,241 @@
+# importacao_inventario.py
+# Importação em massa do inventário a partir de planilhas CSV ou XLSX. O arquivo é lido linha a
+# linha e processado em lotes: cada lote é validado, os patrimônios já cadastrados são conferidos
+# com uma única consulta e as linhas válidas entram de uma vez (COPY no PostgreSQL, executemany
+# nos demais bancos). Tudo roda em uma transação: ou a importação inteira entra, ou nada entra.
+import os
+import io
+import csv
+import codecs
+import logging
+import unicodedata
+from datetime import datetime
+from itertools import islice
+from sqlalchemy import insert
+from database import SessionLocal, Inventario
+from referencias import cache_ubs, cache_setores, cache_setores_em_uso
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+IMPORTACAO_TAMANHO_LOTE = int(os.getenv('IMPORTACAO_TAMANHO_LOTE', '1000'))
+
+# Colunas do inventário aceitas na planilha: obrigatórias e opcionais (com valor padrão)
+COLUNAS_OBRIGATORIAS = ['numero_patrimonio', 'tipo', 'marca', 'modelo', 'status', 'localizacao', 'setor']
+COLUNAS_OPCIONAIS = {'numero_serie': 'Não informado', 'propria_locada': 'Própria'}
+COLUNAS_IMPORTACAO = COLUNAS_OBRIGATORIAS + list(COLUNAS_OPCIONAIS)
+
+# Outros nomes de cabeçalho reconhecidos (já normalizados: minúsculas, sem acentos, com '_')
+SINONIMOS_COLUNAS = {
+    'patrimonio': 'numero_patrimonio',
+    'numero_de_patrimonio': 'numero_patrimonio',
+    'tipo_de_equipamento': 'tipo',
+    'numero_de_serie': 'numero_serie',
+    'serie': 'numero_serie',
+    'ubs': 'localizacao',
+    'localizacao_ubs': 'localizacao',
+    'propria_ou_locada': 'propria_locada',
+}
+
+# Codificações aceitas no CSV, na ordem de tentativa: UTF-8 (com ou sem BOM) e a usada pelo Excel
+# no Windows em português ao salvar como "CSV (separado por vírgulas)"
+CODIFICACOES_CSV = ['utf-8-sig', 'cp1252']
+
+STATUS_VALIDOS = ['Ativo', 'Em Manutenção', 'Inativo']
+PROPRIA_LOCADA_VALIDOS = ['Própria', 'Locada']
+
+# Planilha que não pode ser importada (formato ou cabeçalho inválido)
+class ErroImportacao(Exception):
+    pass
+
+# Normaliza um cabeçalho da planilha para o nome da coluna no banco
+def normalizar_cabecalho(nome):
+    texto = unicodedata.normalize('NFKD', str(nome or '')).encode('ascii', 'ignore').decode('ascii')
+    texto = '_'.join(texto.strip().lower().replace('-', ' ').split())
+    return SINONIMOS_COLUNAS.get(texto, texto)
+
+# Converte um valor da planilha em texto (números inteiros lidos do XLSX como 123.0 viram '123')
+def _texto(valor):
+    if valor is None:
+        return ''
+    if isinstance(valor, float) and valor.is_integer():
+        valor = int(valor)
+    return str(valor).strip()
+
+# Descobre a codificação do CSV decodificando o arquivo inteiro em blocos, sem carregá-lo na memória
+def _codificacao_csv(arquivo):
+    for codificacao in CODIFICACOES_CSV:
+        arquivo.seek(0)
+        decodificador = codecs.getincrementaldecoder(codificacao)()
+        try:
+            for bloco in iter(lambda: arquivo.read(65536), b''):
+                decodificador.decode(bloco)
+            decodificador.decode(b'', final=True)
+        except UnicodeDecodeError:
+            continue
+        arquivo.seek(0)
+        return codificacao
+    raise ErroImportacao(
+        "Não foi possível ler o CSV: codificação de caracteres não reconhecida. "
+        "Salve a planilha como \"CSV UTF-8\" e tente novamente."
+    )
+
+def _linhas_csv(arquivo):
+    codificacao = _codificacao_csv(arquivo)
+    if codificacao != CODIFICACOES_CSV[0]:
+        logger.info(f"CSV lido com a codificação {codificacao}.")
+    texto = io.TextIOWrapper(arquivo, encoding=codificacao, newline='')
+    amostra = texto.read(4096)
+    texto.seek(0)
+    try:
+        dialeto = csv.Sniffer().sniff(amostra, delimiters=';,\t')
+    except csv.Error:
+        dialeto = csv.excel
+    try:
+        yield from csv.reader(texto, dialeto)
+    finally:
+        # O arquivo pertence a quem chamou; não fechar junto com o wrapper
+        texto.detach()
+
+def _linhas_xlsx(arquivo):
+    from openpyxl import load_workbook
+
+    planilha = load_workbook(arquivo, read_only=True, data_only=True)
+    try:
+        yield from planilha.active.iter_rows(values_only=True)
+    finally:
+        planilha.close()
+
+# Lê a planilha linha a linha e devolve (número da linha na planilha, dicionário com as colunas)
+def ler_planilha(arquivo, nome_arquivo):
+    extensao = os.path.splitext(nome_arquivo)[1].lower()
+    if extensao == '.csv':
+        linhas = _linhas_csv(arquivo)
+    elif extensao in ('.xlsx', '.xlsm'):
+        linhas = _linhas_xlsx(arquivo)
+    else:
+        raise ErroImportacao(f"Formato de arquivo não suportado: '{extensao}'. Use CSV ou XLSX.")
+
+    cabecalho = [normalizar_cabecalho(nome) for nome in next(linhas, [])]
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if coluna not in cabecalho]
+    if faltando:
+        raise ErroImportacao(f"Colunas obrigatórias ausentes na planilha: {', '.join(faltando)}.")
+    posicoes = {coluna: cabecalho.index(coluna) for coluna in COLUNAS_IMPORTACAO if coluna in cabecalho}
+
+    for numero, linha in enumerate(linhas, start=2):
+        valores = {coluna: _texto(linha[posicao]) if posicao < len(linha) else '' for coluna, posicao in posicoes.items()}
+        if any(valores.values()):
+            yield numero, valores
+
+# Valida uma linha; devolve a mensagem de erro ou None
+def _validar_linha(valores, ubs_validas, setores_validos, tamanhos):
+    faltando = [coluna for coluna in COLUNAS_OBRIGATORIAS if not valores.get(coluna)]
+    if faltando:
+        return f"Campos obrigatórios vazios: {', '.join(faltando)}."
+    if not valores['numero_patrimonio'].isdigit():
+        return "Número de patrimônio inválido. Deve conter apenas dígitos."
+    if valores['status'] not in STATUS_VALIDOS:
+        return f"Status inválido: '{valores['status']}'. Use {', '.join(STATUS_VALIDOS)}."
+    if valores['propria_locada'] not in PROPRIA_LOCADA_VALIDOS:
+        return f"Valor inválido para própria/locada: '{valores['propria_locada']}'."
+    if valores['localizacao'] not in ubs_validas:
+        return f"UBS não cadastrada: '{valores['localizacao']}'."
+    if valores['setor'] not in setores_validos:
+        return f"Setor não cadastrado: '{valores['setor']}'."
+    for coluna, tamanho in tamanhos.items():
+        if len(valores[coluna]) > tamanho:
+            return f"Valor de '{coluna}' excede {tamanho} caracteres."
+    return None
+
+# Insere as linhas com COPY (PostgreSQL) ou com um único INSERT executemany (demais bancos)
+def _inserir_lote(session, registros):
+    if session.bind.dialect.name == 'postgresql':
+        colunas = COLUNAS_IMPORTACAO + ['atualizado_em']
+        agora = datetime.now()
+        buffer = io.StringIO()
+        escritor = csv.writer(buffer)
+        for registro in registros:
+            escritor.writerow([registro[coluna] for coluna in COLUNAS_IMPORTACAO] + [agora.isoformat()])
+        buffer.seek(0)
+        conexao = session.connection().connection.driver_connection
+        with conexao.cursor() as cursor:
+            cursor.copy_expert(
+                f"COPY {Inventario.__tablename__} ({', '.join(colunas)}) FROM STDIN WITH (FORMAT csv)",
+                buffer
+            )
+    else:
+        session.execute(insert(Inventario), registros)
+
+# Função para importar o inventário de uma planilha. Retorna um dicionário com o total de linhas
+# lidas, as quantidades de linhas válidas e inseridas e a lista de erros ({'linha',
+# 'numero_patrimonio', 'erro'}). Com apenas_validar=True nada é gravado (conferência prévia).
+def importar_inventario(arquivo, nome_arquivo, tamanho_lote=IMPORTACAO_TAMANHO_LOTE, apenas_validar=False):
+    resultado = {'total_linhas': 0, 'validos': 0, 'inseridos': 0, 'erros': []}
+    tamanhos = {coluna: Inventario.__table__.c[coluna].type.length for coluna in COLUNAS_IMPORTACAO}
+    vistos = set()
+
+    with SessionLocal() as session:
+        ubs_validas = set(cache_ubs.obter(session))
+        setores_validos = set(cache_setores.obter(session))
+        linhas = ler_planilha(arquivo, nome_arquivo)
+        try:
+            while True:
+                lote = list(islice(linhas, tamanho_lote))
+                if not lote:
+                    break
+                resultado['total_linhas'] += len(lote)
+
+                validas = []
+                for numero, valores in lote:
+                    for coluna, padrao in COLUNAS_OPCIONAIS.items():
+                        valores[coluna] = valores.get(coluna) or padrao
+                    erro = _validar_linha(valores, ubs_validas, setores_validos, tamanhos)
+                    if erro is None and valores['numero_patrimonio'] in vistos:
+                        erro = "Número de patrimônio repetido na planilha."
+                    if erro:
+                        resultado['erros'].append({'linha': numero, 'numero_patrimonio': valores.get('numero_patrimonio', ''), 'erro': erro})
+                        continue
+                    vistos.add(valores['numero_patrimonio'])
+                    validas.append((numero, valores))
+
+                # Patrimônios do lote que já existem no banco, em uma única consulta
+                existentes = {
+                    patrimonio for (patrimonio,) in session.query(Inventario.numero_patrimonio).filter(
+                        Inventario.numero_patrimonio.in_([valores['numero_patrimonio'] for _, valores in validas])
+                    )
+                } if validas else set()
+
+                registros = []
+                for numero, valores in validas:
+                    if valores['numero_patrimonio'] in existentes:
+                        resultado['erros'].append({'linha': numero, 'numero_patrimonio': valores['numero_patrimonio'], 'erro': "Patrimônio já cadastrado no inventário."})
+                    else:
+                        registros.append(valores)
+
+                if registros and not apenas_validar:
+                    _inserir_lote(session, registros)
+                resultado['validos'] += len(registros)
+
+            if apenas_validar:
+                session.rollback()
+            else:
+                session.commit()
+                resultado['inseridos'] = resultado['validos']
+        except Exception:
+            session.rollback()
+            raise
+
+    if resultado['inseridos']:
+        # Inserções em massa não passam pelos eventos do ORM que invalidam os setores em uso
+        cache_setores_em_uso.invalidar()
+    if not apenas_validar:
+        logger.info(f"Importação de inventário '{nome_arquivo}': {resultado['inseridos']} itens inseridos, {len(resultado['erros'])} linhas com erro.")
+    return resultado
+
+# Função para gerar o relatório de erros da importação em CSV (bytes)
+def relatorio_erros_csv(erros):
+    buffer = io.StringIO()
+    escritor = csv.DictWriter(buffer, fieldnames=['linha', 'numero_patrimonio', 'erro'], delimiter=';')
+    escritor.writeheader()
+    escritor.writerows(erros)
+    return buffer.getvalue().encode('utf-8-sig')
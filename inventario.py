@@ -1,17 +1,18 @@
 import os
-from sqlalchemy.orm import Session
-from sqlalchemy import and_
-from database import Chamado, SessionLocal
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy.orm import Session, joinedload, selectinload
+from sqlalchemy import and_, func
+from database import Chamado, get_session, Inventario, HistoricoManutencao
 import streamlit as st
 import pandas as pd
 import logging
-from fpdf import FPDF
 from io import BytesIO
-import matplotlib.pyplot as plt
-import seaborn as sns
-from matplotlib.ticker import MaxNLocator
-import tempfile
 from ubs import get_ubs_list
+from cache_relatorios import get_cache_relatorios
+from carregador_dataframe import carregar_dataframe
+from referencias import cache_setores_em_uso
+from importacao_inventario import importar_inventario, relatorio_erros_csv, ErroImportacao, COLUNAS_OBRIGATORIAS, COLUNAS_OPCIONAIS
 
 # Configuração do logging
 logging.basicConfig(
@@ -23,17 +24,30 @@ logging.basicConfig(
     ]
 )
 
-# Função para obter os setores a partir das tabelas 'chamados' e 'inventario'
-@st.cache_data(ttl=300)
+# Definir o fuso horário local
+local_tz = ZoneInfo('America/Sao_Paulo')
+
+# Colunas do inventário exibidas na lista ({rótulo: coluna})
+COLUNAS_LISTA_INVENTARIO = {
+    'ID': Inventario.id,
+    'Número de Patrimônio': Inventario.numero_patrimonio,
+    'Tipo': Inventario.tipo,
+    'Marca': Inventario.marca,
+    'Modelo': Inventario.modelo,
+    'Número de Série': Inventario.numero_serie,
+    'Status': Inventario.status,
+    'Localização': Inventario.localizacao,
+    'Própria/Locada': Inventario.propria_locada,
+    'Setor': Inventario.setor,
+}
+
+# Função para obter os setores a partir das tabelas 'chamados' e 'inventario' (cache compartilhado, ver referencias.py)
 def get_setores_from_db():
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
-        setores_chamados = session.query(Chamado.setor).filter(Chamado.setor.isnot(None)).distinct().all()
-        setores_inventario = session.query(Inventario.setor).filter(Inventario.setor.isnot(None)).distinct().all()
-        setores = set([s[0] for s in setores_chamados + setores_inventario])
-        logging.info("Setores obtidos do banco de dados.")
-        return sorted(setores)
+        return cache_setores_em_uso.obter(session)
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao obter setores: {e}")
         st.error("Erro interno ao obter setores. Tente novamente mais tarde.")
         return []
@@ -42,7 +56,7 @@ def get_setores_from_db():
 
 # Função para cadastrar máquina no inventário
 def add_machine_to_inventory(tipo: str, marca: str, modelo: str, numero_serie: str, status: str, localizacao: str, propria_locada: str, patrimonio: str, setor: str) -> None:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         existing_machine = session.query(Inventario).filter(Inventario.numero_patrimonio == patrimonio).first()
         if existing_machine:
@@ -71,16 +85,80 @@ def add_machine_to_inventory(tipo: str, marca: str, modelo: str, numero_serie: s
     finally:
         session.close()
 
-# Função para listar chamados técnicos relacionados a um número de patrimônio
-def list_chamados_por_patrimonio(patrimonio):
-    session: Session = SessionLocal()
+# Função para obter a ficha completa de uma máquina: dados do inventário, chamados (com as peças
+# usadas) e histórico de manutenção. Os chamados e as peças vêm na mesma consulta da máquina
+# (joinedload) e o histórico em uma segunda (selectinload), qualquer que seja a quantidade de
+# registros. Retorna um dicionário com DataFrames prontos para exibição, ou None se não existir.
+def obter_ficha_patrimonio(patrimonio):
+    session: Session = get_session()
     try:
-        chamados = session.query(Chamado).filter(Chamado.patrimonio == patrimonio).all()
-        return chamados
+        maquina = (
+            session.query(Inventario)
+            .options(
+                joinedload(Inventario.chamados).joinedload(Chamado.pecas_usadas),
+                selectinload(Inventario.historico),
+            )
+            .filter(Inventario.numero_patrimonio == patrimonio)
+            .first()
+        )
+        if maquina is None:
+            return None
+
+        chamados = []
+        pecas = []
+        for chamado in maquina.chamados:
+            chamados.append({
+                'ID': chamado.id,
+                'Usuário': chamado.username,
+                'UBS': chamado.ubs,
+                'Setor': chamado.setor,
+                'Tipo de Defeito': chamado.tipo_defeito,
+                'Problema': chamado.problema,
+                'Hora Abertura': chamado.hora_abertura,
+                'Solução': chamado.solucao,
+                'Hora Fechamento': chamado.hora_fechamento,
+                'Protocolo': chamado.protocolo,
+                'Máquina': chamado.machine,
+                'Patrimônio': chamado.patrimonio,
+                'Peças Usadas': ', '.join(peca.peca_nome for peca in chamado.pecas_usadas),
+            })
+            pecas.extend(
+                {'Peça': peca.peca_nome, 'Data de Uso': peca.data_uso, 'Protocolo': chamado.protocolo}
+                for peca in chamado.pecas_usadas
+            )
+        historico = [
+            {'Descrição': item.descricao, 'Data': item.data_manutencao}
+            for item in sorted(maquina.historico, key=lambda item: item.data_manutencao, reverse=True)
+        ]
+
+        return {
+            'maquina': {
+                'ID': maquina.id,
+                'Número de Patrimônio': maquina.numero_patrimonio,
+                'Tipo': maquina.tipo,
+                'Marca': maquina.marca,
+                'Modelo': maquina.modelo,
+                'Número de Série': maquina.numero_serie or '',
+                'Status': maquina.status,
+                'Localização': maquina.localizacao,
+                'Própria/Locada': maquina.propria_locada,
+                'Setor': maquina.setor,
+            },
+            'chamados': pd.DataFrame(chamados),
+            'pecas': pd.DataFrame(pecas, columns=['Peça', 'Data de Uso', 'Protocolo']),
+            'historico': pd.DataFrame(historico, columns=['Descrição', 'Data']),
+            'resumo': {
+                'total_chamados': len(chamados),
+                'chamados_em_aberto': sum(1 for chamado in chamados if chamado['Hora Fechamento'] is None),
+                'pecas_usadas': len(pecas),
+                'ultima_manutencao': historico[0]['Data'] if historico else None,
+            },
+        }
     except Exception as e:
-        logging.error(f"Erro ao listar chamados por patrimônio {patrimonio}: {e}")
-        st.error("Erro interno ao listar chamados. Tente novamente mais tarde.")
-        return []
+        session.rollback()
+        logging.error(f"Erro ao obter ficha do patrimônio {patrimonio}: {e}")
+        st.error("Erro interno ao recuperar dados da máquina. Tente novamente mais tarde.")
+        return None
     finally:
         session.close()
 
@@ -118,50 +196,68 @@ def show_inventory_form():
 
 # Função para obter máquinas do inventário
 def get_machines_from_inventory():
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         machines = session.query(Inventario).all()
         logging.info("Máquinas recuperadas do inventário.")
         return machines
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao recuperar máquinas do inventário: {e}")
         st.error("Erro interno ao recuperar inventário. Tente novamente mais tarde.")
         return []
     finally:
         session.close()
 
+# Função para obter o inventário como DataFrame tipado, direto das colunas da lista
+def dataframe_inventario():
+    session: Session = get_session()
+    try:
+        df = carregar_dataframe(
+            session, COLUNAS_LISTA_INVENTARIO, ordem=(Inventario.id,),
+            categorias=('Tipo', 'Status', 'Localização', 'Própria/Locada', 'Setor')
+        )
+        df['Número de Série'] = df['Número de Série'].fillna('')
+        logging.info("Máquinas recuperadas do inventário.")
+        return df
+    except Exception as e:
+        session.rollback()
+        logging.error(f"Erro ao recuperar máquinas do inventário: {e}")
+        st.error("Erro interno ao recuperar inventário. Tente novamente mais tarde.")
+        return pd.DataFrame(columns=list(COLUNAS_LISTA_INVENTARIO))
+    finally:
+        session.close()
+
 # Função para exibir lista de inventário com a opção de listar chamados por patrimônio
 def show_inventory_list():
     st.subheader('Lista de Inventário')
-    inventory_items = get_machines_from_inventory()
+    df = dataframe_inventario()
 
-    if inventory_items:
-        data = []
-        for item in inventory_items:
-            data.append({
-                'ID': item.id,
-                'Número de Patrimônio': item.numero_patrimonio,
-                'Tipo': item.tipo,
-                'Marca': item.marca,
-                'Modelo': item.modelo,
-                'Número de Série': item.numero_serie if item.numero_serie else '',
-                'Status': item.status,
-                'Localização': item.localizacao,
-                'Própria/Locada': item.propria_locada,
-                'Setor': item.setor
-            })
-        df = pd.DataFrame(data)
+    if not df.empty:
         st.dataframe(df)
 
         selected_patrimonio = st.selectbox('Selecione o Número de Patrimônio para ações:', df['Número de Patrimônio'])
         action = st.selectbox('Selecione uma ação:', ['Visualizar', 'Editar', 'Atualizar Status', 'Listar Chamados Técnicos', 'Excluir'])
 
+        # Ficha da máquina selecionada, carregada uma vez e usada pelas ações abaixo
+        ficha = None
+        if action in ('Visualizar', 'Editar', 'Listar Chamados Técnicos'):
+            ficha = obter_ficha_patrimonio(selected_patrimonio)
+            if ficha is None:
+                st.error("Máquina não encontrada no inventário.")
+                return
+
         if action == 'Visualizar':
-            st.write(df[df['Número de Patrimônio'] == selected_patrimonio])
-            show_maintenance_history(selected_patrimonio)
+            st.write(pd.DataFrame([ficha['maquina']]))
+            resumo = ficha['resumo']
+            col1, col2, col3 = st.columns(3)
+            col1.metric('Chamados', resumo['total_chamados'])
+            col2.metric('Em aberto', resumo['chamados_em_aberto'])
+            col3.metric('Peças usadas', resumo['pecas_usadas'])
+            show_maintenance_history(selected_patrimonio, ficha)
 
         elif action == 'Editar':
-            item = df[df['Número de Patrimônio'] == selected_patrimonio].iloc[0]
+            item = ficha['maquina']
             with st.form('edit_form'):
                 tipo = st.selectbox('Tipo de Equipamento', ['Computador', 'Impressora', 'Monitor', 'Outro'], index=['Computador', 'Impressora', 'Monitor', 'Outro'].index(item['Tipo']))
                 marca = st.text_input('Marca', value=item['Marca'])
@@ -195,27 +291,9 @@ def show_inventory_list():
                 update_inventory_status(selected_patrimonio, new_status)
 
         elif action == 'Listar Chamados Técnicos':
-            chamados = list_chamados_por_patrimonio(selected_patrimonio)
-            if chamados:
-                data_chamados = []
-                for chamado in chamados:
-                    data_chamados.append({
-                        'ID': chamado.id,
-                        'Usuário': chamado.username,
-                        'UBS': chamado.ubs,
-                        'Setor': chamado.setor,
-                        'Tipo de Defeito': chamado.tipo_defeito,
-                        'Problema': chamado.problema,
-                        'Hora Abertura': chamado.hora_abertura,
-                        'Solução': chamado.solucao,
-                        'Hora Fechamento': chamado.hora_fechamento,
-                        'Protocolo': chamado.protocolo,
-                        'Máquina': chamado.machine,
-                        'Patrimônio': chamado.patrimonio
-                    })
-                df_chamados = pd.DataFrame(data_chamados)
+            if not ficha['chamados'].empty:
                 st.subheader(f'Chamados Técnicos para o Patrimônio {selected_patrimonio}')
-                st.dataframe(df_chamados)
+                st.dataframe(ficha['chamados'])
             else:
                 st.info(f'Nenhum chamado técnico encontrado para o patrimônio {selected_patrimonio}.')
 
@@ -225,18 +303,57 @@ def show_inventory_list():
     else:
         st.write("Nenhum item encontrado no inventário.")
 
+# Função para mostrar o formulário de importação do inventário a partir de planilha (CSV ou XLSX)
+def show_inventory_import():
+    st.subheader('Importar Inventário')
+    st.caption(
+        f"Colunas obrigatórias: {', '.join(COLUNAS_OBRIGATORIAS)}. "
+        f"Opcionais: {', '.join(COLUNAS_OPCIONAIS)}. UBSs e setores devem estar cadastrados."
+    )
+
+    arquivo = st.file_uploader('Planilha do inventário', type=['csv', 'xlsx'])
+    apenas_validar = st.checkbox('Apenas validar (não gravar)', value=False)
+    if arquivo is None or not st.button('Importar'):
+        return
+
+    try:
+        with st.spinner('Importando planilha...'):
+            resultado = importar_inventario(arquivo, arquivo.name, apenas_validar=apenas_validar)
+    except ErroImportacao as e:
+        st.error(str(e))
+        logging.warning(f"Planilha de inventário rejeitada ({arquivo.name}): {e}")
+        return
+    except Exception as e:
+        logging.error(f"Erro ao importar inventário ({arquivo.name}): {e}")
+        st.error("Erro interno ao importar inventário. Nenhum item foi gravado.")
+        return
+
+    if apenas_validar:
+        st.info(f"{resultado['validos']} de {resultado['total_linhas']} linhas prontas para importar.")
+    else:
+        st.success(f"{resultado['inseridos']} de {resultado['total_linhas']} itens importados para o inventário.")
+    if resultado['erros']:
+        st.warning(f"{len(resultado['erros'])} linhas com erro não foram importadas.")
+        st.dataframe(pd.DataFrame(resultado['erros'][:100]))
+        st.download_button(
+            label="Download Relatório de Erros",
+            data=relatorio_erros_csv(resultado['erros']),
+            file_name="erros_importacao_inventario.csv",
+            mime="text/csv"
+        )
+
 # Função para adicionar manutenção no histórico
 def add_maintenance_history(patrimonio, descricao):
     if not descricao:
         st.error("Por favor, insira a descrição da manutenção.")
         logging.warning(f"Tentativa de adicionar manutenção sem descrição para patrimônio {patrimonio}.")
         return
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         historico = HistoricoManutencao(
             numero_patrimonio=patrimonio,
             descricao=descricao,
-            data_manutencao=datetime.now().strftime('%d/%m/%Y %H:%M:%S')
+            data_manutencao=datetime.now(tz=local_tz)
         )
         session.add(historico)
         session.commit()
@@ -249,43 +366,24 @@ def add_maintenance_history(patrimonio, descricao):
         session.close()
 
 # Função para mostrar o histórico de manutenção de uma máquina junto com peças usadas
-def show_maintenance_history(patrimonio):
-    session: Session = SessionLocal()
-    try:
-        historicos = session.query(HistoricoManutencao).filter(HistoricoManutencao.numero_patrimonio == patrimonio).all()
-        pecas = session.query(PecaUsada).join(Chamado).filter(Chamado.patrimonio == patrimonio).all()
-
-        if historicos:
-            data_history = []
-            for h in historicos:
-                data_history.append({
-                    'Descrição': h.descricao,
-                    'Data': h.data_manutencao
-                })
-            df_history = pd.DataFrame(data_history)
-            data_pecas = []
-            for p in pecas:
-                data_pecas.append({
-                    'Peça': p.peca_nome,
-                    'Data de Uso': p.data_uso
-                })
-            df_pecas = pd.DataFrame(data_pecas)
-            st.write(df_history)
-            st.write("Peças Usadas:")
-            st.write(df_pecas)
-            logging.info(f"Histórico de manutenção e peças exibido para patrimônio {patrimonio}.")
-        else:
-            st.write("Nenhum histórico de manutenção encontrado para este item.")
-            logging.info(f"Nenhum histórico de manutenção encontrado para patrimônio {patrimonio}.")
-    except Exception as e:
-        logging.error(f"Erro ao recuperar histórico de manutenção para patrimônio {patrimonio}: {e}")
-        st.error("Erro interno ao recuperar histórico de manutenção. Tente novamente mais tarde.")
-    finally:
-        session.close()
+# ('ficha' é o resultado de obter_ficha_patrimonio, quando já carregado)
+def show_maintenance_history(patrimonio, ficha=None):
+    ficha = ficha or obter_ficha_patrimonio(patrimonio)
+    if ficha is None:
+        return
+
+    if not ficha['historico'].empty:
+        st.write(ficha['historico'])
+        st.write("Peças Usadas:")
+        st.write(ficha['pecas'])
+        logging.info(f"Histórico de manutenção e peças exibido para patrimônio {patrimonio}.")
+    else:
+        st.write("Nenhum histórico de manutenção encontrado para este item.")
+        logging.info(f"Nenhum histórico de manutenção encontrado para patrimônio {patrimonio}.")
 
 # Função para atualizar o status de um item no inventário
 def update_inventory_status(patrimonio, new_status):
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         maquina = session.query(Inventario).filter(Inventario.numero_patrimonio == patrimonio).first()
         if maquina:
@@ -305,7 +403,7 @@ def update_inventory_status(patrimonio, new_status):
 
 # Função para editar um item no inventário
 def edit_inventory_item(patrimonio, new_values):
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         maquina = session.query(Inventario).filter(Inventario.numero_patrimonio == patrimonio).first()
         if maquina:
@@ -331,7 +429,7 @@ def edit_inventory_item(patrimonio, new_values):
 
 # Função para remover um item do inventário
 def delete_inventory_item(patrimonio):
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         maquina = session.query(Inventario).filter(Inventario.numero_patrimonio == patrimonio).first()
         if maquina:
@@ -351,6 +449,8 @@ def delete_inventory_item(patrimonio):
 
 # Função para criar um relatório de inventário em PDF
 def create_inventory_report(inventory_items, logo_path):
+    from fpdf import FPDF
+
     if not inventory_items:
         st.error("Nenhum dado no inventário.")
         logging.warning("Tentativa de gerar relatório de inventário sem dados.")
@@ -414,3 +514,35 @@ def create_inventory_report(inventory_items, logo_path):
         logging.error(f"Erro ao gerar relatório de inventário: {e}")
         st.error("Erro interno ao gerar relatório. Tente novamente mais tarde.")
         return None
+
+# Função para obter a "versão" dos dados do inventário: muda a cada inclusão, edição ou remoção
+def versao_dados_inventario():
+    with get_session() as session:
+        total, ultimo_id, ultima_atualizacao = session.query(
+            func.count(Inventario.id),
+            func.max(Inventario.id),
+            func.max(Inventario.atualizado_em),
+        ).one()
+    return [total, ultimo_id, str(ultima_atualizacao)]
+
+# Função para obter o PDF do relatório de inventário (bytes) do cache de relatórios,
+# consultando os itens e gerando o PDF só quando o inventário mudou
+def gerar_relatorio_inventario_em_cache(logo_path):
+    try:
+        versao = versao_dados_inventario()
+    except Exception as e:
+        logging.error(f"Erro ao obter versão dos dados do inventário: {e}")
+        st.error("Erro interno ao recuperar inventário. Tente novamente mais tarde.")
+        return None
+    if not versao[0]:
+        st.error("Nenhum dado no inventário.")
+        return None
+
+    parametros = {
+        'logo': logo_path,
+        'logo_mtime': os.path.getmtime(logo_path) if logo_path and os.path.exists(logo_path) else None,
+    }
+    return get_cache_relatorios().obter_ou_gerar(
+        'relatorio_inventario', parametros, versao,
+        lambda: create_inventory_report(get_machines_from_inventory(), logo_path)
+    )
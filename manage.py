@@ -0,0 +1,293 @@
+# manage.py
+# Comandos administrativos executados fora do Streamlit.
+# Uso: python manage.py <comando> [opções]
+import argparse
+import logging
+import os
+import subprocess
+import sys
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+    handlers=[
+        logging.StreamHandler(sys.stdout),
+    ]
+)
+
+# Comando: calcular o tempo decorrido dos chamados finalizados antigos
+def cmd_backfill_tempo(args):
+    from migracoes import aplicar_migracoes
+    from chamados import backfill_tempo_decorrido
+
+    aplicar_migracoes()
+    total = backfill_tempo_decorrido(tamanho_lote=args.lote)
+    logging.info(f"Backfill concluído: {total} chamados atualizados.")
+
+# Comando: recalcular do zero o resumo mensal dos chamados
+def cmd_rebuild_resumo(args):
+    from migracoes import aplicar_migracoes
+    from chamados import reconstruir_resumo_mensal
+
+    aplicar_migracoes()
+    grupos = reconstruir_resumo_mensal()
+    logging.info(f"Resumo mensal reconstruído com {grupos} grupos.")
+
+# Comando: aplicar as migrações pendentes do banco de dados
+def cmd_migrate(args):
+    from migracoes import aplicar_migracoes, versao_atual
+
+    aplicadas = aplicar_migracoes()
+    logging.info(f"Banco de dados na versão {versao_atual()} ({aplicadas} migrações aplicadas).")
+
+# Comando: importar o inventário de uma planilha CSV ou XLSX
+def cmd_importar_inventario(args):
+    from migracoes import aplicar_migracoes
+    from importacao_inventario import importar_inventario, relatorio_erros_csv, ErroImportacao
+
+    aplicar_migracoes()
+    try:
+        with open(args.arquivo, 'rb') as arquivo:
+            resultado = importar_inventario(arquivo, args.arquivo, tamanho_lote=args.lote, apenas_validar=args.validar)
+    except ErroImportacao as e:
+        logging.error(str(e))
+        sys.exit(1)
+    acao = 'válidos' if args.validar else 'importados'
+    logging.info(f"{resultado['validos'] if args.validar else resultado['inseridos']} de {resultado['total_linhas']} itens {acao}.")
+    if resultado['erros']:
+        logging.warning(f"{len(resultado['erros'])} linhas com erro.")
+        if args.erros:
+            with open(args.erros, 'wb') as saida:
+                saida.write(relatorio_erros_csv(resultado['erros']))
+            logging.info(f"Relatório de erros gravado em {args.erros}.")
+        else:
+            for erro in resultado['erros'][:20]:
+                logging.warning(f"Linha {erro['linha']} ({erro['numero_patrimonio']}): {erro['erro']}")
+
+# Comando: exportar uma tabela completa para CSV ou Parquet, em lotes
+def cmd_exportar(args):
+    import resource
+    from exportacao import exportar_tabela, ErroExportacao
+
+    destino = args.saida or f"{args.tabela}.{args.formato}"
+    try:
+        with open(destino, 'wb') as arquivo:
+            total = exportar_tabela(args.tabela, args.formato, arquivo, tamanho_lote=args.lote)
+    except ErroExportacao as e:
+        logging.error(str(e))
+        sys.exit(1)
+    pico_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    logging.info(f"{total} linhas exportadas para {destino} (pico de memória do processo: {pico_mb:.0f} MB).")
+
+# Comando: comparar as consultas principais com e sem os índices de consulta, em um banco sintético
+def cmd_bench_indices(args):
+    from benchmark import benchmark_indices
+
+    resultados = benchmark_indices(args.url, chamados=args.chamados, repeticoes=args.repeticoes)
+    for nome, medicoes in resultados.items():
+        sem, com = medicoes['sem_indices'], medicoes['com_indices']
+        print(f"\n== {nome}: {sem['ms']:.2f} ms sem índices -> {com['ms']:.2f} ms com índices "
+              f"({sem['ms'] / max(com['ms'], 1e-6):.1f}x)")
+        if args.planos:
+            print("   Plano sem índices:")
+            for linha in sem['plano']:
+                print(f"     {linha}")
+            print("   Plano com índices:")
+            for linha in com['plano']:
+                print(f"     {linha}")
+
+# Comando: preencher o banco configurado com dados sintéticos (nunca em produção)
+def cmd_gerar_dados(args):
+    from migracoes import aplicar_migracoes
+    from database import engine, sync_protocolo_counter
+    from dados_sinteticos import gerar_dados_sinteticos
+    from chamados import reconstruir_resumo_mensal
+
+    if not args.confirmar:
+        logging.error(f"Os dados sintéticos serão gravados em {engine.url.render_as_string(hide_password=True)}. "
+                      "Use --confirmar para prosseguir (nunca em um banco de produção).")
+        sys.exit(1)
+    aplicar_migracoes()
+    quantidades = gerar_dados_sinteticos(
+        engine, chamados=args.chamados, inventario=args.inventario, ubs=args.ubs, setores=args.setores,
+        pecas=args.pecas, historico=args.historico, meses=args.meses, semente=args.semente
+    )
+    # Protocolos e resumo mensal alinhados com os chamados inseridos direto na tabela
+    sync_protocolo_counter()
+    grupos = reconstruir_resumo_mensal()
+    logging.info(f"Dados sintéticos gerados: {quantidades}. Resumo mensal reconstruído com {grupos} grupos.")
+
+# Comando: medir os caminhos críticos da aplicação e gravar os resultados em JSON
+def cmd_bench_suite(args):
+    import json
+    from benchmark import benchmark_suite, comparar_resultados, ErroBenchmark
+
+    try:
+        resultado = benchmark_suite(repeticoes=args.repeticoes, mes=args.mes, amostra_tempo=args.amostra)
+    except ErroBenchmark as e:
+        logging.error(str(e))
+        sys.exit(1)
+    with open(args.saida, 'w', encoding='utf-8') as arquivo:
+        json.dump(resultado, arquivo, ensure_ascii=False, indent=2)
+
+    print(f"\n{'medição':<36} {'mediana (ms)':>13} {'mín (ms)':>10} {'máx (ms)':>10}")
+    for nome, medicao in resultado['resultados'].items():
+        print(f"{nome:<36} {medicao['mediana_ms']:>13.1f} {medicao['min_ms']:>10.1f} {medicao['max_ms']:>10.1f}")
+    logging.info(f"Resultados gravados em {args.saida}.")
+
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            anterior = json.load(arquivo)
+        comparacao = comparar_resultados(anterior, resultado, tolerancia=args.tolerancia)
+        print(f"\nComparação com {args.comparar}:")
+        for nome, item in comparacao.items():
+            marca = '  REGRESSÃO' if item['regressao'] else ''
+            print(f"{nome:<36} {item['anterior_ms']:>10.1f} -> {item['atual_ms']:>10.1f} ms ({item['razao']:.2f}x){marca}")
+        if any(item['regressao'] for item in comparacao.values()):
+            sys.exit(2)
+
+# Módulos importados pelo OS700 na inicialização e bibliotecas pesadas que devem carregar sob demanda
+MODULOS_APLICACAO = [
+    'streamlit', 'streamlit_option_menu', 'pandas',
+    'database', 'autenticacao', 'chamados', 'inventario', 'ubs', 'setores', 'migracoes',
+]
+MODULOS_SOB_DEMANDA = ['matplotlib', 'seaborn', 'fpdf', 'plotly', 'st_aggrid', 'twilio', 'PIL']
+
+# Comando: medir o tempo de importação dos módulos da aplicação em um processo novo (python -X importtime)
+def cmd_tempo_importacao(args):
+    modulos = args.modulos or MODULOS_APLICACAO
+    codigo = (
+        "import sys, time\n"
+        "inicio = time.perf_counter()\n"
+        f"for nome in {modulos!r}:\n"
+        "    __import__(nome)\n"
+        "print(f'TOTAL {time.perf_counter() - inicio:.6f}')\n"
+        f"print('CARREGADOS ' + ','.join(m for m in {MODULOS_SOB_DEMANDA!r} if m in sys.modules))\n"
+    )
+    diretorio = os.path.dirname(os.path.abspath(__file__))
+    resultado = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', codigo],
+        capture_output=True, text=True, cwd=diretorio
+    )
+    if resultado.returncode != 0:
+        logging.error(f"Erro ao importar os módulos:\n{resultado.stderr[-2000:]}")
+        sys.exit(resultado.returncode)
+
+    # Linhas do -X importtime: "import time: self [us] | cumulative | imported package"
+    tempos = {}
+    for linha in resultado.stderr.splitlines():
+        if not linha.startswith('import time:') or 'imported package' in linha:
+            continue
+        _, cumulativo, pacote = linha[len('import time:'):].split('|')
+        nome = pacote.strip()
+        tempos[nome] = max(tempos.get(nome, 0), int(cumulativo))
+
+    saida = dict(linha.split(' ', 1) for linha in resultado.stdout.splitlines() if linha.startswith(('TOTAL', 'CARREGADOS')))
+    print(f"Tempo total de importação: {float(saida['TOTAL']) * 1000:.1f} ms")
+    print(f"Bibliotecas pesadas carregadas na importação: {saida.get('CARREGADOS', '').strip() or 'nenhuma'}")
+    print("\nMódulos mais lentos (tempo acumulado):")
+    for nome, cumulativo in sorted(tempos.items(), key=lambda item: item[1], reverse=True)[:args.top]:
+        print(f"{cumulativo / 1000:10.1f} ms  {nome}")
+
+# Comando: medir a vazão de verificação de senhas (logins/s) com logins simultâneos,
+# para cada combinação de custo do bcrypt e quantidade de workers do pool
+def cmd_bench_bcrypt(args):
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+    import bcrypt
+    from senhas import PoolSenhas
+
+    senha = 'senha-de-teste'
+    print(f"{'custo':>5} {'workers':>7} {'logins':>7} {'tempo (s)':>10} {'logins/s':>9} {'ms/login':>9}")
+    for custo in args.custos:
+        hash_senha = bcrypt.hashpw(senha.encode('utf-8'), bcrypt.gensalt(rounds=custo)).decode('utf-8')
+        for workers in args.workers:
+            pool = PoolSenhas(custo=custo, workers=workers, fila_maxima=args.logins)
+            try:
+                # Um cliente por login, como várias sessões do Streamlit autenticando ao mesmo tempo
+                with ThreadPoolExecutor(max_workers=args.logins) as clientes:
+                    inicio = time.perf_counter()
+                    resultados = list(clientes.map(lambda _: pool.verificar(senha, hash_senha), range(args.logins)))
+                    decorrido = time.perf_counter() - inicio
+            finally:
+                pool.encerrar()
+            if not all(resultados):
+                logging.error("Verificação de senha falhou durante o benchmark.")
+                sys.exit(1)
+            print(f"{custo:>5} {workers:>7} {args.logins:>7} {decorrido:>10.2f} "
+                  f"{args.logins / decorrido:>9.1f} {decorrido * 1000 / args.logins:>9.1f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Comandos administrativos do sistema de chamados.")
+    subparsers = parser.add_subparsers(dest='comando', required=True)
+
+    backfill = subparsers.add_parser('backfill-tempo', help="Grava o tempo decorrido dos chamados já finalizados.")
+    backfill.add_argument('--lote', type=int, default=1000, help="Quantidade de chamados por lote (padrão: 1000).")
+    backfill.set_defaults(func=cmd_backfill_tempo)
+
+    rebuild = subparsers.add_parser('rebuild-resumo', help="Recalcula do zero o resumo mensal dos chamados.")
+    rebuild.set_defaults(func=cmd_rebuild_resumo)
+
+    migrate = subparsers.add_parser('migrate', help="Aplica as migrações pendentes do banco de dados.")
+    migrate.set_defaults(func=cmd_migrate)
+
+    importar = subparsers.add_parser('importar-inventario', help="Importa o inventário de uma planilha CSV ou XLSX.")
+    importar.add_argument('arquivo', help="Caminho da planilha (.csv ou .xlsx).")
+    importar.add_argument('--lote', type=int, default=1000, help="Quantidade de linhas por lote (padrão: 1000).")
+    importar.add_argument('--validar', action='store_true', help="Apenas valida a planilha, sem gravar.")
+    importar.add_argument('--erros', help="Arquivo CSV para gravar o relatório de erros.")
+    importar.set_defaults(func=cmd_importar_inventario)
+
+    exportar = subparsers.add_parser('exportar', help="Exporta uma tabela completa para CSV ou Parquet.")
+    exportar.add_argument('tabela', choices=['chamados', 'inventario', 'pecas_usadas', 'historico_manutencao'])
+    exportar.add_argument('--formato', choices=['csv', 'parquet'], default='csv', help="Formato do arquivo (padrão: csv).")
+    exportar.add_argument('--saida', help="Arquivo de saída (padrão: <tabela>.<formato>).")
+    exportar.add_argument('--lote', type=int, default=5000, help="Quantidade de linhas por lote (padrão: 5000).")
+    exportar.set_defaults(func=cmd_exportar)
+
+    indices = subparsers.add_parser('bench-indices', help="Compara as consultas principais com e sem os índices de consulta.")
+    indices.add_argument('--url', default='sqlite:///bench_indices.db',
+                         help="Banco usado no benchmark, preenchido com dados sintéticos se vazio (padrão: sqlite:///bench_indices.db). Nunca usar o banco de produção.")
+    indices.add_argument('--chamados', type=int, default=200_000, help="Chamados sintéticos gerados (padrão: 200000).")
+    indices.add_argument('--repeticoes', type=int, default=5, help="Execuções de cada consulta; usa a mediana (padrão: 5).")
+    indices.add_argument('--sem-planos', dest='planos', action='store_false', help="Não imprime os planos de execução.")
+    indices.set_defaults(func=cmd_bench_indices)
+
+    gerar = subparsers.add_parser('gerar-dados', help="Preenche o banco configurado com dados sintéticos para testes de desempenho.")
+    gerar.add_argument('--chamados', type=int, default=100_000, help="Chamados gerados (padrão: 100000).")
+    gerar.add_argument('--inventario', type=int, help="Máquinas no inventário (padrão: 1 para cada 20 chamados).")
+    gerar.add_argument('--ubs', type=int, default=30, help="UBSs (padrão: 30).")
+    gerar.add_argument('--setores', type=int, default=12, help="Setores (padrão: 12).")
+    gerar.add_argument('--pecas', type=int, help="Peças usadas, aproximadamente (padrão: metade dos chamados).")
+    gerar.add_argument('--historico', type=int, help="Registros de manutenção, aproximadamente (padrão: um terço dos chamados).")
+    gerar.add_argument('--meses', type=int, default=36, help="Meses de histórico até hoje (padrão: 36).")
+    gerar.add_argument('--semente', type=int, default=700, help="Semente dos dados aleatórios (padrão: 700).")
+    gerar.add_argument('--confirmar', action='store_true', help="Confirma a gravação no banco de DATABASE_URL.")
+    gerar.set_defaults(func=cmd_gerar_dados)
+
+    suite = subparsers.add_parser('bench-suite', help="Mede os caminhos críticos da aplicação e grava os resultados em JSON.")
+    suite.add_argument('--repeticoes', type=int, default=5, help="Execuções de cada medição; usa a mediana (padrão: 5).")
+    suite.add_argument('--mes', help="Mês dos relatórios, AAAA-MM (padrão: o último mês completo).")
+    suite.add_argument('--amostra', type=int, default=1000,
+                       help="Chamados usados no cálculo do tempo decorrido um a um (padrão: 1000).")
+    suite.add_argument('--saida', default='benchmark_resultados.json', help="Arquivo JSON de resultados (padrão: benchmark_resultados.json).")
+    suite.add_argument('--comparar', help="JSON de uma execução anterior; sai com código 2 se houver regressão.")
+    suite.add_argument('--tolerancia', type=float, default=0.2, help="Aumento aceito na mediana antes de apontar regressão (padrão: 0.2).")
+    suite.set_defaults(func=cmd_bench_suite)
+
+    tempo = subparsers.add_parser('tempo-importacao', help="Mede o tempo de importação dos módulos da aplicação (partida a frio).")
+    tempo.add_argument('--top', type=int, default=20, help="Quantidade de módulos mais lentos a listar (padrão: 20).")
+    tempo.add_argument('modulos', nargs='*', help="Módulos a importar (padrão: os módulos importados pelo OS700).")
+    tempo.set_defaults(func=cmd_tempo_importacao)
+
+    bench = subparsers.add_parser('bench-bcrypt', help="Mede a vazão de logins simultâneos por custo do bcrypt e workers.")
+    bench.add_argument('--custos', type=int, nargs='+', default=[10, 11, 12], help="Custos do bcrypt a medir (padrão: 10 11 12).")
+    bench.add_argument('--workers', type=int, nargs='+', default=[1, 2, 4], help="Quantidades de workers a medir (padrão: 1 2 4).")
+    bench.add_argument('--logins', type=int, default=16, help="Logins simultâneos por medição (padrão: 16).")
+    bench.set_defaults(func=cmd_bench_bcrypt)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,102 @@
+# migracoes.py
+# Inicialização do banco de dados: migrações de esquema versionadas (registradas na tabela
+# 'versao_esquema') e tarefas que rodam uma única vez por processo.
+import logging
+import threading
+from datetime import datetime
+from zoneinfo import ZoneInfo
+from sqlalchemy import func, text
+from database import (
+    engine, SessionLocal, VersaoEsquema, create_tables, create_indexes, initialize_ubs_setores, check_or_create_admin_user,
+)
+
+logger = logging.getLogger(__name__)
+
+# Definir o fuso horário local
+local_tz = ZoneInfo('America/Sao_Paulo')
+
+# Identificador do advisory lock do PostgreSQL que serializa migrações entre processos
+_LOCK_MIGRACOES = 700_001
+
+def _migracao_esquema_inicial():
+    # Também ajusta bancos anteriores às migrações (colunas novas e contador de protocolos)
+    create_tables()
+
+def _migracao_dados_iniciais():
+    from ubs import initialize_ubs
+    from setores import initialize_setores
+
+    initialize_ubs_setores()
+    initialize_ubs()
+    initialize_setores()
+
+def _migracao_resumo_mensal():
+    from chamados import garantir_resumo_mensal
+
+    garantir_resumo_mensal()
+
+def _migracao_busca_textual():
+    from busca_chamados import criar_indice_busca
+
+    criar_indice_busca()
+
+# Migrações em ordem de versão; cada uma roda uma única vez por banco. Novas alterações de
+# esquema entram no fim da lista, com a próxima versão.
+MIGRACOES = [
+    (1, 'Esquema inicial', _migracao_esquema_inicial),
+    (2, 'UBSs e setores iniciais', _migracao_dados_iniciais),
+    (3, 'Resumo mensal dos chamados', _migracao_resumo_mensal),
+    (4, 'Busca textual dos chamados', _migracao_busca_textual),
+    (5, 'Índices de consulta dos chamados e do histórico', create_indexes),
+]
+
+# Função para obter a versão atual do esquema (0 para banco novo)
+def versao_atual():
+    VersaoEsquema.__table__.create(bind=engine, checkfirst=True)
+    with SessionLocal() as session:
+        return session.query(func.max(VersaoEsquema.versao)).scalar() or 0
+
+# Função para aplicar as migrações pendentes, em ordem; retorna a quantidade aplicada
+def aplicar_migracoes():
+    ultima_versao = MIGRACOES[-1][0]
+    if versao_atual() >= ultima_versao:
+        return 0
+
+    with engine.connect() as conexao_lock:
+        if engine.dialect.name == 'postgresql':
+            conexao_lock.execute(text("SELECT pg_advisory_lock(:id)"), {'id': _LOCK_MIGRACOES})
+        try:
+            # Outro processo pode ter aplicado as migrações enquanto este esperava o lock
+            versao = versao_atual()
+            aplicadas = 0
+            for numero, descricao, migracao in MIGRACOES:
+                if numero <= versao:
+                    continue
+                logger.info(f"Aplicando migração {numero}: {descricao}")
+                migracao()
+                with SessionLocal() as session:
+                    session.add(VersaoEsquema(versao=numero, descricao=descricao, aplicada_em=datetime.now(tz=local_tz)))
+                    session.commit()
+                aplicadas += 1
+            logger.info(f"Esquema do banco de dados na versão {ultima_versao} ({aplicadas} migrações aplicadas).")
+            return aplicadas
+        finally:
+            if engine.dialect.name == 'postgresql':
+                conexao_lock.execute(text("SELECT pg_advisory_unlock(:id)"), {'id': _LOCK_MIGRACOES})
+                conexao_lock.commit()
+
+# Inicialização completa, uma vez por processo: migrações pendentes e conferência do usuário admin
+# (que depende das variáveis de ambiente, por isso não é uma migração)
+_inicializado = False
+_inicializacao_lock = threading.Lock()
+
+def inicializar_banco():
+    global _inicializado
+    with _inicializacao_lock:
+        if _inicializado:
+            return False
+        aplicar_migracoes()
+        check_or_create_admin_user()
+        _inicializado = True
+        logging.info("Banco de dados inicializado com sucesso.")
+        return True
@@ -0,0 +1,242 @@
+# notificacoes.py
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from sqlalchemy import and_
+from database import SessionLocal, NotificacaoOutbox
+
+logger = logging.getLogger(__name__)
+
+# Definir o fuso horário local
+local_tz = ZoneInfo('America/Sao_Paulo')
+
+# Configurações do despachante usando variáveis de ambiente
+NOTIFICACAO_WORKERS = int(os.getenv('NOTIFICACAO_WORKERS', '4'))
+NOTIFICACAO_MAX_TENTATIVAS = int(os.getenv('NOTIFICACAO_MAX_TENTATIVAS', '5'))
+NOTIFICACAO_BACKOFF_SEGUNDOS = float(os.getenv('NOTIFICACAO_BACKOFF_SEGUNDOS', '5'))
+NOTIFICACAO_INTERVALO_SEGUNDOS = float(os.getenv('NOTIFICACAO_INTERVALO_SEGUNDOS', '10'))
+NOTIFICACAO_LOTE = int(os.getenv('NOTIFICACAO_LOTE', '50'))
+
+# Tempo que uma notificação fica reservada por um despachante antes de poder ser retomada por outro
+TEMPO_RESERVA = timedelta(minutes=5)
+
+# Notificador que envia mensagens de WhatsApp pelo Twilio
+class NotificadorTwilio:
+    def __init__(self, account_sid, auth_token, remetente):
+        from twilio.rest import Client
+        self.client = Client(account_sid, auth_token)
+        self.remetente = remetente
+
+    def enviar(self, destinatario, mensagem):
+        message = self.client.messages.create(from_=self.remetente, body=mensagem, to=destinatario)
+        return message.sid
+
+# Notificador em memória, para testes e desenvolvimento local (não envia nada para fora)
+class NotificadorLocal:
+    def __init__(self, falhas_iniciais=0):
+        self.enviadas = []
+        self.falhas_restantes = falhas_iniciais
+        self._lock = threading.Lock()
+
+    def enviar(self, destinatario, mensagem):
+        with self._lock:
+            if self.falhas_restantes > 0:
+                self.falhas_restantes -= 1
+                raise RuntimeError("Falha simulada no envio.")
+            self.enviadas.append((destinatario, mensagem))
+            return f"local-{len(self.enviadas)}"
+
+# Função para obter os números de destino configurados
+def get_destinatarios():
+    return [numero.strip() for numero in os.getenv('TWILIO_TO_NUMBERS', '').split(',') if numero.strip()]
+
+# Função para criar o notificador a partir das variáveis de ambiente
+def criar_notificador_padrao():
+    account_sid = os.getenv('TWILIO_ACCOUNT_SID')
+    auth_token = os.getenv('TWILIO_AUTH_TOKEN')
+    twilio_from = os.getenv('TWILIO_FROM')
+    if account_sid and auth_token and twilio_from:
+        return NotificadorTwilio(account_sid, auth_token, twilio_from)
+    logger.warning("Credenciais do Twilio não configuradas. Mensagens não serão enviadas.")
+    return None
+
+# Função para gravar as notificações de um chamado na outbox, dentro da transação de quem chama
+def enfileirar_notificacoes(session, chamado_id, mensagem, destinatarios=None):
+    destinatarios = get_destinatarios() if destinatarios is None else destinatarios
+    agora = datetime.now(tz=local_tz)
+    for numero in destinatarios:
+        session.add(NotificacaoOutbox(
+            chamado_id=chamado_id,
+            destinatario=numero,
+            mensagem=mensagem,
+            status='pendente',
+            tentativas=0,
+            proxima_tentativa=agora,
+            criado_em=agora
+        ))
+    if not destinatarios:
+        logger.warning("Números de destino não fornecidos. Nenhuma notificação enfileirada.")
+    return len(destinatarios)
+
+# Despachante em segundo plano: reserva notificações pendentes e as envia em um pool de workers,
+# com novas tentativas e backoff exponencial em caso de falha
+class DespachanteNotificacoes:
+    def __init__(self, notificador, workers=NOTIFICACAO_WORKERS, max_tentativas=NOTIFICACAO_MAX_TENTATIVAS,
+                 backoff_segundos=NOTIFICACAO_BACKOFF_SEGUNDOS, intervalo_segundos=NOTIFICACAO_INTERVALO_SEGUNDOS,
+                 lote=NOTIFICACAO_LOTE):
+        self.notificador = notificador
+        self.max_tentativas = max_tentativas
+        self.backoff_segundos = backoff_segundos
+        self.intervalo_segundos = intervalo_segundos
+        self.lote = lote
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='notificacao')
+        self._acordar = threading.Event()
+        self._parar = threading.Event()
+        self._thread = None
+
+    def iniciar(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._parar.clear()
+            self._thread = threading.Thread(target=self._loop, name='despachante-notificacoes', daemon=True)
+            self._thread.start()
+            logger.info("Despachante de notificações iniciado.")
+
+    def parar(self, aguardar=True):
+        self._parar.set()
+        self._acordar.set()
+        if self._thread is not None and aguardar:
+            self._thread.join()
+        self._pool.shutdown(wait=aguardar)
+        logger.info("Despachante de notificações parado.")
+
+    def acordar(self):
+        self._acordar.set()
+
+    def _loop(self):
+        while not self._parar.is_set():
+            try:
+                self.processar_pendentes()
+            except Exception as e:
+                logger.error(f"Erro no despachante de notificações: {e}")
+            self._acordar.wait(self.intervalo_segundos)
+            self._acordar.clear()
+
+    # Reserva e envia um lote de notificações vencidas; com aguardar=True, espera os envios terminarem
+    def processar_pendentes(self, aguardar=False):
+        reservadas = self._reservar()
+        futuros = [self._pool.submit(self._enviar, notificacao) for notificacao in reservadas]
+        if aguardar:
+            for futuro in futuros:
+                futuro.result()
+        return len(reservadas)
+
+    def _reservar(self):
+        agora = datetime.now(tz=local_tz)
+        vencidas = and_(
+            NotificacaoOutbox.status.in_(['pendente', 'enviando']),
+            NotificacaoOutbox.proxima_tentativa <= agora
+        )
+        reservadas = []
+        with SessionLocal() as session:
+            try:
+                candidatas = (
+                    session.query(NotificacaoOutbox.id, NotificacaoOutbox.destinatario, NotificacaoOutbox.mensagem)
+                    .filter(vencidas)
+                    .order_by(NotificacaoOutbox.id)
+                    .limit(self.lote)
+                    .all()
+                )
+                for id_notificacao, destinatario, mensagem in candidatas:
+                    # UPDATE condicional: só um despachante consegue reservar cada notificação
+                    reservou = (
+                        session.query(NotificacaoOutbox)
+                        .filter(NotificacaoOutbox.id == id_notificacao, vencidas)
+                        .update(
+                            {'status': 'enviando', 'proxima_tentativa': agora + TEMPO_RESERVA},
+                            synchronize_session=False
+                        )
+                    )
+                    if reservou:
+                        reservadas.append((id_notificacao, destinatario, mensagem))
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Erro ao reservar notificações pendentes: {e}")
+                return []
+        return reservadas
+
+    def _enviar(self, notificacao):
+        id_notificacao, destinatario, mensagem = notificacao
+        sid = None
+        erro = None
+        try:
+            sid = self.notificador.enviar(destinatario, mensagem)
+        except Exception as e:
+            erro = str(e)
+
+        agora = datetime.now(tz=local_tz)
+        with SessionLocal() as session:
+            try:
+                registro = session.query(NotificacaoOutbox).filter(NotificacaoOutbox.id == id_notificacao).first()
+                if registro is None:
+                    return
+                registro.tentativas += 1
+                if erro is None:
+                    registro.status = 'enviada'
+                    registro.sid = sid
+                    registro.enviado_em = agora
+                    registro.ultimo_erro = None
+                    logger.info(f"Mensagem enviada para {destinatario} via WhatsApp. SID: {sid}")
+                elif registro.tentativas >= self.max_tentativas:
+                    registro.status = 'falha'
+                    registro.ultimo_erro = erro[:500]
+                    logger.error(f"Erro ao enviar mensagem para {destinatario} via WhatsApp, desistindo após {registro.tentativas} tentativas: {erro}")
+                else:
+                    espera = self.backoff_segundos * 2 ** (registro.tentativas - 1)
+                    registro.status = 'pendente'
+                    registro.proxima_tentativa = agora + timedelta(seconds=espera)
+                    registro.ultimo_erro = erro[:500]
+                    logger.warning(f"Erro ao enviar mensagem para {destinatario} via WhatsApp (tentativa {registro.tentativas}), nova tentativa em {espera:.0f}s: {erro}")
+                session.commit()
+            except Exception as e:
+                session.rollback()
+                logger.error(f"Erro ao atualizar status da notificação {id_notificacao}: {e}")
+
+# Despachante compartilhado pelo processo
+_despachante = None
+_despachante_desativado = False
+_despachante_lock = threading.Lock()
+
+# Função para substituir o notificador do processo (ex.: NotificadorLocal em testes)
+def configurar_despachante(notificador, **kwargs):
+    global _despachante, _despachante_desativado
+    with _despachante_lock:
+        _despachante_desativado = False
+        if _despachante is not None:
+            _despachante.parar(aguardar=False)
+        _despachante = DespachanteNotificacoes(notificador, **kwargs) if notificador else None
+        if _despachante is not None:
+            _despachante.iniciar()
+        return _despachante
+
+# Função para obter o despachante do processo, criando-o na primeira chamada
+def get_despachante():
+    global _despachante, _despachante_desativado
+    with _despachante_lock:
+        if _despachante is None and not _despachante_desativado:
+            notificador = criar_notificador_padrao()
+            if notificador is None:
+                _despachante_desativado = True
+                return None
+            _despachante = DespachanteNotificacoes(notificador)
+            _despachante.iniciar()
+        return _despachante
+
+# Função para avisar o despachante de que há novas notificações na outbox
+def notificar_despachante():
+    despachante = get_despachante()
+    if despachante is not None:
+        despachante.acordar()
@@ -0,0 +1,108 @@
+# referencias.py
+# Cache dos dados de referência (nomes de UBS e de setores), compartilhado por todas as sessões
+# do processo. Qualquer commit que inclua, altere ou remova registros das tabelas de origem
+# invalida o cache correspondente (eventos do SQLAlchemy); o TTL só cobre alterações feitas
+# por outros processos.
+import os
+import time
+import logging
+import threading
+from sqlalchemy import event, inspect, select, union
+from sqlalchemy.orm import Session
+from database import UBS, Setor, Chamado, Inventario
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+REFERENCIAS_TTL_SEGUNDOS = float(os.getenv('REFERENCIAS_TTL_SEGUNDOS', '300'))
+
+class CacheReferencia:
+    def __init__(self, nome, carregar, ttl=REFERENCIAS_TTL_SEGUNDOS):
+        self.nome = nome
+        self.carregar = carregar
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._valores = None
+        self._carregado_em = 0.0
+        self._geracao = 0
+
+    # Retorna uma cópia da lista; só consulta o banco na primeira chamada, após invalidação ou TTL
+    def obter(self, session):
+        with self._lock:
+            if self._valores is not None and time.monotonic() - self._carregado_em < self.ttl:
+                return list(self._valores)
+            geracao = self._geracao
+        valores = self.carregar(session)
+        with self._lock:
+            # Uma invalidação durante a carga torna o resultado obsoleto: devolve, mas não guarda
+            if geracao == self._geracao:
+                self._valores = valores
+                self._carregado_em = time.monotonic()
+        logger.info(f"Cache de referência '{self.nome}' carregado do banco de dados.")
+        return list(valores)
+
+    # Indica se o valor já está na lista em cache (False se o cache estiver vazio)
+    def contem(self, valor):
+        with self._lock:
+            return self._valores is not None and valor in self._valores
+
+    def invalidar(self):
+        with self._lock:
+            self._valores = None
+            self._geracao += 1
+        logger.info(f"Cache de referência '{self.nome}' invalidado.")
+
+def _carregar_ubs(session):
+    return [nome for (nome,) in session.query(UBS.nome_ubs).all()]
+
+def _carregar_setores(session):
+    return [nome for (nome,) in session.query(Setor.nome_setor).all()]
+
+# Setores em uso nos chamados e no inventário, em uma única consulta (UNION já elimina repetidos)
+def _carregar_setores_em_uso(session):
+    consulta = union(
+        select(Chamado.setor).where(Chamado.setor.isnot(None)),
+        select(Inventario.setor).where(Inventario.setor.isnot(None)),
+    )
+    return sorted(setor for (setor,) in session.execute(consulta))
+
+cache_ubs = CacheReferencia('ubs', _carregar_ubs)
+cache_setores = CacheReferencia('setores', _carregar_setores)
+cache_setores_em_uso = CacheReferencia('setores_em_uso', _carregar_setores_em_uso)
+
+# Caches afetados por alterações em cada modelo. Quando há um atributo, só mudanças nele contam
+# (ex.: abrir ou finalizar chamados num setor já conhecido não invalida os setores em uso).
+_CACHES_POR_MODELO = {
+    UBS: (None, cache_ubs),
+    Setor: (None, cache_setores),
+    Chamado: ('setor', cache_setores_em_uso),
+    Inventario: ('setor', cache_setores_em_uso),
+}
+
+def _afeta_cache(objeto, operacao, atributo, cache):
+    if atributo is None or operacao == 'removido':
+        return True
+    if operacao == 'novo':
+        return not cache.contem(getattr(objeto, atributo))
+    return inspect(objeto).attrs[atributo].history.has_changes()
+
+# Anota, a cada flush, quais caches a transação afeta; a invalidação só acontece no commit
+@event.listens_for(Session, 'after_flush')
+def _registrar_alteracoes(session, flush_context):
+    afetados = session.info.setdefault('caches_referencia_afetados', set())
+    alterados = [(objeto, 'novo') for objeto in session.new]
+    alterados += [(objeto, 'alterado') for objeto in session.dirty]
+    alterados += [(objeto, 'removido') for objeto in session.deleted]
+    for objeto, operacao in alterados:
+        atributo, cache = _CACHES_POR_MODELO.get(type(objeto), (None, None))
+        if cache is not None and cache not in afetados and _afeta_cache(objeto, operacao, atributo, cache):
+            afetados.add(cache)
+
+@event.listens_for(Session, 'after_commit')
+def _invalidar_apos_commit(session):
+    for cache in session.info.pop('caches_referencia_afetados', ()):
+        cache.invalidar()
+
+@event.listens_for(Session, 'after_rollback')
+def _descartar_apos_rollback(session):
+    session.info.pop('caches_referencia_afetados', None)
@@ -0,0 +1,91 @@
+# senhas.py
+# Hash e verificação de senhas (bcrypt) em um pool de threads limitado. O bcrypt libera o GIL,
+# então o pool usa vários núcleos sem bloquear a thread do script do Streamlit por mais tempo que o
+# necessário; a fila tem profundidade máxima para que um pico de logins não acumule trabalho sem fim.
+import os
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeoutError
+import bcrypt
+
+logger = logging.getLogger(__name__)
+
+# Configurações usando variáveis de ambiente
+BCRYPT_CUSTO = int(os.getenv('BCRYPT_CUSTO', '12'))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', str(min(4, os.cpu_count() or 1))))
+BCRYPT_FILA_MAXIMA = int(os.getenv('BCRYPT_FILA_MAXIMA', '32'))
+BCRYPT_TIMEOUT_SEGUNDOS = float(os.getenv('BCRYPT_TIMEOUT_SEGUNDOS', '30'))
+
+# Fila do pool de senhas cheia ou operação sem resposta no tempo limite; a operação deve ser
+# tentada novamente mais tarde
+class ServicoSenhasOcupado(Exception):
+    pass
+
+# Custo (log2 das rodadas) gravado em um hash bcrypt no formato $2b$12$...
+def custo_do_hash(hash_senha: str) -> int:
+    try:
+        return int(hash_senha.split('$')[2])
+    except (IndexError, ValueError):
+        return 0
+
+class PoolSenhas:
+    def __init__(self, custo=BCRYPT_CUSTO, workers=BCRYPT_WORKERS, fila_maxima=BCRYPT_FILA_MAXIMA,
+                 timeout=BCRYPT_TIMEOUT_SEGUNDOS):
+        self.custo = custo
+        self.timeout = timeout
+        self._pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+        # Vagas = tarefas em execução + tarefas aguardando na fila
+        self._vagas = threading.BoundedSemaphore(workers + fila_maxima)
+
+    def _executar(self, funcao, *args):
+        if not self._vagas.acquire(blocking=False):
+            logger.warning("Fila de verificação de senhas cheia.")
+            raise ServicoSenhasOcupado("Muitas operações de senha em andamento. Tente novamente em instantes.")
+        try:
+            futuro = self._pool.submit(funcao, *args)
+        except Exception:
+            self._vagas.release()
+            raise
+        futuro.add_done_callback(lambda _: self._vagas.release())
+        try:
+            return futuro.result(timeout=self.timeout)
+        except FuturoTimeoutError:
+            # Se ainda estiver na fila, a tarefa não chega a rodar e a vaga é liberada
+            futuro.cancel()
+            logger.warning(f"Operação de senha sem resposta em {self.timeout} s.")
+            raise ServicoSenhasOcupado("Muitas operações de senha em andamento. Tente novamente em instantes.")
+
+    def gerar_hash(self, senha: str) -> str:
+        salt = bcrypt.gensalt(rounds=self.custo)
+        return self._executar(bcrypt.hashpw, senha.encode('utf-8'), salt).decode('utf-8')
+
+    def verificar(self, senha: str, hash_senha: str) -> bool:
+        return self._executar(bcrypt.checkpw, senha.encode('utf-8'), hash_senha.encode('utf-8'))
+
+    # Indica se o hash foi gerado com um custo diferente do configurado
+    def precisa_rehash(self, hash_senha: str) -> bool:
+        return custo_do_hash(hash_senha) != self.custo
+
+    def encerrar(self, aguardar=True):
+        self._pool.shutdown(wait=aguardar)
+
+# Pool compartilhado pelo processo
+_pool = None
+_pool_lock = threading.Lock()
+
+def get_pool_senhas():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = PoolSenhas()
+        return _pool
+
+# Funções de conveniência usando o pool do processo
+def gerar_hash_senha(senha: str) -> str:
+    return get_pool_senhas().gerar_hash(senha)
+
+def verificar_senha(senha: str, hash_senha: str) -> bool:
+    return get_pool_senhas().verificar(senha, hash_senha)
+
+def precisa_rehash(hash_senha: str) -> bool:
+    return get_pool_senhas().precisa_rehash(hash_senha)
@@ -1,12 +1,13 @@
 # setores.py
 from sqlalchemy.orm import Session
-from database import SessionLocal, Setor
+from database import get_session, Setor
+from referencias import cache_setores
 import streamlit as st
 import logging
 
 # Função para adicionar um novo setor
 def add_setor(nome_setor: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         # Verifica se o setor já existe
         setor_existente = session.query(Setor).filter(Setor.nome_setor == nome_setor).first()
@@ -25,14 +26,13 @@ def add_setor(nome_setor: str) -> bool:
     finally:
         session.close()
 
-# Função para listar todos os setores cadastrados
+# Função para listar todos os setores cadastrados (cache compartilhado, invalidado a cada alteração; ver referencias.py)
 def get_setores_list() -> list:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
-        setores = session.query(Setor.nome_setor).all()
-        logging.info("Setores recuperados do banco de dados.")
-        return [setor[0] for setor in setores]
+        return cache_setores.obter(session)
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao recuperar setores: {e}")
         st.error("Erro interno ao recuperar setores. Tente novamente mais tarde.")
         return []
@@ -41,7 +41,7 @@ def get_setores_list() -> list:
 
 # Função para remover um setor
 def remove_setor(nome_setor: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         setor = session.query(Setor).filter(Setor.nome_setor == nome_setor).first()
         if setor:
@@ -61,7 +61,7 @@ def remove_setor(nome_setor: str) -> bool:
 
 # Função para atualizar o nome de um setor
 def update_setor(old_name: str, new_name: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         setor = session.query(Setor).filter(Setor.nome_setor == old_name).first()
         if setor:
@@ -1,13 +1,14 @@
 # ubs.py
 from sqlalchemy.orm import Session
-from database import SessionLocal, UBS
+from database import get_session, UBS
+from referencias import cache_ubs
 import streamlit as st
 import logging
 import sys
 
 # Função para adicionar uma nova UBS
 def add_ubs(nome_ubs: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         # Verifica se a UBS já existe
         ubs_existente = session.query(UBS).filter(UBS.nome_ubs == nome_ubs).first()
@@ -27,16 +28,13 @@ def add_ubs(nome_ubs: str) -> bool:
     finally:
         session.close()
 
-# Função para listar todas as UBSs cadastradas
-@st.cache_data(ttl=300)
+# Função para listar todas as UBSs cadastradas (cache compartilhado, invalidado a cada alteração; ver referencias.py)
 def get_ubs_list() -> list:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
-        ubs = session.query(UBS.nome_ubs).all()
-        ubs_list = [item[0] for item in ubs]
-        logging.info("UBSs recuperadas do banco de dados.")
-        return ubs_list
+        return cache_ubs.obter(session)
     except Exception as e:
+        session.rollback()
         logging.error(f"Erro ao recuperar UBSs: {e}")
         st.error("Erro interno ao recuperar UBSs. Tente novamente mais tarde.")
         return []
@@ -45,7 +43,7 @@ def get_ubs_list() -> list:
 
 # Função para remover uma UBS
 def remove_ubs(nome_ubs: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         ubs = session.query(UBS).filter(UBS.nome_ubs == nome_ubs).first()
         if ubs:
@@ -66,7 +64,7 @@ def remove_ubs(nome_ubs: str) -> bool:
 
 # Função para atualizar o nome de uma UBS
 def update_ubs(old_name: str, new_name: str) -> bool:
-    session: Session = SessionLocal()
+    session: Session = get_session()
     try:
         ubs = session.query(UBS).filter(UBS.nome_ubs == old_name).first()
         if ubs: